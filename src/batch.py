@@ -0,0 +1,301 @@
+# src/batch.py
+#
+# Modo batch / daemon: procesa todas las licitaciones pendientes en REPOSITORY
+# con varios procesos worker.
+#
+# Uso:
+#   py -m src.batch                      → drena las pendientes y termina
+#   py -m src.batch --workers 4 --daemon → queda escuchando nuevas licitaciones
+#   py -m src.batch --approve <ID>       → autoriza una licitación pausada por presupuesto
+#
+# Cada licitación se reclama de forma atómica en SQLite (tabla licitation_claims),
+# por lo que varios workers (en uno o varios hosts que compartan la base) nunca
+# toman la misma. Un claim sin heartbeat por más de CLAIM_TTL_SECONDS se
+# considera de un worker caído y puede volver a reclamarse.
+#
+# Las pendientes se toman de la más corta a la más larga según la estimación
+# de costo/tiempo (shortest job first); una licitación que espera más de
+# SJF_MAX_WAIT_SECONDS pasa adelante para que las largas no esperen para siempre.
+
+import argparse
+import hashlib
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from uuid import uuid4
+
+from src.config import (
+    REPOSITORY,
+    STORAGE,
+    BATCH_WORKERS,
+    BATCH_POLL_SECONDS,
+    CLAIM_TTL_SECONDS,
+    SJF_MAX_WAIT_SECONDS,
+)
+from src import config, database, logs, metrics
+
+log = logging.getLogger(__name__)
+
+def fingerprint(licitation_dir: str) -> str:
+    """
+    Huella barata (solo stat) del contenido de una licitación en repository.
+    Cambia si se agrega, elimina o modifica algún archivo.
+    """
+    h = hashlib.sha1()
+    for root, dirs, files in os.walk(licitation_dir):
+        dirs.sort()
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            h.update(f"{os.path.relpath(path, licitation_dir)}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _omitir(claim, huella: str, ahora: float) -> bool:
+    """
+    True si el claim impide reclamar la licitación:
+      - claimed con heartbeat vigente
+      - batch: encolada en la Batch API (py -m src.batch_api la libera)
+      - done / failed / paused con el mismo contenido
+      - deferred (presupuesto o archivos incompletos) hace menos de BATCH_POLL_SECONDS
+    """
+    status, huella_claim, heartbeat_at, finished_at = claim
+    if status == "claimed" and heartbeat_at >= ahora - CLAIM_TTL_SECONDS:
+        return True
+    if status == "batch":
+        return True
+    if status in ("done", "failed", "paused") and huella_claim == huella:
+        return True
+    if status == "deferred" and (finished_at or 0) >= ahora - BATCH_POLL_SECONDS:
+        return True
+    return False
+
+
+def _estimaciones(pendientes: list[tuple[str, str]]) -> dict[str, float]:
+    """
+    Segundos estimados de cada licitación pendiente. Solo se re-estiman las
+    que no tienen estimación o cuyo contenido cambió.
+    """
+    from src.graph.etl.nodes.cost_impl.estimator import Calibracion, estimar_carpeta
+
+    guardadas = database.get_licitation_estimates()
+    calibracion = None
+    segundos = {}
+    for licitation_id, huella in pendientes:
+        estimacion = guardadas.get(licitation_id)
+        if estimacion is None or estimacion["fingerprint"] != huella:
+            calibracion = calibracion or Calibracion()
+            estimacion = estimar_carpeta(os.path.join(REPOSITORY, licitation_id), calibracion)
+            database.save_licitation_estimate(licitation_id, huella, estimacion)
+        segundos[licitation_id] = estimacion["seconds"] or 0
+    return segundos
+
+
+def candidatas() -> list[tuple[str, str]]:
+    """
+    Licitaciones en repository que podrían estar pendientes: sin claim, con
+    claim expirado o terminadas con contenido distinto al procesado.
+    Primero las que esperan más de SJF_MAX_WAIT_SECONDS (de la más antigua a
+    la más nueva), luego el resto de la más corta a la más larga.
+    """
+    claims = database.get_claims()
+    ahora = time.time()
+
+    subdirs = {
+        d: os.path.getmtime(os.path.join(REPOSITORY, d))
+        for d in os.listdir(REPOSITORY)
+        if os.path.isdir(os.path.join(REPOSITORY, d))
+    }
+
+    resultado = []
+    for licitation_id in subdirs:
+        huella = fingerprint(os.path.join(REPOSITORY, licitation_id))
+        claim = claims.get(licitation_id)
+        if claim is not None and _omitir(claim, huella, ahora):
+            continue
+        resultado.append((licitation_id, huella))
+
+    try:
+        segundos = _estimaciones(resultado)
+    except Exception as e:
+        log.warning(f"⚠️ No se pudo estimar las licitaciones pendientes: {e}")
+        segundos = {}
+
+    def prioridad(candidata):
+        licitation_id = candidata[0]
+        llegada = subdirs[licitation_id]
+        if ahora - llegada > SJF_MAX_WAIT_SECONDS:
+            return (0, llegada)
+        return (1, segundos.get(licitation_id, 0), llegada)
+
+    resultado.sort(key=prioridad)
+    metrics.LICITATIONS_PENDING.set(len(resultado))
+    return resultado
+
+
+def reclamar(licitation_id: str, huella: str, worker_id: str) -> bool:
+    """Reclama la licitación de forma atómica. Retorna True si este worker quedó como dueño."""
+    return database.claim_licitation(
+        licitation_id, huella, worker_id, lambda claim, ahora: _omitir(claim, huella, ahora)
+    )
+
+
+class Heartbeat(threading.Thread):
+    """Renueva el claim periódicamente mientras el worker procesa la licitación."""
+
+    def __init__(self, licitation_id: str, worker_id: str):
+        super().__init__(daemon=True, name=f"heartbeat-{licitation_id}")
+        self.licitation_id = licitation_id
+        self.worker_id = worker_id
+        self._detener = threading.Event()
+
+    def run(self):
+        try:
+            while not self._detener.wait(max(CLAIM_TTL_SECONDS / 3, 1)):
+                if not database.heartbeat_licitation(self.licitation_id, self.worker_id):
+                    log.warning(f"⚠️ [{self.worker_id}] Claim perdido sobre {self.licitation_id}")
+                    return
+        finally:
+            database.close_connection()
+
+    def stop(self):
+        self._detener.set()
+        self.join()
+
+
+def procesar_licitacion(licitation_id: str) -> dict:
+    from src.graph.etl.graph import build_graph
+
+    state = {
+        "licitation_id": licitation_id,
+        "repository_path": REPOSITORY,
+        "storage_path": STORAGE,
+    }
+    return build_graph().invoke(state)
+
+
+def procesar_reclamada(licitation_id: str, worker_id: str) -> str:
+    """
+    Ejecuta el grafo ETL sobre una licitación ya reclamada por worker_id,
+    manteniendo el heartbeat, y la libera como done/failed (paused/deferred
+    si CostNode la detuvo por presupuesto; deferred también si quedaron
+    archivos incompletos, para reintentarlos después de BATCH_POLL_SECONDS).
+    Retorna el status con que se liberó el claim.
+    """
+    log.info(f"🔒 [{worker_id}] Licitación reclamada: {licitation_id}")
+    heartbeat = Heartbeat(licitation_id, worker_id)
+    heartbeat.start()
+    try:
+        state = procesar_licitacion(licitation_id)
+        if state.get("status") in ("failed", "error"):
+            database.release_licitation(licitation_id, worker_id, "failed", state.get("error"))
+            log.error(f"❌ [{worker_id}] Licitación con error: {licitation_id}")
+            return "failed"
+        if state.get("status") in ("paused", "deferred"):
+            database.release_licitation(licitation_id, worker_id, state["status"], state.get("pause_reason"))
+            log.info(f"⏸️ [{worker_id}] Licitación {state['status']}: {licitation_id}")
+            return state["status"]
+        if state.get("status") == "partial":
+            # Con el mismo contenido un claim done no se vuelve a tomar: las
+            # páginas fallidas se reintentan (desde sus checkpoints) más tarde
+            database.release_licitation(licitation_id, worker_id, "deferred", state.get("error"))
+            log.warning(f"⚠️ [{worker_id}] Licitación incompleta, se reintentará: {licitation_id} ({state.get('error')})")
+            return "deferred"
+        database.release_licitation(licitation_id, worker_id, "done")
+        log.info(f"✅ [{worker_id}] Licitación procesada: {licitation_id}")
+        return "done"
+    except Exception as e:
+        database.release_licitation(licitation_id, worker_id, "failed", str(e))
+        log.error(f"❌ [{worker_id}] Error procesando {licitation_id}: {e}")
+        return "failed"
+    finally:
+        heartbeat.stop()
+
+
+def procesar_reintentos_embeddings() -> None:
+    from src.graph.document.nodes.extractor_impl.embedding_retry import drenar_reintentos
+
+    try:
+        drenar_reintentos()
+    except Exception as e:
+        log.warning(f"⚠️ Error procesando reintentos de embeddings: {e}")
+
+
+def worker(n: int, daemon: bool, poll_seconds: int) -> None:
+    """
+    Loop de un proceso worker: reclama una licitación pendiente, ejecuta el
+    grafo ETL y la marca como done/failed. En modo batch termina cuando no
+    quedan licitaciones reclamables.
+    """
+    logs.configurar()
+    metrics.exportar(n)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+    log.info(f"👷 Worker {n} iniciado ({worker_id})")
+
+    try:
+        while True:
+            procesada = False
+            for licitation_id, huella in candidatas():
+                if not reclamar(licitation_id, huella, worker_id):
+                    continue
+
+                procesar_reclamada(licitation_id, worker_id)
+                procesada = True
+                break  # volver a listar: el estado de las demás pudo cambiar
+
+            if not procesada:
+                if not daemon:
+                    break
+                # Sin licitaciones pendientes: aprovechar para vaciar la cola de reintentos
+                procesar_reintentos_embeddings()
+                time.sleep(poll_seconds)
+    finally:
+        database.close_connection()
+        metrics.volcar()
+        log.info(f"👷 Worker {n} finalizado ({worker_id})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ETL de licitaciones en modo batch / daemon")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="procesos worker")
+    parser.add_argument("--daemon", action="store_true", help="no terminar al vaciar el repository")
+    parser.add_argument("--poll", type=int, default=BATCH_POLL_SECONDS, help="segundos entre revisiones (daemon)")
+    parser.add_argument("--approve", metavar="LICITATION_ID", help="autoriza una licitación pausada por presupuesto")
+    args = parser.parse_args()
+    logs.configurar()
+
+    # Crea / migra el esquema antes de lanzar los workers
+    database.get_connection()
+
+    if args.approve:
+        database.approve_licitation(args.approve)
+        log.info(f"✅ Licitación {args.approve} aprobada; se procesará en la próxima revisión")
+        return
+
+    # Falla antes de lanzar los workers si falta configuración obligatoria
+    config.requerido("REPOSITORY", "STORAGE", "API_KEY")
+
+    if args.workers <= 1:
+        worker(0, args.daemon, args.poll)
+        return
+
+    # Procesos no-daemon: cada worker puede crear su propio pool de render
+    ctx = multiprocessing.get_context("spawn")
+    procesos = [
+        ctx.Process(target=worker, args=(n, args.daemon, args.poll), name=f"etl-worker-{n}")
+        for n in range(args.workers)
+    ]
+    for p in procesos:
+        p.start()
+    for p in procesos:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
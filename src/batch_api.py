@@ -0,0 +1,131 @@
+# src/batch_api.py
+#
+# Modo Batch API de OpenAI para licitaciones no urgentes: visión y embeddings
+# a ~50% del costo, con resultados dentro de BATCH_API_COMPLETION_WINDOW.
+#
+# Uso:
+#   py -m src.batch_api --submit <ID> [<ID> ...] → encola esas licitaciones
+#   py -m src.batch_api --submit-pending         → encola todas las pendientes del repository
+#   py -m src.batch_api                          → revisa los batches y fusiona los terminados
+#   py -m src.batch_api --daemon [--poll 300]    → revisa periódicamente
+#   py -m src.batch_api --status                 → licitaciones y batches en curso
+#
+# Una licitación encolada queda con claim 'batch' (los workers de src.batch
+# no la toman). Cuando terminan sus batches, la visión queda en el cache de
+# visión y los vectores en batch_api_embeddings, y el claim se libera: la
+# próxima revisión de py -m src.batch la procesa sin llamadas en vivo (salvo
+# lo que el batch no resolvió) y escribe las mismas salidas que el modo normal.
+
+import argparse
+import logging
+import os
+import socket
+import time
+from uuid import uuid4
+
+from src.config import REPOSITORY, BATCH_API_POLL_SECONDS, BATCH_API_RETENTION_DAYS
+from src import config, database, logs, metrics
+from src.batch import candidatas, fingerprint, reclamar
+
+log = logging.getLogger(__name__)
+
+
+def encolar(licitation_ids: list[str]) -> None:
+    from src.graph.document.nodes.extractor_impl import batch_api
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:batch-api:{uuid4().hex[:8]}"
+    for licitation_id in licitation_ids:
+        licitation_dir = os.path.join(REPOSITORY, licitation_id)
+        if not os.path.isdir(licitation_dir):
+            log.error(f"❌ Licitación no encontrada en repository: {licitation_id}")
+            continue
+        if not reclamar(licitation_id, fingerprint(licitation_dir), worker_id):
+            log.info(f"⏭️ Licitación no pendiente (procesada, en curso o ya encolada): {licitation_id}")
+            continue
+        database.release_licitation(licitation_id, worker_id, "batch")
+
+        try:
+            fase = batch_api.encolar(licitation_id, licitation_dir)
+        except Exception as e:
+            # Se procesa en vivo: los batches ya creados se ignoran
+            log.error(f"❌ No se pudo encolar {licitation_id} en la Batch API: {e}")
+            database.set_batch_phase(licitation_id, "failed", str(e))
+            database.release_batch_licitation(licitation_id)
+            continue
+        _terminar(licitation_id, fase)
+
+
+def revisar() -> int:
+    """Avanza las licitaciones encoladas. Retorna cuántas siguen en curso."""
+    from src.graph.document.nodes.extractor_impl import batch_api
+
+    en_curso = 0
+    for fila in database.get_batch_licitations(("vision", "embedding")):
+        licitation_id = fila["licitation_id"]
+        try:
+            fase = batch_api.avanzar(licitation_id, os.path.join(REPOSITORY, licitation_id), fila["phase"])
+        except Exception as e:
+            # Se vuelve a intentar en la próxima revisión
+            log.error(f"❌ Error revisando los batches de {licitation_id}: {e}")
+            en_curso += 1
+            continue
+        if not _terminar(licitation_id, fase):
+            en_curso += 1
+
+    purgados = database.purge_batch_embeddings(time.time() - BATCH_API_RETENTION_DAYS * 86400)
+    if purgados:
+        log.info(f"🧹 {purgados} embeddings precalculados eliminados por antigüedad")
+    return en_curso
+
+
+def _terminar(licitation_id: str, fase: str) -> bool:
+    if fase != "done":
+        log.info(f"⏳ Licitación {licitation_id} en la Batch API (fase {fase})")
+        return False
+    database.release_batch_licitation(licitation_id)
+    log.info(f"✅ Batch API terminada para {licitation_id}; la procesará py -m src.batch")
+    return True
+
+
+def estado() -> None:
+    for fila in database.get_batch_licitations():
+        print(f"{fila['licitation_id']}: {fila['phase']}" + (f" ({fila['error']})" if fila["error"] else ""))
+        for job in database.get_batch_jobs(fila["licitation_id"]):
+            fusionado = "fusionado" if job["merged_at"] else "pendiente"
+            print(f"  {job['kind']:<9} {job['id']}  {job['status']:<11} "
+                  f"{job['completed']}/{job['requests']} ok, {job['failed']} fallidos, {fusionado}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Procesa licitaciones no urgentes con la Batch API de OpenAI")
+    parser.add_argument("--submit", nargs="+", metavar="LICITATION_ID", help="encola estas licitaciones")
+    parser.add_argument("--submit-pending", action="store_true", help="encola todas las licitaciones pendientes")
+    parser.add_argument("--daemon", action="store_true", help="revisar los batches periódicamente")
+    parser.add_argument("--poll", type=int, default=BATCH_API_POLL_SECONDS, help="segundos entre revisiones (daemon)")
+    parser.add_argument("--status", action="store_true", help="muestra las licitaciones y batches en curso")
+    args = parser.parse_args()
+    logs.configurar()
+
+    if args.status:
+        estado()
+        return
+
+    config.requerido("REPOSITORY", "API_KEY")
+    metrics.exportar()
+
+    if args.submit:
+        encolar(args.submit)
+    if args.submit_pending:
+        encolar([licitation_id for licitation_id, _ in candidatas()])
+
+    while True:
+        en_curso = revisar()
+        if not args.daemon:
+            if en_curso:
+                log.info(f"⏳ {en_curso} licitaciones siguen en la Batch API")
+            break
+        time.sleep(args.poll)
+
+
+if __name__ == "__main__":
+    main()
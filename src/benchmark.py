@@ -0,0 +1,372 @@
+# src/benchmark.py
+#
+# Benchmark offline del ETL: PDFs sintéticos, servidor OpenAI simulado y un
+# redis-server local. No consume la API real.
+#
+# Uso:
+#   py -m src.benchmark                                    → text/scanned/tables × 1, 10, 100 páginas
+#   py -m src.benchmark --kinds scanned --pages 1,50,500 --latency 1.2 --error-rate 0.02
+#   py -m src.benchmark --graph document                   → solo el subgrafo de documentos
+#   py -m src.benchmark --async                            → subgrafo de documentos con ainvoke
+#   py -m src.benchmark --vision-tpm 60000                 → cuota de visión en el stub (429 + x-ratelimit-*)
+#   py -m src.benchmark --redis-url redis://localhost:6379/15
+#
+# Cada escenario corre en un proceso nuevo (RSS máximo aislado y config leída
+# desde el entorno). Los resultados se guardan en --output como JSON con la
+# versión del código y se comparan con la corrida anterior.
+#
+# Los parámetros del ETL (EXTRACTOR_MAX_WORKERS, RENDER_*, EMBEDDING_BATCH_*...)
+# se toman del entorno como en una ejecución normal.
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PREFIJO_RESULTADO = "BENCH_RESULT "
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Parámetros de config que se guardan junto a los resultados
+_CONFIG_REPORTADA = (
+    "MODEL_VISION", "MODEL_EMBEDDING", "DOCUMENTS_MAX_PARALLEL", "EXTRACTOR_MAX_WORKERS",
+    "EMBEDDING_BATCH_MAX_TOKENS", "EMBEDDING_BATCH_MAX_ITEMS", "REDIS_WRITER_MAX_ITEMS",
+    "RENDER_DPI", "RENDER_FORMAT", "RENDER_COLORSPACE", "RENDER_QUALITY", "RENDER_MAX_LONG_SIDE",
+    "RENDER_MAX_SHORT_SIDE", "RENDER_PROCESSES", "RENDER_ADAPTIVE", "REVIEW_TEXT_FASTPATH",
+    "PAGE_CHECKPOINTS_ENABLED", "VISION_CACHE_ENABLED", "ETL_DB_JOURNAL_MODE",
+    "DOCUMENTS_ASYNC", "EXTRACTOR_ASYNC_CONCURRENCY", "RATE_LIMIT_ENABLED", "RATE_LIMIT_MAX_CONCURRENCY",
+)
+
+# Métricas comparadas entre corridas: (clave, mayor es mejor)
+_COMPARADAS = (
+    ("paginas_por_segundo", True),
+    ("latencia_p50", False),
+    ("latencia_p99", False),
+    ("rss_max_mb", False),
+    ("redis_bytes", False),
+    ("tokens_in", False),
+    ("bytes_imagen", False),
+)
+
+
+# ---------------------------------------------------------------------------
+# Proceso hijo: un escenario
+# ---------------------------------------------------------------------------
+
+def _ejecutar_escenario(escenario: dict) -> dict:
+    """Corre el grafo sobre el PDF del escenario (config ya definida por el entorno)."""
+    import resource
+
+    from src import config, logs, metrics
+    from src.graph.document.nodes.extractor_impl.renderer import shutdown_render_pool
+
+    logs.configurar()
+
+    inicio = time.perf_counter()
+    if escenario["graph"] == "etl":
+        from src.graph.etl.graph import build_graph
+
+        state = build_graph().invoke({
+            "licitation_id": escenario["licitation_id"],
+            "repository_path": config.REPOSITORY,
+            "storage_path": config.STORAGE,
+        })
+    else:
+        from src.graph.document.graph import build_document_graph
+
+        document_state = {"base_path": escenario["base_path"], "filename": escenario["filename"]}
+        if config.DOCUMENTS_ASYNC:
+            import asyncio
+
+            state = asyncio.run(build_document_graph().ainvoke(document_state))
+        else:
+            state = build_document_graph().invoke(document_state)
+    segundos = time.perf_counter() - inicio
+
+    # Los procesos de render solo cuentan en RUSAGE_CHILDREN una vez terminados
+    shutdown_render_pool()
+
+    paginas = escenario["paginas"]
+    return {
+        "status": state.get("status"),
+        "error": state.get("error"),
+        "segundos": round(segundos, 3),
+        "paginas_por_segundo": round(paginas / segundos, 3) if segundos else None,
+        "latencia_p50": _redondear(metrics.PAGE_SECONDS.quantile(0.50)),
+        "latencia_p99": _redondear(metrics.PAGE_SECONDS.quantile(0.99)),
+        "paginas_ok": metrics.PAGES.valor(result="ok"),
+        "paginas_error": metrics.PAGES.valor(result="error"),
+        "paginas_texto": metrics.PAGES.valor(result="text"),
+        "tokens_in": metrics.TOKENS.valor(kind="vision_in"),
+        "bytes_imagen": sum(metrics.VISION_IMAGE_BYTES.valor(detail=d) for d in ("low", "high", "auto")),
+        "tokens_out": metrics.TOKENS.valor(kind="vision_out"),
+        "tokens_embedding": metrics.TOKENS.valor(kind="embedding"),
+        "reintentos_embedding": metrics.RETRIES.valor(operation="embedding"),
+        "errores_vision": metrics.ERRORS.valor(operation="vision"),
+        # ru_maxrss en KB en Linux
+        "rss_max_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rss_hijos_max_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "config": {k: getattr(config, k, None) for k in _CONFIG_REPORTADA},
+    }
+
+
+def _redondear(valor, decimales=4):
+    return None if valor is None else round(valor, decimales)
+
+
+# ---------------------------------------------------------------------------
+# Proceso padre: PDFs, servicios simulados y orquestación
+# ---------------------------------------------------------------------------
+
+def _version_codigo() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=RAIZ, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocida"
+
+
+def _preparar_escenario(trabajo: str, graph: str, tipo: str, paginas: int, pdf: str) -> tuple[dict, dict]:
+    """Carpetas propias del escenario; retorna (escenario, env)."""
+    nombre = f"{tipo}-{paginas}"
+    carpeta = os.path.join(trabajo, nombre)
+    repository = os.path.join(carpeta, "repository")
+    storage = os.path.join(carpeta, "storage")
+    licitation_id = "BENCH"
+    filename = f"bench_{nombre}.pdf"
+
+    os.makedirs(os.path.join(repository, licitation_id))
+    base_path = os.path.join(storage, licitation_id)
+    os.makedirs(base_path)
+    destino = os.path.join(repository if graph == "etl" else storage, licitation_id, filename)
+    try:
+        os.link(pdf, destino)
+    except OSError:
+        shutil.copy2(pdf, destino)
+
+    escenario = {
+        "nombre": nombre,
+        "graph": graph,
+        "tipo": tipo,
+        "paginas": paginas,
+        "licitation_id": licitation_id,
+        "base_path": base_path,
+        "filename": filename,
+    }
+    env = {
+        "REPOSITORY": repository,
+        "STORAGE": storage,
+        "ETL_DB_PATH": os.path.join(carpeta, "etl.db"),
+        "VISION_CACHE_PATH": os.path.join(carpeta, "vision_cache.db"),
+    }
+    return escenario, env
+
+
+def _cuotas_stub(stub) -> dict:
+    """RATE_LIMIT_* iniciales iguales a la cuota del stub (como si la API las informara)."""
+    from src.config import MODEL_VISION, MODEL_EMBEDDING
+
+    env = {}
+    for prefijo, modelo in (("VISION", MODEL_VISION), ("EMBEDDING", MODEL_EMBEDDING)):
+        rpm, tpm = stub.limites(modelo)
+        env[f"RATE_LIMIT_{prefijo}_RPM"] = str(rpm)
+        env[f"RATE_LIMIT_{prefijo}_TPM"] = str(tpm)
+    return env
+
+
+def _correr_hijo(escenario: dict, env: dict, timeout: float) -> dict:
+    proceso = subprocess.run(
+        [sys.executable, "-m", "src.benchmark", "--run-scenario", json.dumps(escenario)],
+        cwd=RAIZ, env=env, capture_output=True, text=True, timeout=timeout,
+    )
+    for linea in reversed(proceso.stdout.splitlines()):
+        if linea.startswith(PREFIJO_RESULTADO):
+            return json.loads(linea[len(PREFIJO_RESULTADO):])
+    cola = (proceso.stderr or proceso.stdout).strip().splitlines()[-20:]
+    return {"status": "crash", "error": f"exit {proceso.returncode}: " + "\n".join(cola)}
+
+
+def _resultado_anterior(salida: str, comparar: str | None) -> dict | None:
+    if comparar:
+        with open(comparar, encoding="utf-8") as f:
+            return json.load(f)
+    archivos = sorted(glob.glob(os.path.join(salida, "*.json")))
+    if not archivos:
+        return None
+    with open(archivos[-1], encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _imprimir(resultados: list[dict], anterior: dict | None) -> None:
+    previos = {}
+    if anterior:
+        previos = {(r["graph"], r["nombre"]): r for r in anterior.get("resultados", [])}
+        print(f"\nComparado con {anterior.get('version')} ({anterior.get('fecha')})")
+
+    print(f"\n{'escenario':<22}{'status':<11}{'pág/s':>9}{'p50 s':>9}{'p99 s':>9}"
+          f"{'RSS MB':>9}{'redis KB':>11}{'imagen KB':>11}{'tokens in':>11}")
+    for r in resultados:
+        def fmt(clave, ancho, escala=1.0):
+            valor = r.get(clave)
+            return f"{'-' if valor is None else f'{valor * escala:.2f}':>{ancho}}"
+
+        print(f"{r['graph'] + ':' + r['nombre']:<22}{str(r.get('status')):<11}"
+              f"{fmt('paginas_por_segundo', 9)}{fmt('latencia_p50', 9)}{fmt('latencia_p99', 9)}"
+              f"{fmt('rss_max_mb', 9)}{fmt('redis_bytes', 11, 1 / 1024)}"
+              f"{fmt('bytes_imagen', 11, 1 / 1024)}{fmt('tokens_in', 11)}")
+
+        previo = previos.get((r["graph"], r["nombre"]))
+        if previo:
+            cambios = []
+            for clave, mayor_mejor in _COMPARADAS:
+                antes, ahora = previo.get(clave), r.get(clave)
+                if not antes or ahora is None:
+                    continue
+                delta = (ahora - antes) / antes * 100
+                empeora = delta < 0 if mayor_mejor else delta > 0
+                marca = " ⚠️" if empeora and abs(delta) >= 10 else ""
+                cambios.append(f"{clave} {delta:+.1f}%{marca}")
+            if cambios:
+                print(f"{'':<22}{', '.join(cambios)}")
+        if r.get("status") in ("crash", "failed", "error"):
+            print(f"{'':<22}❌ {r.get('error')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del ETL (OpenAI simulado + Redis local)")
+    parser.add_argument("--graph", choices=("etl", "document"), default="etl", help="grafo a medir")
+    parser.add_argument("--kinds", default="text,scanned,tables", help="tipos de PDF: text, scanned, tables")
+    parser.add_argument("--pages", default="1,10,100", help="páginas por PDF (lista, 1 a 500)")
+    parser.add_argument("--seed", type=int, default=0, help="semilla de los PDFs sintéticos")
+    parser.add_argument("--latency", type=float, default=0.8, help="latencia media de visión (s)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="desviación de la latencia de visión (s)")
+    parser.add_argument("--embedding-latency", type=float, default=0.15, help="latencia media de embeddings (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fracción de llamadas con 429/500")
+    parser.add_argument("--vision-rpm", type=int, default=0, help="cuota de requests/min de visión (0 = sin límite)")
+    parser.add_argument("--vision-tpm", type=int, default=0, help="cuota de tokens/min de visión (0 = sin límite)")
+    parser.add_argument("--vision-cache", action="store_true", help="no deshabilitar el cache de visión")
+    parser.add_argument("--async", dest="modo_async", action="store_true",
+                        help="documentos con ainvoke (DOCUMENTS_ASYNC=true)")
+    parser.add_argument("--redis-url", help="usar un Redis existente (se hace FLUSHDB en cada escenario)")
+    parser.add_argument("--redis-server", default="redis-server", help="binario de redis-server")
+    parser.add_argument("--output", default=os.path.join("data", "benchmarks"), help="carpeta de resultados")
+    parser.add_argument("--compare", help="JSON de resultados contra el cual comparar (default: el último)")
+    parser.add_argument("--timeout", type=float, default=3600, help="segundos máximos por escenario")
+    parser.add_argument("--keep", action="store_true", help="conservar la carpeta de trabajo")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        resultado = _ejecutar_escenario(json.loads(args.run_scenario))
+        print(PREFIJO_RESULTADO + json.dumps(resultado, default=str), flush=True)
+        return
+
+    from src.benchmark_impl.pdfs import TIPOS, pdf_sintetico
+    from src.benchmark_impl.redis_local import RedisLocal, diferencia
+    from src.benchmark_impl.stub_openai import StubOpenAI
+
+    tipos = [t.strip() for t in args.kinds.split(",") if t.strip()]
+    for tipo in tipos:
+        if tipo not in TIPOS:
+            parser.error(f"tipo desconocido: {tipo} (opciones: {', '.join(TIPOS)})")
+    paginas = sorted({int(p) for p in args.pages.split(",") if p.strip()})
+    if not paginas or paginas[0] < 1 or paginas[-1] > 500:
+        parser.error("--pages debe estar entre 1 y 500")
+
+    salida = os.path.abspath(args.output)
+    carpeta_pdfs = os.path.join(salida, "pdfs")
+    print(f"📄 Generando PDFs sintéticos en {carpeta_pdfs}")
+    pdfs = {(t, n): pdf_sintetico(carpeta_pdfs, t, n, args.seed) for t in tipos for n in paginas}
+
+    anterior = _resultado_anterior(salida, args.compare)
+    trabajo = tempfile.mkdtemp(prefix="etl-bench-")
+    resultados = []
+    stub = StubOpenAI(
+        latencia=args.latency, jitter=args.jitter,
+        latencia_embedding=args.embedding_latency, jitter_embedding=args.embedding_latency / 4,
+        tasa_error=args.error_rate, rpm=args.vision_rpm, tpm=args.vision_tpm,
+    )
+    try:
+        with stub, RedisLocal(args.redis_url, args.redis_server) as redis_local:
+            print(f"🧪 OpenAI simulado en {stub.url}, Redis en {redis_local.url}")
+            for (tipo, n), pdf in pdfs.items():
+                escenario, env_escenario = _preparar_escenario(trabajo, args.graph, tipo, n, pdf)
+                env = {
+                    **os.environ,
+                    **redis_local.env(),
+                    **env_escenario,
+                    "OPENAI_API_KEY": "sk-benchmark",
+                    "OPENAI_BASE_URL": stub.url,
+                    **_cuotas_stub(stub),
+                    "METRICS_PORT": "0",
+                    "METRICS_FILE": "",
+                    "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+                }
+                if args.modo_async:
+                    env["DOCUMENTS_ASYNC"] = "true"
+                if not args.vision_cache:
+                    env["VISION_CACHE_ENABLED"] = "false"
+
+                redis_local.limpiar()
+                antes = redis_local.estadisticas()
+                print(f"⏱️ {args.graph}:{escenario['nombre']} ...", flush=True)
+                resultado = _correr_hijo(escenario, env, args.timeout)
+                despues = redis_local.estadisticas()
+
+                resultados.append({
+                    "nombre": escenario["nombre"],
+                    "graph": args.graph,
+                    "tipo": tipo,
+                    "paginas": n,
+                    **resultado,
+                    "redis_bytes": diferencia(despues["bytes_recibidos"], antes["bytes_recibidos"]),
+                    "redis_memoria": diferencia(despues["memoria"], antes["memoria"]),
+                    "redis_claves": despues["claves"],
+                })
+    finally:
+        if args.keep:
+            print(f"📁 Carpeta de trabajo: {trabajo}")
+        else:
+            shutil.rmtree(trabajo, ignore_errors=True)
+
+    config_etl = next((r.pop("config") for r in resultados if "config" in r), {})
+    for r in resultados:
+        r.pop("config", None)
+
+    fecha = datetime.now()
+    version = _version_codigo()
+    reporte = {
+        "version": version,
+        "fecha": fecha.isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "parametros": {
+            "graph": args.graph, "seed": args.seed, "latency": args.latency, "jitter": args.jitter,
+            "embedding_latency": args.embedding_latency, "error_rate": args.error_rate,
+            "vision_cache": args.vision_cache, "async": args.modo_async,
+            "vision_rpm": args.vision_rpm, "vision_tpm": args.vision_tpm,
+        },
+        "config": config_etl,
+        "stub": {"llamadas": stub.llamadas, "errores": stub.errores, "rechazadas": stub.rechazadas,
+                 "bytes_imagen": stub.bytes_imagen},
+        "resultados": resultados,
+    }
+    os.makedirs(salida, exist_ok=True)
+    archivo = os.path.join(salida, f"{fecha:%Y%m%d-%H%M%S}-{version}.json")
+    with open(archivo, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+
+    _imprimir(resultados, anterior)
+    print(f"\n💾 Resultados en {archivo}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# pdfs.py
+#
+# PDFs sintéticos para el benchmark (PyMuPDF):
+#   - text:    páginas con capa de texto (camino local de DocumentReviewNode)
+#   - scanned: páginas como imagen sin capa de texto (van al modelo de visión)
+#   - tables:  tablas dibujadas con texto nativo (detección de tablas local)
+#
+# Los archivos se generan una vez por (tipo, páginas, semilla, VERSION) y se
+# reutilizan entre corridas.
+
+import os
+import random
+
+import fitz  # PyMuPDF
+
+TIPOS = ("text", "scanned", "tables")
+
+# Cambiar si cambia el contenido generado (invalida los PDFs reutilizados)
+VERSION = 1
+
+_PALABRAS = (
+    "licitación oferta proveedor contrato plazo garantía monto cláusula anexo bases técnicas "
+    "administrativas evaluación criterio puntaje adjudicación servicio suministro entrega "
+    "municipalidad departamento unidad compra requisito documento declaración jurada vigencia "
+    "presupuesto disponible moneda pesos unidades fomento especificación cantidad precio total"
+).split()
+
+
+def _parrafo(rnd: random.Random, palabras: int) -> str:
+    texto = " ".join(rnd.choice(_PALABRAS) for _ in range(palabras))
+    return texto[0].upper() + texto[1:] + "."
+
+
+def _pagina_texto(doc, rnd: random.Random, numero: int) -> None:
+    page = doc.new_page()
+    page.insert_text((72, 64), f"Sección {numero}: {_parrafo(rnd, 4)}", fontsize=14)
+    cuerpo = "\n\n".join(_parrafo(rnd, rnd.randint(30, 60)) for _ in range(6))
+    page.insert_textbox(fitz.Rect(72, 90, page.rect.width - 72, page.rect.height - 72), cuerpo, fontsize=10)
+
+
+def _pagina_tablas(doc, rnd: random.Random, numero: int) -> None:
+    page = doc.new_page()
+    page.insert_text((72, 64), f"Cuadro {numero}: {_parrafo(rnd, 3)}", fontsize=14)
+    filas, columnas = rnd.randint(12, 24), rnd.randint(3, 6)
+    x0, y0 = 72, 90
+    ancho = (page.rect.width - 144) / columnas
+    alto = min(24, (page.rect.height - 162) / filas)
+    for f in range(filas + 1):
+        page.draw_line((x0, y0 + f * alto), (x0 + columnas * ancho, y0 + f * alto))
+    for c in range(columnas + 1):
+        page.draw_line((x0 + c * ancho, y0), (x0 + c * ancho, y0 + filas * alto))
+    for f in range(filas):
+        for c in range(columnas):
+            valor = rnd.choice(_PALABRAS) if f == 0 or c == 0 else f"{rnd.randint(1, 99999):,}"
+            page.insert_text((x0 + c * ancho + 3, y0 + f * alto + alto * 0.7), valor, fontsize=8)
+
+
+def _pagina_escaneada(doc, rnd: random.Random, numero: int, dpi: int = 120) -> None:
+    # Se compone una página de texto, se rasteriza y solo se inserta la imagen
+    borrador = fitz.open()
+    _pagina_texto(borrador, rnd, numero)
+    pix = borrador[0].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    borrador.close()
+    page = doc.new_page()
+    page.insert_image(page.rect, stream=pix.tobytes("png"))
+
+
+_GENERADORES = {
+    "text": _pagina_texto,
+    "tables": _pagina_tablas,
+    "scanned": _pagina_escaneada,
+}
+
+
+def generar_pdf(path: str, tipo: str, paginas: int, semilla: int = 0) -> str:
+    if tipo not in _GENERADORES:
+        raise ValueError(f"tipo de PDF desconocido: {tipo} (opciones: {', '.join(TIPOS)})")
+    rnd = random.Random(f"{tipo}:{paginas}:{semilla}")
+    doc = fitz.open()
+    for numero in range(1, paginas + 1):
+        _GENERADORES[tipo](doc, rnd, numero)
+    tmp = f"{path}.tmp"
+    doc.save(tmp, garbage=3, deflate=True)
+    doc.close()
+    os.replace(tmp, path)
+    return path
+
+
+def pdf_sintetico(carpeta: str, tipo: str, paginas: int, semilla: int = 0) -> str:
+    """Ruta del PDF (lo genera si no existe en la carpeta)."""
+    os.makedirs(carpeta, exist_ok=True)
+    path = os.path.join(carpeta, f"{tipo}-{paginas}p-s{semilla}-v{VERSION}.pdf")
+    if not os.path.exists(path):
+        generar_pdf(path, tipo, paginas, semilla)
+    return path
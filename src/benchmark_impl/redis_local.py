@@ -0,0 +1,113 @@
+# redis_local.py
+#
+# redis-server efímero para el benchmark (sin persistencia, puerto libre) o
+# un Redis existente (--redis-url). Reporta bytes recibidos y memoria usada
+# para medir lo que escribe el ETL.
+
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from urllib.parse import urlparse
+
+import redis
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class RedisLocal:
+    def __init__(self, url: str | None = None, binario: str = "redis-server"):
+        self.url = url
+        self.binario = binario
+        self._proceso = None
+        self._carpeta = None
+        self._con_info = True
+
+    def start(self) -> "RedisLocal":
+        if self.url is None:
+            ejecutable = shutil.which(self.binario)
+            if ejecutable is None:
+                raise RuntimeError(
+                    f"No se encontró '{self.binario}': instalar redis-server o usar --redis-url"
+                )
+            puerto = puerto_libre()
+            self._carpeta = tempfile.mkdtemp(prefix="etl-bench-redis-")
+            self._proceso = subprocess.Popen(
+                [ejecutable, "--port", str(puerto), "--bind", "127.0.0.1", "--save", "",
+                 "--appendonly", "no", "--dir", self._carpeta],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            self.url = f"redis://127.0.0.1:{puerto}/0"
+
+        # health_check: la conexión queda inactiva mientras corre cada escenario
+        self.cliente = redis.Redis.from_url(self.url, health_check_interval=5)
+        limite = time.monotonic() + 10
+        while True:
+            try:
+                self.cliente.ping()
+                break
+            except redis.ConnectionError:
+                if time.monotonic() > limite:
+                    self.stop()
+                    raise
+                time.sleep(0.05)
+        return self
+
+    def stop(self) -> None:
+        if self._proceso is not None:
+            self._proceso.terminate()
+            self._proceso.wait(timeout=10)
+            self._proceso = None
+        if self._carpeta is not None:
+            shutil.rmtree(self._carpeta, ignore_errors=True)
+            self._carpeta = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def env(self) -> dict:
+        """Variables REDIS_* para el proceso del ETL."""
+        u = urlparse(self.url)
+        return {
+            "REDIS_HOST": u.hostname or "localhost",
+            "REDIS_PORT": str(u.port or 6379),
+            "REDIS_DB": (u.path or "/0").lstrip("/") or "0",
+            "REDIS_USERNAME": u.username or "",
+            "REDIS_PASSWORD": u.password or "",
+            "REDIS_PROTOCOL": u.scheme or "redis",
+            "REDIS_USE_SSL": "true" if u.scheme == "rediss" else "false",
+        }
+
+    def limpiar(self) -> None:
+        self.cliente.flushdb()
+
+    def estadisticas(self) -> dict:
+        """Bytes recibidos y memoria (None si el servidor no soporta INFO)."""
+        bytes_recibidos = usada = None
+        if self._con_info:
+            try:
+                stats = self.cliente.info("stats")
+                memoria = self.cliente.info("memory")
+                bytes_recibidos = int(stats.get("total_net_input_bytes", 0))
+                usada = int(memoria.get("used_memory", 0))
+            except redis.ResponseError:
+                self._con_info = False
+        return {
+            "bytes_recibidos": bytes_recibidos,
+            "memoria": usada,
+            "claves": int(self.cliente.dbsize()),
+        }
+
+
+def diferencia(despues, antes):
+    return None if despues is None or antes is None else despues - antes
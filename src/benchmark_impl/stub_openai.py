@@ -0,0 +1,376 @@
+# stub_openai.py
+#
+# Servidor HTTP local compatible con la API de OpenAI para el benchmark
+# (sin costo). Implementa:
+#   - POST /v1/chat/completions → JSON de elementos con el esquema del extractor
+#   - POST /v1/embeddings       → vectores pseudoaleatorios (float o base64)
+#   - /v1/files y /v1/batches   → Batch API: el batch se procesa al crearlo
+#     (sin latencia ni cuota) y queda "completed" con su archivo de salida
+#
+# Los tokens de imagen se cuentan como la API: 85 en detail=low y 85 + 170
+# por tile de 512 px en detail=high.
+#
+# Latencia por llamada ~ N(latencia, jitter) y una fracción de respuestas con
+# error (429 / 500) para ejercitar los reintentos del cliente y del ETL.
+#
+# Cuota por minuto (repuesta continuamente) para el modelo de visión: las
+# respuestas llevan los headers x-ratelimit-* de OpenAI y un request que
+# excede la cuota recibe 429 con retry-after.
+
+import base64
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DIMENSIONES_EMBEDDING = 1536
+
+# Cuota informada cuando no se limita un modelo
+SIN_LIMITE_RPM = 100_000
+SIN_LIMITE_TPM = 100_000_000
+
+
+def _tokens_imagen(imagen: bytes, detail: str) -> int:
+    from src.graph.document.nodes.extractor_impl.image_preprocess import dimensiones_imagen
+    from src.graph.etl.nodes.cost_impl.estimator import tokens_imagen
+
+    dimensiones = dimensiones_imagen(imagen)
+    if detail == "low" or dimensiones is None:
+        return 85
+    return tokens_imagen(*dimensiones)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Servidor"
+
+    def do_GET(self):
+        stub = self.server.stub
+        partes = self.path.split("?")[0].rstrip("/").split("/")
+        if len(partes) >= 4 and partes[-3] == "files" and partes[-1] == "content":
+            contenido = stub.archivos.get(partes[-2])
+            if contenido is None:
+                return self._no_encontrado()
+            return self._bytes(200, contenido[1])
+        if len(partes) >= 2 and partes[-2] == "batches":
+            batch = stub.batches.get(partes[-1])
+            return self._json(200, batch) if batch else self._no_encontrado()
+        self._no_encontrado()
+
+    def do_POST(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        datos = self.rfile.read(largo)
+        stub = self.server.stub
+
+        if self.path.endswith("/files"):
+            return self._json(200, stub.subir_archivo(self.headers.get("Content-Type", ""), datos))
+        cuerpo = json.loads(datos or b"{}")
+        if self.path.endswith("/batches"):
+            batch = stub.crear_batch(cuerpo)
+            return self._json(200, batch) if batch else self._no_encontrado()
+
+        if self.path.endswith("/chat/completions"):
+            tipo, respuesta = "chat", stub.respuesta_chat(cuerpo)
+            latencia, jitter = stub.latencia, stub.jitter
+        elif self.path.endswith("/embeddings"):
+            tipo, respuesta = "embeddings", stub.respuesta_embeddings(cuerpo)
+            latencia, jitter = stub.latencia_embedding, stub.jitter_embedding
+        else:
+            return self._no_encontrado()
+
+        permitido, headers = stub.cupo(respuesta["model"], respuesta["usage"]["total_tokens"])
+        if not permitido:
+            stub.registrar(tipo, rechazada=True)
+            return self._json(429, {"error": {"message": "cuota por minuto excedida (stub)",
+                                              "type": "requests", "code": "rate_limit_exceeded"}}, headers)
+        stub.esperar(latencia, jitter)
+        if stub.falla(tipo):
+            return self._error(headers)
+        self._json(200, respuesta, headers)
+
+    def _error(self, headers):
+        if random.random() < 0.5:
+            self._json(429, {"error": {"message": "rate limit (stub)", "type": "rate_limit_error"}}, headers)
+        else:
+            self._json(500, {"error": {"message": "error interno (stub)", "type": "server_error"}})
+
+    def _no_encontrado(self):
+        self._json(404, {"error": {"message": f"ruta no soportada: {self.path}",
+                                   "type": "invalid_request_error"}})
+
+    def _json(self, status: int, datos: dict, headers: dict | None = None):
+        self._bytes(status, json.dumps(datos).encode("utf-8"), headers, "application/json")
+
+    def _bytes(self, status: int, cuerpo: bytes, headers: dict | None = None,
+               tipo: str = "application/octet-stream"):
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for nombre, valor in (headers or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: "StubOpenAI"
+
+
+class StubOpenAI:
+    """
+    Uso:
+        with StubOpenAI(latencia=0.8, tasa_error=0.02) as stub:
+            os.environ["OPENAI_BASE_URL"] = stub.url
+
+    rpm/tpm: cuota por minuto del modelo de visión (0 = sin límite).
+    """
+
+    def __init__(self, latencia=0.8, jitter=0.2, latencia_embedding=0.15, jitter_embedding=0.05,
+                 tasa_error=0.0, elementos_por_pagina=6, rpm=0, tpm=0, modelo_vision="gpt-4o",
+                 host="127.0.0.1", puerto=0):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.latencia_embedding = latencia_embedding
+        self.jitter_embedding = jitter_embedding
+        self.tasa_error = tasa_error
+        self.elementos_por_pagina = elementos_por_pagina
+        self._servidor = _Servidor((host, puerto), _Handler)
+        self._servidor.stub = self
+        self._hilo = None
+        self._lock = threading.Lock()
+        self.llamadas = {"chat": 0, "embeddings": 0}
+        self.errores = {"chat": 0, "embeddings": 0}
+        self.rechazadas = {"chat": 0, "embeddings": 0}
+        self.bytes_imagen = 0
+        self.cuotas = {modelo_vision: (rpm or SIN_LIMITE_RPM, tpm or SIN_LIMITE_TPM)}
+        self._disponible = {}
+        self.archivos = {}   # file_id → (nombre, contenido)
+        self.batches = {}    # batch_id → objeto Batch
+        self._ids = itertools.count(1)
+
+    @property
+    def url(self) -> str:
+        host, puerto = self._servidor.server_address[:2]
+        return f"http://{host}:{puerto}/v1"
+
+    def start(self) -> "StubOpenAI":
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, name="stub-openai", daemon=True)
+        self._hilo.start()
+        return self
+
+    def stop(self) -> None:
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def esperar(media: float, jitter: float) -> None:
+        espera = random.gauss(media, jitter) if jitter else media
+        if espera > 0:
+            time.sleep(espera)
+
+    def falla(self, tipo: str) -> bool:
+        fallo = self.tasa_error > 0 and random.random() < self.tasa_error
+        self.registrar(tipo, error=fallo)
+        return fallo
+
+    def registrar(self, tipo: str, error: bool = False, rechazada: bool = False) -> None:
+        with self._lock:
+            self.llamadas[tipo] += 1
+            if error:
+                self.errores[tipo] += 1
+            if rechazada:
+                self.rechazadas[tipo] += 1
+
+    def limites(self, modelo: str) -> tuple[int, int]:
+        return self.cuotas.get(modelo, (SIN_LIMITE_RPM, SIN_LIMITE_TPM))
+
+    def cupo(self, modelo: str, tokens: int) -> tuple[bool, dict]:
+        """
+        Descuenta el request de la cuota del modelo si cabe. Como en la API, la
+        cuota se repone continuamente (limite/60 por segundo) hasta el límite.
+        Retorna (permitido, headers x-ratelimit-*).
+        """
+        rpm, tpm = self.limites(modelo)
+        ahora = time.monotonic()
+        with self._lock:
+            requests, disponibles, antes = self._disponible.get(modelo, (rpm, tpm, ahora))
+            requests = min(rpm, requests + (ahora - antes) * rpm / 60)
+            disponibles = min(tpm, disponibles + (ahora - antes) * tpm / 60)
+            permitido = requests >= 1 and disponibles >= tokens
+            if permitido:
+                requests -= 1
+                disponibles -= tokens
+            self._disponible[modelo] = (requests, disponibles, ahora)
+
+        headers = {
+            "x-ratelimit-limit-requests": str(rpm),
+            "x-ratelimit-limit-tokens": str(tpm),
+            "x-ratelimit-remaining-requests": str(int(requests)),
+            "x-ratelimit-remaining-tokens": str(int(disponibles)),
+            "x-ratelimit-reset-requests": f"{(rpm - requests) * 60 / rpm:.3f}s",
+            "x-ratelimit-reset-tokens": f"{(tpm - disponibles) * 60 / tpm:.3f}s",
+        }
+        if not permitido:
+            espera = max((1 - requests) * 60 / rpm, (tokens - disponibles) * 60 / tpm)
+            headers["retry-after-ms"] = str(int(espera * 1000) + 1)
+        return permitido, headers
+
+    def respuesta_chat(self, cuerpo: dict) -> dict:
+        imagen_bytes = tokens_imagen = 0
+        for mensaje in cuerpo.get("messages", []):
+            if isinstance(mensaje.get("content"), list):
+                for parte in mensaje["content"]:
+                    if parte.get("type") == "image_url":
+                        imagen = base64.b64decode(parte["image_url"]["url"].split(",", 1)[-1])
+                        imagen_bytes += len(imagen)
+                        tokens_imagen += _tokens_imagen(imagen, parte["image_url"].get("detail", "auto"))
+        with self._lock:
+            self.bytes_imagen += imagen_bytes
+
+        rnd = random.Random(imagen_bytes)
+        elementos = []
+        for n in range(1, self.elementos_por_pagina + 1):
+            if n % 3 == 0:
+                contenido = [[f"c{f}{c}" for c in range(4)] for f in range(rnd.randint(3, 8))]
+                tipo = "tabla"
+            else:
+                contenido = " ".join(f"palabra{rnd.randint(0, 999)}" for _ in range(rnd.randint(40, 120)))
+                tipo = "texto"
+            elementos.append({
+                "id": f"e{n}", "tipo": tipo, "posicion": n, "titulo": "", "descripcion": "",
+                "contenido": contenido, "coordenadas": {}, "metadatos": {},
+            })
+        contenido = json.dumps({"titulo_pagina": "", "confianza": 0.9, "elementos": elementos}, ensure_ascii=False)
+
+        tokens_in = 1100 + tokens_imagen
+        tokens_out = len(contenido) // 4
+        return {
+            "id": f"chatcmpl-stub-{rnd.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": cuerpo.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": contenido},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": tokens_in, "completion_tokens": tokens_out,
+                      "total_tokens": tokens_in + tokens_out},
+        }
+
+    def respuesta_embeddings(self, cuerpo: dict) -> dict:
+        textos = cuerpo.get("input", [])
+        if isinstance(textos, str):
+            textos = [textos]
+        base64_ = cuerpo.get("encoding_format") == "base64"
+        data = []
+        tokens = 0
+        for i, texto in enumerate(textos):
+            texto = texto if isinstance(texto, str) else json.dumps(texto)
+            tokens += max(1, len(texto) // 4)
+            semilla = int.from_bytes(hashlib.sha1(texto.encode("utf-8")).digest()[:4], "little")
+            vector = np.random.default_rng(semilla).standard_normal(DIMENSIONES_EMBEDDING).astype("<f4")
+            vector /= np.linalg.norm(vector)
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii") if base64_ else vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        return {
+            "object": "list",
+            "data": data,
+            "model": cuerpo.get("model", "stub"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    # ------------------------------------------------------------------
+    # Batch API
+
+    def subir_archivo(self, content_type: str, datos: bytes) -> dict:
+        """POST /v1/files (multipart/form-data con los campos purpose y file)."""
+        mensaje = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + datos
+        )
+        campos, nombre, contenido = {}, "input.jsonl", b""
+        for parte in mensaje.iter_parts():
+            campo = parte.get_param("name", header="content-disposition")
+            if campo == "file":
+                nombre = parte.get_filename() or nombre
+                contenido = parte.get_payload(decode=True) or b""
+            else:
+                campos[campo] = parte.get_content().strip()
+        return self._guardar_archivo(nombre, contenido, campos.get("purpose", "batch"))
+
+    def _guardar_archivo(self, nombre: str, contenido: bytes, purpose: str) -> dict:
+        with self._lock:
+            file_id = f"file-stub-{next(self._ids)}"
+            self.archivos[file_id] = (nombre, contenido)
+        return {"id": file_id, "object": "file", "bytes": len(contenido), "created_at": int(time.time()),
+                "filename": nombre, "purpose": purpose, "status": "processed"}
+
+    def crear_batch(self, cuerpo: dict) -> dict | None:
+        """POST /v1/batches: procesa todas las líneas del archivo de entrada de inmediato."""
+        entrada = self.archivos.get(cuerpo.get("input_file_id"))
+        if entrada is None:
+            return None
+
+        salida, errores = [], []
+        for linea in entrada[1].decode("utf-8").splitlines():
+            if not linea.strip():
+                continue
+            request = json.loads(linea)
+            tipo = "chat" if request["url"].endswith("/chat/completions") else "embeddings"
+            if self.falla(tipo):
+                errores.append({"id": f"batch_req_{next(self._ids)}", "custom_id": request["custom_id"],
+                                "response": None,
+                                "error": {"code": "server_error", "message": "error interno (stub)"}})
+                continue
+            if tipo == "chat":
+                respuesta = self.respuesta_chat(request["body"])
+            else:
+                respuesta = self.respuesta_embeddings(request["body"])
+            salida.append({"id": f"batch_req_{next(self._ids)}", "custom_id": request["custom_id"],
+                           "response": {"status_code": 200, "request_id": "stub", "body": respuesta},
+                           "error": None})
+
+        ahora = int(time.time())
+        batch = {
+            "id": f"batch_stub_{next(self._ids)}",
+            "object": "batch",
+            "endpoint": cuerpo.get("endpoint"),
+            "input_file_id": cuerpo["input_file_id"],
+            "completion_window": cuerpo.get("completion_window", "24h"),
+            "status": "completed",
+            "created_at": ahora,
+            "completed_at": ahora,
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len(salida) + len(errores), "completed": len(salida),
+                               "failed": len(errores)},
+        }
+        if salida:
+            batch["output_file_id"] = self._guardar_archivo(
+                "output.jsonl", "\n".join(json.dumps(s) for s in salida).encode("utf-8"), "batch_output")["id"]
+        if errores:
+            batch["error_file_id"] = self._guardar_archivo(
+                "errors.jsonl", "\n".join(json.dumps(e) for e in errores).encode("utf-8"), "batch_output")["id"]
+        with self._lock:
+            self.batches[batch["id"]] = batch
+        return batch
@@ -5,17 +5,25 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+# Variables obligatorias: se validan al usarlas (requerido), no al importar
+# config, para que importar un módulo no falle sin .env ni servicios
 REPOSITORY = os.getenv("REPOSITORY")
-if not REPOSITORY:
-    raise RuntimeError("REPOSITORY no definido en .env")
-
 STORAGE = os.getenv("STORAGE")
-if not STORAGE:
-    raise RuntimeError("STORAGE no definido en .env")
-
 API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    raise ValueError("La variable OPENAI_API_KEY no está definida en el entorno")
+
+_VARIABLES = {"REPOSITORY": "REPOSITORY", "STORAGE": "STORAGE", "API_KEY": "OPENAI_API_KEY"}
+
+
+def requerido(*nombres):
+    """
+    Valor de una o más variables obligatorias (tupla si son varias).
+    Lanza RuntimeError con todas las que faltan.
+    """
+    faltan = [_VARIABLES.get(n, n) for n in nombres if not globals().get(n)]
+    if faltan:
+        raise RuntimeError(f"{', '.join(faltan)} no definido en .env")
+    valores = tuple(globals()[n] for n in nombres)
+    return valores[0] if len(valores) == 1 else valores
 
 # Parámetros de Redis
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
@@ -23,8 +31,165 @@ REDIS_PORT = os.getenv("REDIS_PORT", "6379")
 REDIS_DB = os.getenv("REDIS_DB", "0")
 REDIS_USERNAME = os.getenv("REDIS_USERNAME", "")
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "")
+REDIS_USE_SSL = os.getenv("REDIS_USE_SSL", "false").lower() == "true"
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+
+# Escritura en Redis por pipeline: se envía al alcanzar N comandos o N bytes
+REDIS_WRITER_MAX_ITEMS = int(os.getenv("REDIS_WRITER_MAX_ITEMS", "500"))
+REDIS_WRITER_MAX_BYTES = int(os.getenv("REDIS_WRITER_MAX_BYTES", str(4 * 1024 * 1024)))
 
 MODEL_EMBEDDING = "text-embedding-3-small"
+MODEL_VISION = "gpt-4o"
+
+# Base SQLite de control del ETL (archivos, claims)
+# journal: wal (recomendado) | delete (si la base está en un filesystem de red)
+ETL_DB_PATH = os.getenv("ETL_DB_PATH", os.path.join("data", "etl.db"))
+ETL_DB_JOURNAL_MODE = os.getenv("ETL_DB_JOURNAL_MODE", "wal").lower()
+
+# Hilos para calcular checksums de archivos nuevos o modificados en StartNode
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# Sincronización repository → storage: link (hardlink → reflink → copia) |
+# reflink (reflink → copia) | copy (siempre copia)
+SYNC_MODE = os.getenv("SYNC_MODE", "link").lower()
+
+# Estimación de costo (CostNode): precios USD por millón de tokens, tokens de
+# salida por página antes de tener historial y presupuesto
+# - COST_MAX_USD_PER_LICITATION: licitaciones más caras quedan en pausa hasta
+#   aprobarlas con "py -m src.batch --approve <ID>" (0 = sin límite)
+# - COST_TOKENS_PER_HOUR: tokens de visión por hora; si una licitación no cabe
+#   en lo que queda de la hora se difiere (0 = sin límite)
+VISION_PRICE_IN_PER_M = float(os.getenv("VISION_PRICE_IN_PER_M", "2.50"))
+VISION_PRICE_OUT_PER_M = float(os.getenv("VISION_PRICE_OUT_PER_M", "10.00"))
+EMBEDDING_PRICE_PER_M = float(os.getenv("EMBEDDING_PRICE_PER_M", "0.02"))
+COST_TOKENS_OUT_PER_PAGE = int(os.getenv("COST_TOKENS_OUT_PER_PAGE", "700"))
+COST_MAX_USD_PER_LICITATION = float(os.getenv("COST_MAX_USD_PER_LICITATION", "0"))
+COST_TOKENS_PER_HOUR = int(os.getenv("COST_TOKENS_PER_HOUR", "0"))
+
+# Modo batch/daemon (py -m src.batch): workers y expiración de claims
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "2"))
+BATCH_POLL_SECONDS = int(os.getenv("BATCH_POLL_SECONDS", "30"))
+CLAIM_TTL_SECONDS = int(os.getenv("CLAIM_TTL_SECONDS", "900"))
+# Orden shortest-job-first; una licitación que espera más que esto pasa primero
+SJF_MAX_WAIT_SECONDS = int(os.getenv("SJF_MAX_WAIT_SECONDS", "3600"))
+
+# Modo watch (py -m src.watch): segundos sin eventos antes de revisar una
+# licitación y licitaciones procesadas en paralelo
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "0.5"))
+WATCH_WORKERS = int(os.getenv("WATCH_WORKERS", "1"))
+
+# Logging (DEBUG | INFO | WARNING | ERROR) y métricas Prometheus:
+# endpoint HTTP (0 = deshabilitado) y/o archivo .prom reescrito cada N segundos
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Solo local por defecto; 0.0.0.0 para que Prometheus lo lea desde otra máquina
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_FILE_SECONDS = float(os.getenv("METRICS_FILE_SECONDS", "15"))
+
+# Documentos de una misma licitación procesados en paralelo (1 = secuencial)
+DOCUMENTS_MAX_PARALLEL = int(os.getenv("DOCUMENTS_MAX_PARALLEL", "2"))
+
+# Concurrencia del extractor: número máximo de páginas analizadas en paralelo
+# (1 = modo secuencial)
+EXTRACTOR_MAX_WORKERS = int(os.getenv("EXTRACTOR_MAX_WORKERS", "4"))
+
+# Modo asyncio del subgrafo de documentos (ainvoke): visión y embeddings con
+# AsyncOpenAI y escrituras con redis.asyncio, sin un hilo por request
+# - DOCUMENTS_ASYNC: ProcessDocumentsNode procesa los documentos de la
+#   licitación en un solo event loop (hasta DOCUMENTS_MAX_PARALLEL a la vez)
+# - EXTRACTOR_ASYNC_CONCURRENCY: llamadas de visión en vuelo por documento
+DOCUMENTS_ASYNC = os.getenv("DOCUMENTS_ASYNC", "false").lower() == "true"
+EXTRACTOR_ASYNC_CONCURRENCY = int(os.getenv("EXTRACTOR_ASYNC_CONCURRENCY", "16"))
+
+# Embeddings por lote: límites de empaquetado por request y reintentos por item
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "512"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+
+# Rate limit de OpenAI del lado del cliente (visión y embeddings por separado)
+# - RPM/TPM: límites iniciales por modelo; los reemplazan los headers
+#   x-ratelimit-limit-* de la API. El cupo es un token bucket en ETL_DB_PATH
+#   compartido por todos los procesos (workers batch, retry_embeddings)
+# - BURST_SECONDS: cupo máximo acumulado, en segundos del límite por minuto
+#   (60 = como la API; menos si la API aplica la cuota en ventanas más cortas)
+# - MAX_CONCURRENCY: llamadas en vuelo por modelo y proceso; baja a la mitad
+#   con cada 429 y sube de a uno por ventana de éxitos (AIMD)
+# - MAX_RETRIES: reintentos de 429 / timeout / 5xx (backoff con jitter)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_VISION_RPM = float(os.getenv("RATE_LIMIT_VISION_RPM", "500"))
+RATE_LIMIT_VISION_TPM = float(os.getenv("RATE_LIMIT_VISION_TPM", "30000"))
+RATE_LIMIT_EMBEDDING_RPM = float(os.getenv("RATE_LIMIT_EMBEDDING_RPM", "3000"))
+RATE_LIMIT_EMBEDDING_TPM = float(os.getenv("RATE_LIMIT_EMBEDDING_TPM", "1000000"))
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "60"))
+RATE_LIMIT_MAX_CONCURRENCY = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", "64"))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "8"))
+
+# Modo Batch API de OpenAI para licitaciones no urgentes (py -m src.batch_api):
+# visión y embeddings a ~50% del costo, con resultados dentro de COMPLETION_WINDOW
+# - DIR: archivos JSONL de entrada por licitación (se borran al terminar)
+# - MAX_FILE_MB / MAX_REQUESTS: límites por archivo de entrada (la API acepta
+#   200 MB y 50.000 requests, o 50.000 inputs en embeddings)
+# - POLL_SECONDS: segundos entre revisiones del estado de los batches (daemon)
+# - RETENTION_DAYS: días que se conservan los embeddings precalculados
+BATCH_API_DIR = os.getenv("BATCH_API_DIR", os.path.join("data", "batch_api"))
+BATCH_API_MAX_FILE_MB = int(os.getenv("BATCH_API_MAX_FILE_MB", "190"))
+BATCH_API_MAX_REQUESTS = int(os.getenv("BATCH_API_MAX_REQUESTS", "50000"))
+BATCH_API_COMPLETION_WINDOW = os.getenv("BATCH_API_COMPLETION_WINDOW", "24h")
+BATCH_API_POLL_SECONDS = int(os.getenv("BATCH_API_POLL_SECONDS", "300"))
+BATCH_API_RETENTION_DAYS = float(os.getenv("BATCH_API_RETENTION_DAYS", "7"))
+
+# Cola de reintentos de embeddings fallidos (py -m src.retry_embeddings):
+# items por lote, intentos antes de descartar y backoff exponencial (segundos)
+EMBEDDING_RETRY_BATCH = int(os.getenv("EMBEDDING_RETRY_BATCH", "256"))
+EMBEDDING_RETRY_MAX_ATTEMPTS = int(os.getenv("EMBEDDING_RETRY_MAX_ATTEMPTS", "8"))
+EMBEDDING_RETRY_BASE_SECONDS = float(os.getenv("EMBEDDING_RETRY_BASE_SECONDS", "30"))
+EMBEDDING_RETRY_MAX_SECONDS = float(os.getenv("EMBEDDING_RETRY_MAX_SECONDS", "3600"))
+
+# Checkpoints por página: un documento interrumpido se reanuda desde las
+# páginas que no alcanzaron a persistirse
+PAGE_CHECKPOINTS_ENABLED = os.getenv("PAGE_CHECKPOINTS_ENABLED", "true").lower() == "true"
+
+# Render de páginas PDF
+# - formato: png | jpeg | webp (webp requiere Pillow)
+# - colorspace: rgb | gray
+# - max lado largo/corto: tamaño efectivo que usa gpt-4o en detail=high (0 = sin límite)
+# - procesos: tamaño del pool de rasterización (0 = render en el mismo proceso)
+RENDER_DPI = int(os.getenv("RENDER_DPI", "300"))
+RENDER_FORMAT = os.getenv("RENDER_FORMAT", "png").lower()
+RENDER_COLORSPACE = os.getenv("RENDER_COLORSPACE", "rgb").lower()
+RENDER_QUALITY = int(os.getenv("RENDER_QUALITY", "85"))
+RENDER_MAX_LONG_SIDE = int(os.getenv("RENDER_MAX_LONG_SIDE", "2048"))
+RENDER_MAX_SHORT_SIDE = int(os.getenv("RENDER_MAX_SHORT_SIDE", "768"))
+RENDER_PROCESSES = int(os.getenv("RENDER_PROCESSES", "2"))
+
+# Reducción adaptativa de la imagen por página (antes de la llamada de visión)
+# - se rasteriza solo el área con contenido (sin márgenes en blanco), en gris
+#   si la página no tiene color
+# - calidad JPEG/WebP entre RENDER_QUALITY_MIN (páginas simples) y
+#   RENDER_QUALITY (texto denso), según la densidad de bordes (0..1)
+# - las páginas en blanco van en 512 px con detail=low
+# - LOW_DETAIL_COMPLEXITY: bajo esta complejidad también van en 512 px con
+#   detail=low (0 = solo las páginas en blanco). La densidad de bordes no
+#   distingue una página casi vacía de una con poco texto pequeño (una línea
+#   de 8 pt mide ~0.016): subirlo solo tras validar la extracción
+# - TILE_SLACK: un lado que excede un múltiplo de 512 px en menos de esta
+#   fracción se reduce a ese múltiplo (un tile menos)
+RENDER_ADAPTIVE = os.getenv("RENDER_ADAPTIVE", "true").lower() == "true"
+RENDER_QUALITY_MIN = int(os.getenv("RENDER_QUALITY_MIN", "70"))
+RENDER_LOW_DETAIL_COMPLEXITY = float(os.getenv("RENDER_LOW_DETAIL_COMPLEXITY", "0"))
+RENDER_TILE_SLACK = float(os.getenv("RENDER_TILE_SLACK", "0.1"))
+
+# Revisión de páginas: las páginas con capa de texto nativa se extraen localmente
+# sin llamar al modelo de visión
+REVIEW_TEXT_FASTPATH = os.getenv("REVIEW_TEXT_FASTPATH", "true").lower() == "true"
+REVIEW_MIN_CHARS = int(os.getenv("REVIEW_MIN_CHARS", "200"))
+REVIEW_MAX_IMAGE_COVERAGE = float(os.getenv("REVIEW_MAX_IMAGE_COVERAGE", "0.15"))
+
+# Cache de resultados de visión (clave: hash imagen + modelo + versión de prompt)
+VISION_CACHE_ENABLED = os.getenv("VISION_CACHE_ENABLED", "true").lower() == "true"
+VISION_CACHE_PATH = os.getenv("VISION_CACHE_PATH", os.path.join("data", "vision_cache.db"))
+VISION_CACHE_MAX_MB = int(os.getenv("VISION_CACHE_MAX_MB", "512"))
 
 # REDIS_PROTOCOL = "rediss"  ← ESTE NO
 REDIS_PROTOCOL = os.getenv("REDIS_PROTOCOL", "redis")  # ✅ usa este
@@ -0,0 +1,912 @@
+# src/database.py
+#
+# Acceso a la base SQLite de control del ETL (data/etl.db).
+#
+# Este módulo es el único dueño del esquema: las tablas e índices se crean y
+# actualizan mediante migraciones numeradas (PRAGMA user_version), y los nodos
+# usan las funciones de acá en vez de abrir conexiones propias.
+#
+# - Una conexión por hilo (y por proceso), reutilizada entre llamadas
+# - Modo WAL: lectores y un escritor no se bloquean entre sí
+# - Autocommit; las escrituras de varias filas van en transaction()
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from uuid import uuid4
+
+from src.config import ETL_DB_PATH, ETL_DB_JOURNAL_MODE
+
+DB_PATH = ETL_DB_PATH
+
+# Cada migración se aplica una sola vez, en orden; user_version guarda la última
+MIGRATIONS = [
+    # 1: esquema original
+    """
+    CREATE TABLE IF NOT EXISTS files (
+        id TEXT PRIMARY KEY,
+        licitation_id TEXT,
+        filename TEXT,
+        checksum TEXT,
+        status TEXT,
+        created_at TEXT,
+        processed_at TEXT,
+        error TEXT
+    );
+    CREATE TABLE IF NOT EXISTS licitation_claims (
+        licitation_id TEXT PRIMARY KEY,
+        worker_id TEXT,
+        status TEXT,
+        fingerprint TEXT,
+        claimed_at REAL,
+        heartbeat_at REAL,
+        finished_at REAL,
+        error TEXT
+    );
+    """,
+    # 2: índices para las consultas por licitación
+    """
+    CREATE INDEX IF NOT EXISTS idx_files_licitation_status ON files (licitation_id, status);
+    CREATE INDEX IF NOT EXISTS idx_files_licitation_filename ON files (licitation_id, filename);
+    """,
+    # 3: metadatos de archivo para detectar cambios sin recalcular el checksum
+    """
+    ALTER TABLE files ADD COLUMN size INTEGER;
+    ALTER TABLE files ADD COLUMN mtime_ns INTEGER;
+    """,
+    # 4: checkpoints por página del extractor (reanudar documentos largos)
+    """
+    CREATE TABLE IF NOT EXISTS page_checkpoints (
+        document_key TEXT,
+        page INTEGER,
+        source TEXT,
+        render_at REAL,
+        vision_at REAL,
+        embedding_at REAL,
+        persisted_at REAL,
+        result TEXT,
+        error TEXT,
+        PRIMARY KEY (document_key, page)
+    );
+    """,
+    # 5: cola de reintentos de embeddings fallidos
+    """
+    CREATE TABLE IF NOT EXISTS embedding_retries (
+        redis_key TEXT PRIMARY KEY,
+        document_id TEXT,
+        document_folder TEXT,
+        page INTEGER,
+        element INTEGER,
+        text TEXT,
+        type TEXT,
+        status TEXT,
+        attempts INTEGER,
+        next_attempt_at REAL,
+        last_error TEXT,
+        created_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_embedding_retries_due ON embedding_retries (status, next_attempt_at);
+    CREATE INDEX IF NOT EXISTS idx_embedding_retries_document ON embedding_retries (document_id);
+    """,
+    # 6: estimaciones de costo y consumo real (calibración, SJF, presupuesto)
+    """
+    CREATE TABLE IF NOT EXISTS document_costs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        licitation_id TEXT,
+        filename TEXT,
+        pages INTEGER,
+        est_tokens_in INTEGER,
+        est_tokens_out INTEGER,
+        tokens_in INTEGER,
+        tokens_out INTEGER,
+        seconds REAL,
+        created_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_document_costs_created ON document_costs (created_at);
+    CREATE TABLE IF NOT EXISTS licitation_estimates (
+        licitation_id TEXT PRIMARY KEY,
+        fingerprint TEXT,
+        pages INTEGER,
+        tokens_in INTEGER,
+        tokens_out INTEGER,
+        cost_usd REAL,
+        seconds REAL,
+        approved INTEGER DEFAULT 0,
+        computed_at REAL
+    );
+    """,
+    # 7: presupuesto de rate limit por modelo compartido entre procesos (token bucket)
+    """
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        model TEXT PRIMARY KEY,
+        rpm REAL,
+        tpm REAL,
+        requests REAL,
+        tokens REAL,
+        updated_at REAL,
+        blocked_until REAL
+    );
+    """,
+    # 8: modo Batch API (licitaciones encoladas, jobs y embeddings precalculados)
+    """
+    CREATE TABLE IF NOT EXISTS batch_api_licitations (
+        licitation_id TEXT PRIMARY KEY,
+        phase TEXT,
+        created_at REAL,
+        updated_at REAL,
+        error TEXT
+    );
+    CREATE TABLE IF NOT EXISTS batch_api_jobs (
+        id TEXT PRIMARY KEY,
+        licitation_id TEXT,
+        kind TEXT,
+        status TEXT,
+        input_path TEXT,
+        input_file_id TEXT,
+        output_file_id TEXT,
+        error_file_id TEXT,
+        requests INTEGER,
+        completed INTEGER,
+        failed INTEGER,
+        created_at REAL,
+        updated_at REAL,
+        merged_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_batch_api_jobs_licitation ON batch_api_jobs (licitation_id, kind);
+    CREATE TABLE IF NOT EXISTS batch_api_embeddings (
+        model TEXT,
+        text_hash TEXT,
+        vector BLOB,
+        licitation_id TEXT,
+        created_at REAL,
+        PRIMARY KEY (model, text_hash)
+    );
+    CREATE INDEX IF NOT EXISTS idx_batch_api_embeddings_created ON batch_api_embeddings (created_at);
+    """,
+]
+
+_local = threading.local()
+_migrate_lock = threading.Lock()
+_migrated = set()
+
+
+def _open(path: str) -> sqlite3.Connection:
+    carpeta = os.path.dirname(path)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode = {ETL_DB_JOURNAL_MODE}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA busy_timeout = 30000")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -16000")
+    return conn
+
+
+def migrate(conn: sqlite3.Connection) -> None:
+    """Aplica las migraciones pendientes (idempotente, seguro entre procesos)."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for numero, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            for sentencia in script.split(";"):
+                if sentencia.strip():
+                    conn.execute(sentencia)
+            conn.execute(f"PRAGMA user_version = {numero}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Conexión del hilo actual (se crea y migra la primera vez).
+    Después de un fork el proceso hijo abre su propia conexión.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and _local.path == DB_PATH:
+        return conn
+
+    conn = _open(DB_PATH)
+    with _migrate_lock:
+        clave = (os.getpid(), DB_PATH)
+        if clave not in _migrated:
+            migrate(conn)
+            _migrated.add(clave)
+
+    _local.conn = conn
+    _local.pid = os.getpid()
+    _local.path = DB_PATH
+    return conn
+
+
+def close_connection() -> None:
+    """Cierra la conexión del hilo actual (p.ej. al terminar un hilo de larga vida)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection | None = None):
+    """
+    Transacción de escritura (BEGIN IMMEDIATE: toma el lock antes de leer).
+    Hace COMMIT al salir o ROLLBACK si hubo excepción.
+    """
+    conn = conn or get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+# ---------------------------------------------------------------------------
+# Tabla files
+# ---------------------------------------------------------------------------
+
+def get_files(licitation_id: str) -> dict[str, dict]:
+    """Archivos registrados de una licitación, indexados por filename."""
+    rows = get_connection().execute(
+        "SELECT * FROM files WHERE licitation_id = ?",
+        (licitation_id,),
+    ).fetchall()
+    return {r["filename"]: dict(r) for r in rows}
+
+
+def get_new_files(licitation_id: str) -> list[dict]:
+    """Archivos con status = 'NEW' de una licitación."""
+    rows = get_connection().execute(
+        "SELECT * FROM files WHERE licitation_id = ? AND status = 'NEW'",
+        (licitation_id,),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def register_files(licitation_id: str, files: list[dict]) -> None:
+    """
+    Registra archivos nuevos (status NEW) en una sola transacción.
+    files: [{"filename": ..., "checksum": ..., "size": ..., "mtime_ns": ...}, ...]
+    """
+    if not files:
+        return
+    now = datetime.utcnow().isoformat()
+    with transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO files (
+                id, licitation_id, filename, checksum, size, mtime_ns,
+                status, created_at, processed_at, error
+            ) VALUES (?, ?, ?, ?, ?, ?, 'NEW', ?, NULL, NULL)
+            """,
+            [
+                (str(uuid4()), licitation_id, f["filename"], f["checksum"],
+                 f.get("size"), f.get("mtime_ns"), now)
+                for f in files
+            ],
+        )
+
+
+def mark_files_changed(licitation_id: str, files: list[dict]) -> None:
+    """
+    Actualiza el checksum de archivos modificados y los vuelve a NEW.
+    files: [{"filename": ..., "checksum": ..., "size": ..., "mtime_ns": ...}, ...]
+    """
+    if not files:
+        return
+    with transaction() as conn:
+        conn.executemany(
+            """
+            UPDATE files
+            SET checksum = ?, size = ?, mtime_ns = ?, status = 'NEW', error = NULL
+            WHERE licitation_id = ? AND filename = ?
+            """,
+            [
+                (f["checksum"], f.get("size"), f.get("mtime_ns"), licitation_id, f["filename"])
+                for f in files
+            ],
+        )
+
+
+def update_files_stat(licitation_id: str, files: list[dict]) -> None:
+    """
+    Actualiza solo size/mtime_ns (archivos tocados pero con el mismo checksum).
+    files: [{"filename": ..., "size": ..., "mtime_ns": ...}, ...]
+    """
+    if not files:
+        return
+    with transaction() as conn:
+        conn.executemany(
+            """
+            UPDATE files
+            SET size = ?, mtime_ns = ?
+            WHERE licitation_id = ? AND filename = ?
+            """,
+            [(f.get("size"), f.get("mtime_ns"), licitation_id, f["filename"]) for f in files],
+        )
+
+
+def update_file_status(file_id: str, status: str, error: str | None = None) -> None:
+    update_files_status([(file_id, status, error)])
+
+
+def update_files_status(updates: list[tuple[str, str, str | None]]) -> None:
+    """Actualiza status/processed_at/error de varios archivos: [(file_id, status, error), ...]"""
+    if not updates:
+        return
+    with transaction() as conn:
+        conn.executemany(
+            """
+            UPDATE files
+            SET status = ?,
+                processed_at = datetime('now'),
+                error = ?
+            WHERE id = ?
+            """,
+            [(status, error, file_id) for file_id, status, error in updates],
+        )
+
+
+# ---------------------------------------------------------------------------
+# Tabla page_checkpoints
+# ---------------------------------------------------------------------------
+
+PAGE_STAGES = ("render", "vision", "embedding", "persisted")
+
+
+def get_page_checkpoints(document_key: str, source: str) -> dict[int, dict]:
+    """
+    Checkpoints de un documento indexados por página (base 0).
+    Si fueron registrados para otra versión del archivo (source distinto)
+    se descartan y se retorna {}.
+    """
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT * FROM page_checkpoints WHERE document_key = ?",
+        (document_key,),
+    ).fetchall()
+    if any(r["source"] != source for r in rows):
+        clear_page_checkpoints(document_key)
+        return {}
+    return {r["page"]: dict(r) for r in rows}
+
+
+def mark_page_stage(document_key: str, source: str, page: int, stage: str, result: str | None = None) -> None:
+    """
+    Marca una etapa como completada para la página (upsert).
+    result: resultado de la página (JSON) a conservar, normalmente al terminar visión.
+    """
+    if stage not in PAGE_STAGES:
+        raise ValueError(f"Etapa desconocida: {stage}")
+    columna = f"{stage}_at"
+    get_connection().execute(
+        f"""
+        INSERT INTO page_checkpoints (document_key, page, source, {columna}, result, error)
+        VALUES (?, ?, ?, ?, ?, NULL)
+        ON CONFLICT (document_key, page) DO UPDATE SET
+            {columna} = excluded.{columna},
+            result = COALESCE(excluded.result, page_checkpoints.result),
+            error = NULL
+        """,
+        (document_key, page, source, time.time(), result),
+    )
+
+
+def mark_page_error(document_key: str, source: str, page: int, error: str) -> None:
+    get_connection().execute(
+        """
+        INSERT INTO page_checkpoints (document_key, page, source, error)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (document_key, page) DO UPDATE SET error = excluded.error
+        """,
+        (document_key, page, source, error),
+    )
+
+
+def clear_page_checkpoints(document_key: str) -> None:
+    get_connection().execute(
+        "DELETE FROM page_checkpoints WHERE document_key = ?",
+        (document_key,),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Tabla embedding_retries
+# ---------------------------------------------------------------------------
+
+def enqueue_embedding_retries(items: list[dict]) -> None:
+    """
+    Encola (o actualiza) items a re-embeber. Un item ya encolado conserva sus
+    intentos pero toma el texto nuevo y queda disponible de inmediato.
+    items: [{"redis_key", "document_id", "document_folder", "page", "element",
+             "text", "type", "error"}, ...]
+    """
+    if not items:
+        return
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO embedding_retries (
+                redis_key, document_id, document_folder, page, element, text, type,
+                status, attempts, next_attempt_at, last_error, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', 0, ?, ?, ?)
+            ON CONFLICT (redis_key) DO UPDATE SET
+                document_folder = excluded.document_folder,
+                text = excluded.text,
+                type = excluded.type,
+                status = 'pending',
+                next_attempt_at = excluded.next_attempt_at,
+                last_error = excluded.last_error
+            """,
+            [
+                (i["redis_key"], i["document_id"], i["document_folder"], i["page"], i.get("element"),
+                 i["text"], i.get("type"), now, i.get("error"), now)
+                for i in items
+            ],
+        )
+
+
+def claim_due_embedding_retries(limit: int, lease_seconds: float) -> list[dict]:
+    """
+    Toma hasta `limit` items vencidos y los reserva por lease_seconds para que
+    otro worker no los procese al mismo tiempo.
+    """
+    now = time.time()
+    with transaction() as conn:
+        rows = conn.execute(
+            """
+            SELECT * FROM embedding_retries
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY next_attempt_at
+            LIMIT ?
+            """,
+            (now, limit),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE embedding_retries SET next_attempt_at = ? WHERE redis_key = ?",
+            [(now + lease_seconds, r["redis_key"]) for r in rows],
+        )
+    return [dict(r) for r in rows]
+
+
+def has_embedding_retries(document_id: str) -> bool:
+    return get_connection().execute(
+        "SELECT 1 FROM embedding_retries WHERE document_id = ? LIMIT 1",
+        (document_id,),
+    ).fetchone() is not None
+
+
+def count_embedding_retries() -> dict[str, int]:
+    """Items en la cola por status (pending / dead)."""
+    rows = get_connection().execute(
+        "SELECT status, COUNT(*) FROM embedding_retries GROUP BY status"
+    ).fetchall()
+    return {status: n for status, n in rows}
+
+
+def delete_embedding_retries(redis_keys: list[str]) -> None:
+    if not redis_keys:
+        return
+    with transaction() as conn:
+        conn.executemany(
+            "DELETE FROM embedding_retries WHERE redis_key = ?",
+            [(k,) for k in redis_keys],
+        )
+
+
+def reschedule_embedding_retries(updates: list[tuple[str, int, float, str, str]]) -> None:
+    """Registra intentos fallidos: [(redis_key, attempts, next_attempt_at, status, error), ...]"""
+    if not updates:
+        return
+    with transaction() as conn:
+        conn.executemany(
+            """
+            UPDATE embedding_retries
+            SET attempts = ?, next_attempt_at = ?, status = ?, last_error = ?
+            WHERE redis_key = ?
+            """,
+            [(attempts, next_at, status, error, key) for key, attempts, next_at, status, error in updates],
+        )
+
+
+# ---------------------------------------------------------------------------
+# Tabla licitation_claims
+# ---------------------------------------------------------------------------
+# La política (qué claim impide reclamar) es de quien llama: acá solo el acceso.
+
+def get_claims() -> dict[str, tuple]:
+    """{licitation_id: (status, fingerprint, heartbeat_at, finished_at)} de todos los claims."""
+    return {
+        row[0]: tuple(row[1:])
+        for row in get_connection().execute(
+            "SELECT licitation_id, status, fingerprint, heartbeat_at, finished_at FROM licitation_claims"
+        )
+    }
+
+
+def claim_licitation(licitation_id: str, fingerprint: str, worker_id: str, omitir) -> bool:
+    """
+    Reclama la licitación de forma atómica (BEGIN IMMEDIATE toma el lock de
+    escritura antes de leer). omitir(claim, ahora) recibe el claim actual
+    (status, fingerprint, heartbeat_at, finished_at) y retorna True si impide
+    reclamarla. Retorna True si worker_id quedó como dueño.
+    """
+    ahora = time.time()
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT status, fingerprint, heartbeat_at, finished_at FROM licitation_claims WHERE licitation_id = ?",
+            (licitation_id,),
+        ).fetchone()
+
+        if row is not None and omitir(tuple(row), ahora):
+            conn.execute("ROLLBACK")
+            return False
+
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO licitation_claims (
+                licitation_id, worker_id, status, fingerprint,
+                claimed_at, heartbeat_at, finished_at, error
+            ) VALUES (?, ?, 'claimed', ?, ?, ?, NULL, NULL)
+            """,
+            (licitation_id, worker_id, fingerprint, ahora, ahora),
+        )
+        conn.execute("COMMIT")
+        return True
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def release_licitation(licitation_id: str, worker_id: str, status: str, error: str | None = None) -> None:
+    """Cierra el claim de worker_id con el status final (done, failed, paused, batch...)."""
+    get_connection().execute(
+        """
+        UPDATE licitation_claims
+        SET status = ?, finished_at = ?, error = ?
+        WHERE licitation_id = ? AND worker_id = ?
+        """,
+        (status, time.time(), error, licitation_id, worker_id),
+    )
+
+
+def heartbeat_licitation(licitation_id: str, worker_id: str) -> bool:
+    """Renueva el claim vigente de worker_id. Retorna False si ya no es suyo."""
+    cur = get_connection().execute(
+        """
+        UPDATE licitation_claims SET heartbeat_at = ?
+        WHERE licitation_id = ? AND worker_id = ? AND status = 'claimed'
+        """,
+        (time.time(), licitation_id, worker_id),
+    )
+    return cur.rowcount > 0
+
+
+# ---------------------------------------------------------------------------
+# Tablas document_costs / licitation_estimates
+# ---------------------------------------------------------------------------
+
+def record_document_cost(licitation_id: str, filename: str, pages: int, est_tokens_in: int,
+                         est_tokens_out: int, tokens_in: int, tokens_out: int, seconds: float) -> None:
+    """Consumo real de un documento junto a su estimación sin calibrar."""
+    get_connection().execute(
+        """
+        INSERT INTO document_costs (
+            licitation_id, filename, pages, est_tokens_in, est_tokens_out,
+            tokens_in, tokens_out, seconds, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (licitation_id, filename, pages, est_tokens_in, est_tokens_out,
+         tokens_in, tokens_out, seconds, time.time()),
+    )
+
+
+def get_cost_history(limit: int) -> dict:
+    """Sumas de los últimos `limit` documentos estimados que llamaron al modelo (para calibrar)."""
+    row = get_connection().execute(
+        """
+        SELECT COUNT(*) AS n,
+               COALESCE(SUM(pages), 0) AS pages,
+               COALESCE(SUM(est_tokens_in), 0) AS est_tokens_in,
+               COALESCE(SUM(est_tokens_out), 0) AS est_tokens_out,
+               COALESCE(SUM(tokens_in), 0) AS tokens_in,
+               COALESCE(SUM(tokens_out), 0) AS tokens_out,
+               COALESCE(SUM(seconds), 0) AS seconds
+        FROM (
+            SELECT * FROM document_costs
+            WHERE pages > 0 AND est_tokens_in > 0 AND tokens_in > 0
+            ORDER BY id DESC
+            LIMIT ?
+        )
+        """,
+        (limit,),
+    ).fetchone()
+    return dict(row)
+
+
+def tokens_used_since(since: float) -> int:
+    return get_connection().execute(
+        "SELECT COALESCE(SUM(tokens_in + tokens_out), 0) FROM document_costs WHERE created_at >= ?",
+        (since,),
+    ).fetchone()[0]
+
+
+def get_licitation_estimates() -> dict[str, dict]:
+    rows = get_connection().execute("SELECT * FROM licitation_estimates").fetchall()
+    return {r["licitation_id"]: dict(r) for r in rows}
+
+
+def save_licitation_estimate(licitation_id: str, fingerprint: str | None, estimate: dict) -> None:
+    """Guarda la estimación de una licitación (conserva la aprobación de presupuesto)."""
+    get_connection().execute(
+        """
+        INSERT INTO licitation_estimates (
+            licitation_id, fingerprint, pages, tokens_in, tokens_out, cost_usd, seconds, computed_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (licitation_id) DO UPDATE SET
+            fingerprint = COALESCE(excluded.fingerprint, licitation_estimates.fingerprint),
+            pages = excluded.pages,
+            tokens_in = excluded.tokens_in,
+            tokens_out = excluded.tokens_out,
+            cost_usd = excluded.cost_usd,
+            seconds = excluded.seconds,
+            computed_at = excluded.computed_at
+        """,
+        (licitation_id, fingerprint, estimate["pages"], estimate["tokens_in"], estimate["tokens_out"],
+         estimate["cost_usd"], estimate["seconds"], time.time()),
+    )
+
+
+def is_licitation_approved(licitation_id: str) -> bool:
+    row = get_connection().execute(
+        "SELECT approved FROM licitation_estimates WHERE licitation_id = ?",
+        (licitation_id,),
+    ).fetchone()
+    return bool(row and row["approved"])
+
+
+def approve_licitation(licitation_id: str) -> None:
+    """Autoriza una licitación pausada por presupuesto y la deja lista para reclamarse."""
+    with transaction() as conn:
+        conn.execute(
+            """
+            INSERT INTO licitation_estimates (licitation_id, approved, pages, tokens_in, tokens_out,
+                                              cost_usd, seconds, computed_at)
+            VALUES (?, 1, 0, 0, 0, 0, 0, ?)
+            ON CONFLICT (licitation_id) DO UPDATE SET approved = 1
+            """,
+            (licitation_id, time.time()),
+        )
+        conn.execute(
+            "DELETE FROM licitation_claims WHERE licitation_id = ? AND status = 'paused'",
+            (licitation_id,),
+        )
+
+
+# ---------------------------------------------------------------------------
+# Tabla rate_limits
+# ---------------------------------------------------------------------------
+
+def _rate_bucket(conn: sqlite3.Connection, model: str, rpm: float, tpm: float,
+                 burst_seconds: float, now: float) -> dict:
+    """Bucket del modelo con la recarga desde la última actualización (sin guardar)."""
+    row = conn.execute("SELECT * FROM rate_limits WHERE model = ?", (model,)).fetchone()
+    if row is None:
+        fraccion = burst_seconds / 60
+        return {"rpm": rpm, "tpm": tpm, "requests": rpm * fraccion, "tokens": tpm * fraccion,
+                "blocked_until": 0.0}
+    bucket = dict(row)
+    fraccion = burst_seconds / 60
+    transcurrido = max(0.0, now - bucket["updated_at"]) / 60
+    bucket["requests"] = min(bucket["rpm"] * fraccion, bucket["requests"] + transcurrido * bucket["rpm"])
+    bucket["tokens"] = min(bucket["tpm"] * fraccion, bucket["tokens"] + transcurrido * bucket["tpm"])
+    return bucket
+
+
+def _save_rate_bucket(conn: sqlite3.Connection, model: str, bucket: dict, now: float) -> None:
+    conn.execute(
+        """
+        INSERT INTO rate_limits (model, rpm, tpm, requests, tokens, updated_at, blocked_until)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (model) DO UPDATE SET
+            rpm = excluded.rpm,
+            tpm = excluded.tpm,
+            requests = excluded.requests,
+            tokens = excluded.tokens,
+            updated_at = excluded.updated_at,
+            blocked_until = excluded.blocked_until
+        """,
+        (model, bucket["rpm"], bucket["tpm"], bucket["requests"], bucket["tokens"], now,
+         bucket["blocked_until"]),
+    )
+
+
+def acquire_rate_budget(model: str, tokens: int, rpm: float, tpm: float, burst_seconds: float) -> float:
+    """
+    Descuenta un request y `tokens` del bucket del modelo si alcanzan.
+    Retorna 0 si se reservó o los segundos a esperar antes de reintentar.
+    rpm/tpm se usan solo si el modelo aún no tiene fila (después mandan los
+    límites guardados por update_rate_budget). Un request más grande que la
+    capacidad del bucket pasa cuando el bucket está lleno.
+    """
+    now = time.time()
+    with transaction() as conn:
+        bucket = _rate_bucket(conn, model, rpm, tpm, burst_seconds, now)
+        if bucket["blocked_until"] > now:
+            espera = bucket["blocked_until"] - now
+        else:
+            necesarios = min(tokens, bucket["tpm"] * burst_seconds / 60)
+            espera = 0.0
+            if bucket["requests"] < 1:
+                espera = (1 - bucket["requests"]) * 60 / bucket["rpm"]
+            if bucket["tokens"] < necesarios:
+                espera = max(espera, (necesarios - bucket["tokens"]) * 60 / bucket["tpm"])
+            if espera == 0:
+                bucket["requests"] -= 1
+                bucket["tokens"] -= tokens
+        _save_rate_bucket(conn, model, bucket, now)
+    return espera
+
+
+def update_rate_budget(model: str, burst_seconds: float, tokens_delta: float = 0,
+                       rpm: float | None = None, tpm: float | None = None,
+                       remaining_requests: float | None = None, remaining_tokens: float | None = None,
+                       blocked_until: float | None = None) -> None:
+    """
+    Ajusta el bucket con lo que informó la API:
+    - tokens_delta: diferencia entre la estimación reservada y el consumo real
+    - rpm/tpm: límites de los headers x-ratelimit-limit-*
+    - remaining_*: si la API ve menos cupo que el bucket (otros clientes con
+      la misma key), el bucket baja a ese valor
+    - blocked_until: nadie llama al modelo antes de ese instante (429)
+    """
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute("SELECT 1 FROM rate_limits WHERE model = ?", (model,)).fetchone()
+        if row is None:
+            return
+        bucket = _rate_bucket(conn, model, 0, 0, burst_seconds, now)
+        bucket["tokens"] += tokens_delta
+        if rpm:
+            bucket["rpm"] = rpm
+        if tpm:
+            bucket["tpm"] = tpm
+        if remaining_requests is not None:
+            bucket["requests"] = min(bucket["requests"], remaining_requests)
+        if remaining_tokens is not None:
+            bucket["tokens"] = min(bucket["tokens"], remaining_tokens)
+        if blocked_until:
+            bucket["blocked_until"] = max(bucket["blocked_until"] or 0.0, blocked_until)
+        _save_rate_bucket(conn, model, bucket, now)
+
+
+# ---------------------------------------------------------------------------
+# Tablas batch_api_* (modo Batch API)
+# ---------------------------------------------------------------------------
+
+def get_batch_licitations(phases: tuple[str, ...] | None = None) -> list[dict]:
+    """Licitaciones del modo Batch API (opcionalmente solo las de ciertas fases)."""
+    rows = get_connection().execute(
+        "SELECT * FROM batch_api_licitations ORDER BY created_at"
+    ).fetchall()
+    return [dict(r) for r in rows if phases is None or r["phase"] in phases]
+
+
+def set_batch_phase(licitation_id: str, phase: str, error: str | None = None) -> None:
+    now = time.time()
+    get_connection().execute(
+        """
+        INSERT INTO batch_api_licitations (licitation_id, phase, created_at, updated_at, error)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (licitation_id) DO UPDATE SET
+            phase = excluded.phase,
+            updated_at = excluded.updated_at,
+            error = excluded.error
+        """,
+        (licitation_id, phase, now, now, error),
+    )
+
+
+def release_batch_licitation(licitation_id: str) -> None:
+    """Quita el claim 'batch': la licitación vuelve a ser reclamable por los workers."""
+    get_connection().execute(
+        "DELETE FROM licitation_claims WHERE licitation_id = ? AND status = 'batch'",
+        (licitation_id,),
+    )
+
+
+def insert_batch_job(job: dict) -> None:
+    now = time.time()
+    get_connection().execute(
+        """
+        INSERT INTO batch_api_jobs (
+            id, licitation_id, kind, status, input_path, input_file_id,
+            requests, completed, failed, created_at, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?)
+        """,
+        (job["id"], job["licitation_id"], job["kind"], job["status"], job["input_path"],
+         job["input_file_id"], job["requests"], now, now),
+    )
+
+
+def update_batch_job(job_id: str, **campos) -> None:
+    """Actualiza columnas del job (status, output_file_id, error_file_id, completed, failed, merged_at)."""
+    permitidas = {"status", "output_file_id", "error_file_id", "completed", "failed", "merged_at"}
+    desconocidas = set(campos) - permitidas
+    if desconocidas:
+        raise ValueError(f"Columnas desconocidas: {', '.join(sorted(desconocidas))}")
+    asignaciones = ", ".join(f"{c} = ?" for c in campos)
+    get_connection().execute(
+        f"UPDATE batch_api_jobs SET {asignaciones}, updated_at = ? WHERE id = ?",
+        (*campos.values(), time.time(), job_id),
+    )
+
+
+def get_batch_jobs(licitation_id: str, kind: str | None = None) -> list[dict]:
+    if kind is None:
+        rows = get_connection().execute(
+            "SELECT * FROM batch_api_jobs WHERE licitation_id = ? ORDER BY created_at",
+            (licitation_id,),
+        ).fetchall()
+    else:
+        rows = get_connection().execute(
+            "SELECT * FROM batch_api_jobs WHERE licitation_id = ? AND kind = ? ORDER BY created_at",
+            (licitation_id, kind),
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def save_batch_embeddings(model: str, licitation_id: str, vectors: list[tuple[str, bytes]]) -> None:
+    """Guarda vectores precalculados: [(text_hash, vector_bytes), ...]"""
+    if not vectors:
+        return
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO batch_api_embeddings (model, text_hash, vector, licitation_id, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [(model, text_hash, vector, licitation_id, now) for text_hash, vector in vectors],
+        )
+
+
+def get_batch_embeddings(model: str, text_hashes: list[str]) -> dict[str, bytes]:
+    """Vectores precalculados de los hashes pedidos ({text_hash: bytes})."""
+    conn = get_connection()
+    vectores = {}
+    for i in range(0, len(text_hashes), 500):
+        parte = text_hashes[i:i + 500]
+        rows = conn.execute(
+            f"""
+            SELECT text_hash, vector FROM batch_api_embeddings
+            WHERE model = ? AND text_hash IN ({", ".join("?" * len(parte))})
+            """,
+            (model, *parte),
+        ).fetchall()
+        vectores.update((r["text_hash"], r["vector"]) for r in rows)
+    return vectores
+
+
+def has_batch_embeddings() -> bool:
+    return get_connection().execute("SELECT 1 FROM batch_api_embeddings LIMIT 1").fetchone() is not None
+
+
+def purge_batch_embeddings(older_than: float) -> int:
+    cur = get_connection().execute(
+        "DELETE FROM batch_api_embeddings WHERE created_at < ?",
+        (older_than,),
+    )
+    return cur.rowcount
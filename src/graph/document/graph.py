@@ -1,33 +1,54 @@
 # src/graph/etl/document/graph.py
 
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 
 from src.graph.document.nodes.start import DocumentStartNode
 from src.graph.document.nodes.review import DocumentReviewNode
 from src.graph.document.nodes.extractor import DocumentExtractorNode
+from src.metrics import instrumentar
 
 
 def document_start_node(state: dict) -> dict:
-    print("➡️ Entrando al subgrafo document: start")
     return DocumentStartNode.execute(state)
 
 
 def document_review_node(state: dict) -> dict:
-    print("➡️ Entrando al subgrafo document: review (desactivo por ahora)")
     return DocumentReviewNode.execute(state)
 
 
 def document_extractor_node(state: dict) -> dict:
-    print("➡️ Entrando al subgrafo document: extractor")
     return DocumentExtractorNode.execute(state)
 
 
+async def document_start_node_async(state: dict) -> dict:
+    return await DocumentStartNode.aexecute(state)
+
+
+async def document_review_node_async(state: dict) -> dict:
+    return await DocumentReviewNode.aexecute(state)
+
+
+async def document_extractor_node_async(state: dict) -> dict:
+    return await DocumentExtractorNode.aexecute(state)
+
+
+def _nodo(nombre, funcion, funcion_async):
+    """Nodo que usa funcion con graph.invoke y funcion_async con graph.ainvoke."""
+    return RunnableLambda(
+        instrumentar("document", nombre, funcion),
+        afunc=instrumentar("document", nombre, funcion_async),
+        name=nombre,
+    )
+
+
 def build_document_graph():
+    """Subgrafo de documentos: ejecutable con invoke (hilos) o ainvoke (asyncio)."""
     graph = StateGraph(dict)
 
-    graph.add_node("start", document_start_node)
-    graph.add_node("review", document_review_node)
-    graph.add_node("extractor", document_extractor_node)
+    graph.add_node("start", _nodo("start", document_start_node, document_start_node_async))
+    graph.add_node("review", _nodo("review", document_review_node, document_review_node_async))
+    graph.add_node("extractor", _nodo("extractor", document_extractor_node, document_extractor_node_async))
 
     graph.set_entry_point("start")
     graph.add_edge("start", "review")
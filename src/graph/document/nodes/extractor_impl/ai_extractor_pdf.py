@@ -2,46 +2,29 @@
 
 import re
 import base64
+import hashlib
 import json
+import logging
 import time
+import threading
 from datetime import datetime
-import openai
-from src.config import API_KEY
 from .pdf_utils import extract_page_image
-from tiktoken import encoding_for_model, get_encoding
+from .renderer import MIME_TYPES
+from .image_preprocess import detalle_imagen
+from .openai_client import get_openai_client, get_async_openai_client
+from .rate_limiter import limitador
+from src.config import RENDER_FORMAT, MODEL_VISION, COST_TOKENS_OUT_PER_PAGE
+from src import metrics
 
-# Cliente OpenAI con visión habilitada
-client = openai.OpenAI(api_key=API_KEY)
+log = logging.getLogger(__name__)
 
 # Contador global de llamadas (para debug)
 _request_count = 0
+_request_lock = threading.Lock()
 
-def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
-    """Cuenta tokens como respaldo cuando usage no está disponible."""
-    try:
-        enc = encoding_for_model(model)
-    except Exception:
-        enc = get_encoding("cl100k_base")
-    return len(enc.encode(text))
-
-def analyze_page_with_gpt(pdf_path: str, page_number: int, timeout: float = 60.0):
-    """
-    Envía la página como imagen a GPT-4o y limpia fences Markdown.
-    Retorna: elementos (lista), raw (JSON limpio), tokens_in, tokens_out.
-    """
-    global _request_count
-    _request_count += 1
-
-    print(f"[Extractor] ({_request_count}) → {datetime.now():%H:%M:%S} "
-          f"Iniciando análisis de página {page_number+1} de '{pdf_path}'")
-
-    # 1) Extraer imagen y codificar a Base64
-    img_bytes = extract_page_image(pdf_path, page_number)
-    img_b64 = base64.b64encode(img_bytes).decode('utf-8')
-    print(f"[Extractor]   • Imagen convertida a base64 (bytes={len(img_bytes)})")
-
-    # 2) Construir prompt (completo)
-    system_msg = (
+# Prompt de sistema para el análisis de páginas.
+# PROMPT_VERSION cambia automáticamente si se modifica el prompt (invalida el cache de visión).
+SYSTEM_PROMPT = (
         '''
         Eres un asistente experto en analizar páginas de documentos PDF escaneados.
 
@@ -83,32 +66,134 @@ def analyze_page_with_gpt(pdf_path: str, page_number: int, timeout: float = 60.0
         "metadatos": {}
         }
         '''
-    )
-    messages = [
-        {"role": "system", "content": system_msg},
-        {"role": "user", "content": [
-            {"type": "text", "text": f"Página {page_number+1}: analiza esta imagen."},
-            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_b64}"}}
-        ]}
-    ]
-    print(f"[Extractor]   • Prompt armado, mensajes={len(messages)} entradas")
+)
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Cuenta tokens como respaldo cuando usage no está disponible."""
+    from tiktoken import encoding_for_model, get_encoding
+
+    try:
+        enc = encoding_for_model(model)
+    except Exception:
+        enc = get_encoding("cl100k_base")
+    return len(enc.encode(text))
+
+def tokens_estimados_pagina() -> int:
+    """
+    Tokens de un request de visión antes de conocer su usage (reserva inicial
+    del rate limiter): prompt + página carta en detail=high + salida típica.
+    """
+    from src.graph.etl.nodes.cost_impl.estimator import tokens_imagen, tokens_prompt
+
+    return tokens_prompt() + tokens_imagen(612, 792) + COST_TOKENS_OUT_PER_PAGE
+
 
-    # 3) Llamada al modelo
+def _limitador():
+    return limitador(MODEL_VISION, "vision", tokens_estimados_pagina())
+
+
+def analyze_page_with_gpt(pdf_path: str, page_number: int, timeout: float = 60.0):
+    """
+    Envía la página como imagen a GPT-4o y limpia fences Markdown.
+    Retorna: elementos (lista), raw (JSON limpio), tokens_in, tokens_out.
+    """
+    log.debug(f"[Extractor] {datetime.now():%H:%M:%S} "
+              f"Iniciando análisis de página {page_number+1} de '{pdf_path}'")
+
+    img_bytes = extract_page_image(pdf_path, page_number)
+    return analyze_page_image(img_bytes, page_number, timeout=timeout, mime_type=MIME_TYPES[RENDER_FORMAT])
+
+
+def analyze_page_image(img_bytes: bytes, page_number: int, timeout: float = 60.0, mime_type: str = "image/png"):
+    """
+    Igual que analyze_page_with_gpt pero recibe la imagen ya renderizada
+    (usado por el pipeline, que renderiza en su propia etapa).
+    Retorna: elementos (lista), raw (JSON limpio), tokens_in, tokens_out.
+    Si la llamada falla después de los reintentos del rate limiter se lanza
+    la excepción (la página queda con error, no vacía).
+    """
+    request_id, messages = _preparar_request(img_bytes, page_number, mime_type)
+
+    # 3) Llamada al modelo (cupo RPM/TPM, 429 y reintentos en el rate limiter)
     try:
         t0 = time.time()
-        print(f"[Extractor]   • {datetime.now():%H:%M:%S} Antes de OpenAI request")
-        resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0,
-            timeout=timeout
+        log.debug(f"[Extractor]   • {datetime.now():%H:%M:%S} Antes de OpenAI request")
+        resp = _limitador().llamar(
+            lambda: get_openai_client().chat.completions.with_raw_response.create(
+                model=MODEL_VISION,
+                messages=messages,
+                temperature=0,
+                timeout=timeout
+            )
         )
         dt = time.time() - t0
-        print(f"[Extractor]   • {datetime.now():%H:%M:%S} Después de OpenAI ({dt:.1f}s)")
+        metrics.STAGE_SECONDS.observe(dt, stage="vision")
+        log.debug(f"[Extractor]   • {datetime.now():%H:%M:%S} Después de OpenAI ({dt:.1f}s)")
     except Exception as e:
-        print(f"[Extractor]   ✖ Error o Timeout en llamada #{_request_count}: {e}")
-        return [], "{}", 0, 0
+        log.error(f"[Extractor]   ✖ Error o Timeout en llamada #{request_id}: {e}")
+        metrics.ERRORS.inc(operation="vision")
+        raise
+
+    return _procesar_respuesta(resp, messages, page_number)
+
+
+async def analyze_page_image_async(img_bytes: bytes, page_number: int, timeout: float = 60.0,
+                                   mime_type: str = "image/png"):
+    """analyze_page_image con AsyncOpenAI: la espera del modelo no ocupa un hilo."""
+    request_id, messages = _preparar_request(img_bytes, page_number, mime_type)
+
+    try:
+        t0 = time.time()
+        resp = await _limitador().allamar(
+            lambda: get_async_openai_client().chat.completions.with_raw_response.create(
+                model=MODEL_VISION,
+                messages=messages,
+                temperature=0,
+                timeout=timeout
+            )
+        )
+        dt = time.time() - t0
+        metrics.STAGE_SECONDS.observe(dt, stage="vision")
+        log.debug(f"[Extractor]   • ({request_id}) Después de OpenAI async ({dt:.1f}s)")
+    except Exception as e:
+        log.error(f"[Extractor]   ✖ Error o Timeout en llamada #{request_id}: {e}")
+        metrics.ERRORS.inc(operation="vision")
+        raise
+
+    return _procesar_respuesta(resp, messages, page_number)
+
+
+def _preparar_request(img_bytes: bytes, page_number: int, mime_type: str):
+    """Numera la llamada y arma los mensajes (prompt + imagen en base64)."""
+    global _request_count
+    with _request_lock:
+        _request_count += 1
+        request_id = _request_count
+
+    log.debug(f"[Extractor] ({request_id}) → {datetime.now():%H:%M:%S} "
+              f"Analizando imagen de página {page_number+1}")
+
+    # 1) Codificar imagen a Base64 (detail según el tamaño: low si cabe en 512 × 512)
+    img_b64 = base64.b64encode(img_bytes).decode('utf-8')
+    detail = detalle_imagen(img_bytes)
+    metrics.VISION_IMAGE_BYTES.inc(len(img_bytes), detail=detail)
+    log.debug(f"[Extractor]   • Imagen convertida a base64 (bytes={len(img_bytes)}, detail={detail})")
+
+    # 2) Construir prompt (completo)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": [
+            {"type": "text", "text": f"Página {page_number+1}: analiza esta imagen."},
+            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{img_b64}", "detail": detail}}
+        ]}
+    ]
+    log.debug(f"[Extractor]   • Prompt armado, mensajes={len(messages)} entradas")
+    return request_id, messages
+
 
+def _procesar_respuesta(resp, messages, page_number: int):
+    """Limpia fences Markdown, parsea los elementos y cuenta tokens."""
     # 4) Procesar respuesta
     raw = resp.choices[0].message.content.strip()
     raw = re.sub(r"^```(?:json)?\s*", "", raw, flags=re.MULTILINE)
@@ -117,15 +202,18 @@ def analyze_page_with_gpt(pdf_path: str, page_number: int, timeout: float = 60.0
     try:
         data = json.loads(raw)
         elementos = data.get('elementos', [])
-        print(f"[Extractor]   • JSON parseado, elementos={len(elementos)}")
+        log.debug(f"[Extractor]   • JSON parseado, elementos={len(elementos)}")
     except json.JSONDecodeError:
-        print(f"[Extractor]   ✖ JSON inválido página {page_number+1}. Fragmento: {raw[:200].replace(chr(10), ' ')}…")
+        log.error(f"[Extractor]   ✖ JSON inválido página {page_number+1}. Fragmento: {raw[:200].replace(chr(10), ' ')}…")
+        metrics.ERRORS.inc(operation="vision_json")
         elementos = []
 
     # 5) Tokens
     usage = getattr(resp, 'usage', None)
     tokens_in  = usage.prompt_tokens    if usage else count_tokens(json.dumps(messages))
     tokens_out = usage.completion_tokens if usage else count_tokens(raw)
-    print(f"[Extractor]   • Tokens → in={tokens_in}, out={tokens_out}")
+    log.debug(f"[Extractor]   • Tokens → in={tokens_in}, out={tokens_out}")
+    metrics.TOKENS.inc(tokens_in, kind="vision_in")
+    metrics.TOKENS.inc(tokens_out, kind="vision_out")
 
     return elementos, raw, tokens_in, tokens_out
@@ -0,0 +1,394 @@
+# batch_api.py
+#
+# Modo Batch API de OpenAI para licitaciones no urgentes (~50% del costo por
+# token, resultados dentro de BATCH_API_COMPLETION_WINDOW). Es una etapa
+# previa al procesamiento normal de la licitación:
+#
+#   1. visión: las páginas que irían al modelo se escriben como requests JSONL
+#      (el mismo request que el extractor en vivo), se suben y se encolan; los
+#      resultados se guardan en el cache de visión
+#   2. embeddings: los textos de todas las páginas (visión desde el cache,
+#      texto nativo extraído localmente) se encolan igual; los vectores quedan
+#      en la tabla batch_api_embeddings de etl.db
+#   3. la licitación se libera a los workers (py -m src.batch): el pipeline
+#      encuentra la visión en el cache y los embeddings precalculados, y
+#      escribe los mismos JSON por página, claves Redis e índice vectorial
+#
+# Lo que el batch no resolvió (requests fallidos, batch expirado) se procesa
+# en vivo en el paso 3.
+
+import base64
+import json
+import logging
+import os
+import shutil
+import time
+
+from .ai_extractor_pdf import PROMPT_VERSION, _preparar_request, _procesar_respuesta
+from .embeddings import MAX_TOKENS_POR_TEXTO, contar_tokens_embedding, empaquetar_lotes, hash_texto
+from .openai_client import get_openai_client
+from .pipeline import textos_de_pagina
+from .renderer import PdfRenderer, documento
+from .text_extractor import clasificar_pagina, extraer_pagina_texto, PAGINA_TEXTO
+from .vision_cache import VisionCache, get_vision_cache
+from src import database
+from src.config import (
+    MODEL_VISION,
+    MODEL_EMBEDDING,
+    REVIEW_TEXT_FASTPATH,
+    BATCH_API_DIR,
+    BATCH_API_MAX_FILE_MB,
+    BATCH_API_MAX_REQUESTS,
+    BATCH_API_COMPLETION_WINDOW,
+)
+
+log = logging.getLogger(__name__)
+
+ENDPOINT_VISION = "/v1/chat/completions"
+ENDPOINT_EMBEDDING = "/v1/embeddings"
+
+# Estados de batch en los que ya no cambia nada
+TERMINALES = ("completed", "failed", "expired", "cancelled")
+
+
+class EscritorJsonl:
+    """
+    Escribe requests en archivos JSONL de entrada, abriendo uno nuevo cuando
+    el actual alcanzaría el tamaño o la cantidad de unidades máxima (requests,
+    o inputs en embeddings: la API limita ambos por batch).
+    """
+
+    def __init__(self, carpeta, prefijo, max_bytes=None, max_unidades=None):
+        self.carpeta = carpeta
+        self.prefijo = prefijo
+        self.max_bytes = max_bytes or BATCH_API_MAX_FILE_MB * 1024 * 1024
+        self.max_unidades = max_unidades or BATCH_API_MAX_REQUESTS
+        self.archivos = []  # [(path, requests)]
+        self._f = None
+        self._bytes = self._unidades = 0
+
+    def __enter__(self):
+        os.makedirs(self.carpeta, exist_ok=True)
+        return self
+
+    def agregar(self, request: dict, unidades: int = 1) -> None:
+        linea = (json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8")
+        if self._f is not None and (self._bytes + len(linea) > self.max_bytes
+                                    or self._unidades + unidades > self.max_unidades):
+            self._cerrar()
+        if self._f is None:
+            path = os.path.join(self.carpeta, f"{self.prefijo}_{len(self.archivos) + 1:03d}.jsonl")
+            self._f = open(path, "wb")
+            self.archivos.append([path, 0])
+        self._f.write(linea)
+        self._bytes += len(linea)
+        self._unidades += unidades
+        self.archivos[-1][1] += 1
+
+    def _cerrar(self):
+        self._f.close()
+        self._f = None
+        self._bytes = self._unidades = 0
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._f is not None:
+            self._cerrar()
+        return False
+
+
+# ---------------------------------------------------------------------------
+# Preparación de requests
+# ---------------------------------------------------------------------------
+
+def documentos_pdf(licitation_dir: str) -> list[str]:
+    rutas = []
+    for root, dirs, files in os.walk(licitation_dir):
+        dirs.sort()
+        rutas.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(".pdf"))
+    return rutas
+
+
+def _tipos_paginas(doc) -> list[str]:
+    """Clasificación de DocumentReviewNode (vacía si el fast path está desactivado)."""
+    if not REVIEW_TEXT_FASTPATH:
+        return []
+    return [clasificar_pagina(page) for page in doc]
+
+
+def _paginas_vision(pdf_path: str, renderer: PdfRenderer):
+    """Genera (page_number, img_bytes) de las páginas que el pipeline enviaría al modelo."""
+    with documento(pdf_path) as doc:
+        tipos = _tipos_paginas(doc)
+        total = doc.page_count
+    paginas = [i for i in range(total) if i >= len(tipos) or tipos[i] != PAGINA_TEXTO]
+    for page_number, img_bytes in renderer.iter_pages(pdf_path, paginas):
+        if img_bytes is not None:
+            yield page_number, img_bytes
+
+
+def preparar_vision(licitation_dir: str, carpeta: str) -> list:
+    """
+    Escribe los requests de visión de las páginas que no están en el cache.
+    Retorna [(path, requests)] de los archivos de entrada.
+    """
+    cache = _cache()
+    renderer = PdfRenderer()
+    vistas = set()
+    with EscritorJsonl(carpeta, "vision") as escritor:
+        for pdf_path in documentos_pdf(licitation_dir):
+            for page_number, img_bytes in _paginas_vision(pdf_path, renderer):
+                clave = VisionCache.clave(img_bytes, MODEL_VISION, PROMPT_VERSION)
+                if clave in vistas or cache.obtener(clave, page_number) is not None:
+                    continue
+                vistas.add(clave)
+                _, messages = _preparar_request(img_bytes, page_number, renderer.mime_type)
+                escritor.agregar({
+                    "custom_id": f"{page_number}|{clave}",
+                    "method": "POST",
+                    "url": ENDPOINT_VISION,
+                    "body": {"model": MODEL_VISION, "messages": messages, "temperature": 0},
+                })
+    return escritor.archivos
+
+
+def _elementos_documento(pdf_path: str, cache: VisionCache, renderer: PdfRenderer):
+    """Genera los elementos de cada página como los tendrá el pipeline (omite las sin visión)."""
+    with documento(pdf_path) as doc:
+        locales = [
+            extraer_pagina_texto(doc.load_page(page_number), page_number)["elementos"]
+            for page_number, tipo in enumerate(_tipos_paginas(doc))
+            if tipo == PAGINA_TEXTO
+        ]
+    yield from locales
+
+    for page_number, img_bytes in _paginas_vision(pdf_path, renderer):
+        cacheado = cache.obtener(VisionCache.clave(img_bytes, MODEL_VISION, PROMPT_VERSION), page_number)
+        if cacheado is not None:
+            yield cacheado[0]
+
+
+def preparar_embeddings(licitation_dir: str, carpeta: str) -> list:
+    """
+    Escribe los requests de embeddings de los textos que generará el pipeline
+    (elementos y texto de página) sin vector precalculado.
+    Retorna [(path, requests)] de los archivos de entrada.
+    """
+    cache = _cache()
+    renderer = PdfRenderer()
+    textos = {}
+    for pdf_path in documentos_pdf(licitation_dir):
+        for elementos in _elementos_documento(pdf_path, cache, renderer):
+            textos_elem, texto_pagina = textos_de_pagina(elementos)
+            for texto in (*textos_elem.values(), texto_pagina):
+                if texto and texto.strip():
+                    textos.setdefault(hash_texto(texto), texto)
+
+    existentes = database.get_batch_embeddings(MODEL_EMBEDDING, list(textos))
+    items = []
+    for text_hash, texto in textos.items():
+        if text_hash in existentes:
+            continue
+        tokens = contar_tokens_embedding(texto)
+        if tokens <= MAX_TOKENS_POR_TEXTO:
+            items.append((text_hash, texto, tokens))
+
+    with EscritorJsonl(carpeta, "embedding") as escritor:
+        for n, lote in enumerate(empaquetar_lotes(items), start=1):
+            escritor.agregar({
+                "custom_id": f"e{n}",
+                "method": "POST",
+                "url": ENDPOINT_EMBEDDING,
+                "body": {"model": MODEL_EMBEDDING, "input": [item[1] for item in lote],
+                         "encoding_format": "base64"},
+            }, unidades=len(lote))
+    return escritor.archivos
+
+
+# ---------------------------------------------------------------------------
+# Aplicación de resultados
+# ---------------------------------------------------------------------------
+
+def _lineas(contenido: bytes):
+    for linea in contenido.decode("utf-8").splitlines():
+        if linea.strip():
+            yield json.loads(linea)
+
+
+def _cuerpo(resultado: dict):
+    """Body de un resultado exitoso, o None si el request falló."""
+    respuesta = resultado.get("response") or {}
+    if resultado.get("error") or respuesta.get("status_code") != 200:
+        return None
+    return respuesta.get("body")
+
+
+def aplicar_vision(contenido: bytes) -> tuple[int, int]:
+    """Guarda en el cache de visión los resultados del archivo de salida. Retorna (ok, fallidas)."""
+    from openai.types.chat import ChatCompletion
+
+    cache = _cache()
+    ok = fallidas = 0
+    for resultado in _lineas(contenido):
+        page_number, clave = resultado["custom_id"].split("|", 1)
+        cuerpo = _cuerpo(resultado)
+        if cuerpo is None:
+            fallidas += 1
+            continue
+        elementos, raw, tokens_in, tokens_out = _procesar_respuesta(
+            ChatCompletion.model_validate(cuerpo), None, int(page_number)
+        )
+        # Igual que el pipeline: una respuesta sin elementos ni JSON no se conserva
+        if not elementos and raw == "{}":
+            fallidas += 1
+            continue
+        cache.guardar(clave, MODEL_VISION, PROMPT_VERSION, elementos, raw, tokens_in, tokens_out)
+        ok += 1
+    return ok, fallidas
+
+
+def aplicar_embeddings(licitation_id: str, input_path: str, contenido: bytes) -> tuple[int, int]:
+    """
+    Guarda los vectores del archivo de salida en batch_api_embeddings (los
+    textos de cada request se leen del archivo de entrada). Retorna (ok, fallidos).
+    """
+    with open(input_path, "rb") as f:
+        entradas = {r["custom_id"]: r["body"]["input"] for r in _lineas(f.read())}
+
+    ok = fallidos = 0
+    for resultado in _lineas(contenido):
+        textos = entradas.get(resultado["custom_id"], [])
+        cuerpo = _cuerpo(resultado)
+        if cuerpo is None:
+            fallidos += len(textos)
+            continue
+        vectores = []
+        for dato in cuerpo["data"]:
+            embedding = dato["embedding"]
+            if isinstance(embedding, str):
+                vector = base64.b64decode(embedding)
+            else:
+                from .redis_utils import codificar_embedding
+
+                vector = codificar_embedding(embedding)
+            vectores.append((hash_texto(textos[dato["index"]]), vector))
+        database.save_batch_embeddings(cuerpo.get("model") or MODEL_EMBEDDING, licitation_id, vectores)
+        ok += len(vectores)
+        fallidos += len(textos) - len(vectores)
+    return ok, fallidos
+
+
+# ---------------------------------------------------------------------------
+# Jobs
+# ---------------------------------------------------------------------------
+
+def _cliente():
+    """
+    Cliente OpenAI con los reintentos del SDK: las llamadas de administración
+    de batches no pasan por el rate limiter.
+    """
+    import openai
+
+    return get_openai_client().with_options(max_retries=openai.DEFAULT_MAX_RETRIES)
+
+
+def _cache() -> VisionCache:
+    cache = get_vision_cache()
+    if cache is None:
+        raise RuntimeError("El modo Batch API requiere VISION_CACHE_ENABLED=true")
+    return cache
+
+
+def carpeta_licitacion(licitation_id: str) -> str:
+    return os.path.join(BATCH_API_DIR, licitation_id)
+
+
+def _subir(licitation_id: str, kind: str, archivos: list, endpoint: str) -> None:
+    cliente = _cliente()
+    for path, requests in archivos:
+        with open(path, "rb") as f:
+            archivo = cliente.files.create(file=f, purpose="batch")
+        batch = cliente.batches.create(
+            input_file_id=archivo.id,
+            endpoint=endpoint,
+            completion_window=BATCH_API_COMPLETION_WINDOW,
+            metadata={"licitation_id": licitation_id, "kind": kind},
+        )
+        database.insert_batch_job({
+            "id": batch.id,
+            "licitation_id": licitation_id,
+            "kind": kind,
+            "status": batch.status,
+            "input_path": path,
+            "input_file_id": archivo.id,
+            "requests": requests,
+        })
+        log.info(f"[batch_api] 📤 {licitation_id}: batch {kind} {batch.id} ({requests} requests)")
+
+
+def _actualizar(job: dict) -> dict:
+    batch = _cliente().batches.retrieve(job["id"])
+    conteos = batch.request_counts
+    campos = {
+        "status": batch.status,
+        "output_file_id": batch.output_file_id,
+        "error_file_id": batch.error_file_id,
+        "completed": conteos.completed if conteos else 0,
+        "failed": conteos.failed if conteos else 0,
+    }
+    database.update_batch_job(job["id"], **campos)
+    return {**job, **campos}
+
+
+def _fusionar(job: dict) -> None:
+    """Aplica el archivo de salida de un job terminado (también si expiró a medias)."""
+    ok = fallidos = 0
+    if job["output_file_id"]:
+        contenido = _cliente().files.content(job["output_file_id"]).content
+        if job["kind"] == "vision":
+            ok, fallidos = aplicar_vision(contenido)
+        else:
+            ok, fallidos = aplicar_embeddings(job["licitation_id"], job["input_path"], contenido)
+    if job["status"] != "completed" or job["failed"] or fallidos:
+        log.warning(f"[batch_api] ⚠️ {job['licitation_id']}: batch {job['kind']} {job['id']} {job['status']} "
+                    f"({job['failed'] or fallidos} fallidos); el resto se procesará en vivo")
+    log.info(f"[batch_api] 📥 {job['licitation_id']}: batch {job['kind']} {job['id']} fusionado ({ok} resultados)")
+    database.update_batch_job(job["id"], merged_at=time.time())
+
+
+def encolar(licitation_id: str, licitation_dir: str) -> str:
+    """
+    Encola los requests de visión de la licitación y la avanza (si el cache
+    ya tiene toda la visión pasa directo a embeddings). Retorna la fase.
+    """
+    carpeta = carpeta_licitacion(licitation_id)
+    _subir(licitation_id, "vision", preparar_vision(licitation_dir, carpeta), ENDPOINT_VISION)
+    database.set_batch_phase(licitation_id, "vision")
+    return avanzar(licitation_id, licitation_dir, "vision")
+
+
+def avanzar(licitation_id: str, licitation_dir: str, phase: str) -> str:
+    """
+    Actualiza los jobs sin fusionar de la fase; cuando todos terminaron fusiona sus
+    resultados y pasa a la fase siguiente (vision → embedding → done).
+    Retorna la fase en que queda la licitación.
+    """
+    jobs = [
+        _actualizar(job) if job["merged_at"] is None else job
+        for job in database.get_batch_jobs(licitation_id, phase)
+    ]
+    if any(job["status"] not in TERMINALES for job in jobs):
+        return phase
+
+    for job in jobs:
+        if job["merged_at"] is None:
+            _fusionar(job)
+
+    if phase == "vision":
+        carpeta = carpeta_licitacion(licitation_id)
+        _subir(licitation_id, "embedding", preparar_embeddings(licitation_dir, carpeta), ENDPOINT_EMBEDDING)
+        database.set_batch_phase(licitation_id, "embedding")
+        return avanzar(licitation_id, licitation_dir, "embedding")
+
+    database.set_batch_phase(licitation_id, "done")
+    shutil.rmtree(carpeta_licitacion(licitation_id), ignore_errors=True)
+    return "done"
@@ -0,0 +1,85 @@
+# checkpoints.py
+
+import json
+import logging
+import os
+
+from src import database
+from src.config import MODEL_VISION, PAGE_CHECKPOINTS_ENABLED
+from .ai_extractor_pdf import PROMPT_VERSION
+
+log = logging.getLogger(__name__)
+
+
+class CheckpointsDocumento:
+    """
+    Progreso por página de un documento (tabla page_checkpoints en etl.db).
+
+    Etapas: render → vision → embedding → persisted. Al terminar visión se
+    guarda el resultado de la página, por lo que al reanudar:
+      - páginas persistidas   → no se vuelven a procesar
+      - páginas con visión    → solo se re-embeben y persisten
+      - el resto              → se procesan completas
+
+    Los checkpoints quedan asociados a la versión del archivo (size, mtime) y
+    del prompt/modelo de visión; si cambian se descartan. Un error al escribir
+    un checkpoint nunca interrumpe el procesamiento.
+    """
+
+    def __init__(self, document_path, habilitado=PAGE_CHECKPOINTS_ENABLED):
+        self.habilitado = habilitado
+        self.document_key = os.path.abspath(document_path)
+        st = os.stat(document_path)
+        self.source = f"{st.st_size}:{st.st_mtime_ns}:{MODEL_VISION}:{PROMPT_VERSION}"
+        self._paginas = {}
+        if self.habilitado:
+            try:
+                self._paginas = database.get_page_checkpoints(self.document_key, self.source)
+            except Exception as e:
+                log.warning(f"[checkpoints] ⚠️ No se pudieron leer checkpoints: {e}")
+
+    def _resultado(self, page_number):
+        row = self._paginas.get(page_number)
+        if not row or not row.get("result"):
+            return None
+        return json.loads(row["result"])
+
+    def persistida(self, page_number):
+        """Resultado de la página si ya quedó persistida, si no None."""
+        row = self._paginas.get(page_number)
+        if row and row.get("persisted_at"):
+            return self._resultado(page_number)
+        return None
+
+    def con_vision(self, page_number):
+        """Resultado de visión guardado (página aún no persistida), si no None."""
+        row = self._paginas.get(page_number)
+        if row and row.get("vision_at") and not row.get("persisted_at"):
+            return self._resultado(page_number)
+        return None
+
+    def marcar(self, page_number, etapa, pagina=None):
+        if not self.habilitado:
+            return
+        try:
+            resultado = json.dumps(pagina, ensure_ascii=False) if pagina is not None else None
+            database.mark_page_stage(self.document_key, self.source, page_number, etapa, resultado)
+        except Exception as e:
+            log.warning(f"[checkpoints] ⚠️ No se pudo registrar {etapa} p{page_number + 1}: {e}")
+
+    def error(self, page_number, mensaje):
+        if not self.habilitado:
+            return
+        try:
+            database.mark_page_error(self.document_key, self.source, page_number, mensaje)
+        except Exception as e:
+            log.warning(f"[checkpoints] ⚠️ No se pudo registrar error p{page_number + 1}: {e}")
+
+    def limpiar(self):
+        """Documento completo: los checkpoints ya no son necesarios."""
+        if not self.habilitado:
+            return
+        try:
+            database.clear_page_checkpoints(self.document_key)
+        except Exception as e:
+            log.warning(f"[checkpoints] ⚠️ No se pudieron limpiar checkpoints: {e}")
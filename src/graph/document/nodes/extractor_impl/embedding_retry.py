@@ -0,0 +1,165 @@
+# embedding_retry.py
+
+import logging
+import os
+import random
+import time
+
+from src import database, metrics
+from src.config import (
+    EMBEDDING_RETRY_BATCH,
+    EMBEDDING_RETRY_MAX_ATTEMPTS,
+    EMBEDDING_RETRY_BASE_SECONDS,
+    EMBEDDING_RETRY_MAX_SECONDS,
+)
+from .embeddings import generar_embeddings_lote, MAX_TOKENS_POR_TEXTO
+from .redis_utils import RedisPipelineWriter, datos_embedding
+from .vector_index import ShardWriter
+
+log = logging.getLogger(__name__)
+
+# Tiempo que un worker reserva los items que tomó de la cola
+LEASE_SECONDS = 300
+
+metrics.Gauge(
+    "etl_embedding_retry_queue", "Items en la cola de reintentos de embeddings por status", ("status",),
+    funcion=lambda: {(status,): n for status, n in database.count_embedding_retries().items()},
+)
+
+
+def item_reintento(document_id, document_folder, page_number, elemento, texto, tipo=None, error=None) -> dict:
+    """
+    Item de la cola para una clave doc_raw_page. elemento=None es el
+    documento de página (p{n} y p{n}_full).
+    """
+    key_base = f"doc_raw_page:{document_id}:p{page_number + 1}"
+    return {
+        "redis_key": f"{key_base}_e{elemento}" if elemento is not None else key_base,
+        "document_id": document_id,
+        "document_folder": document_folder,
+        "page": page_number + 1,
+        "element": elemento,
+        "text": texto,
+        "type": tipo,
+        "error": None if error is None else str(error),
+    }
+
+
+def encolar_reintentos(items: list[dict]) -> None:
+    database.enqueue_embedding_retries(items)
+    if items:
+        log.info(f"[embedding_retry] 📥 {len(items)} embeddings encolados para reintento")
+
+
+def _backoff(intentos: int) -> float:
+    """Backoff exponencial con jitter (±25%)."""
+    espera = min(EMBEDDING_RETRY_BASE_SECONDS * 2 ** (intentos - 1), EMBEDDING_RETRY_MAX_SECONDS)
+    return espera * random.uniform(0.75, 1.25)
+
+
+def _permanente(error: str) -> bool:
+    """Errores que no se resuelven reintentando."""
+    return error.startswith(f"texto excede {MAX_TOKENS_POR_TEXTO} tokens")
+
+
+def procesar_reintentos(limite=EMBEDDING_RETRY_BATCH) -> dict:
+    """
+    Toma un lote de items vencidos, los re-embebe en un solo lote y escribe
+    las claves doc_raw_page correspondientes (y el shard del documento).
+    Los que vuelven a fallar se reprograman con backoff; al superar
+    EMBEDDING_RETRY_MAX_ATTEMPTS (o con error permanente) quedan en estado dead.
+    """
+    resumen = {"procesados": 0, "ok": 0, "reprogramados": 0, "descartados": 0}
+    items = database.claim_due_embedding_retries(limite, LEASE_SECONDS)
+    if not items:
+        return resumen
+    resumen["procesados"] = len(items)
+
+    por_clave = {i["redis_key"]: i for i in items}
+    try:
+        # Sin reintentos internos: el backoff lo maneja la cola
+        vectores, fallidos = generar_embeddings_lote(
+            {clave: i["text"] for clave, i in por_clave.items()}, max_retries=1
+        )
+    except Exception as e:
+        vectores, fallidos = {}, {clave: str(e) for clave in por_clave}
+
+    fallidos = dict(fallidos)
+    for clave in por_clave:
+        if clave not in vectores and clave not in fallidos:
+            fallidos[clave] = "sin vector"
+
+    escritas = _escribir(por_clave, vectores, fallidos)
+    database.delete_embedding_retries(escritas)
+    resumen["ok"] = len(escritas)
+
+    ahora = time.time()
+    reprogramar = []
+    for clave, error in fallidos.items():
+        intentos = por_clave[clave]["attempts"] + 1
+        if intentos >= EMBEDDING_RETRY_MAX_ATTEMPTS or _permanente(error):
+            reprogramar.append((clave, intentos, ahora, "dead", error))
+            resumen["descartados"] += 1
+            log.warning(f"[embedding_retry] ☠️ {clave} descartado tras {intentos} intentos: {error}")
+        else:
+            reprogramar.append((clave, intentos, ahora + _backoff(intentos), "pending", error))
+            resumen["reprogramados"] += 1
+    database.reschedule_embedding_retries(reprogramar)
+
+    log.info(f"[embedding_retry] ✅ {resumen['ok']}/{resumen['procesados']} reintentos escritos "
+             f"({resumen['reprogramados']} reprogramados, {resumen['descartados']} descartados)")
+    return resumen
+
+
+def _escribir(por_clave, vectores, fallidos) -> list[str]:
+    """Escribe los vectores obtenidos en Redis y en el shard; retorna las claves escritas."""
+    pendientes = {}
+    with RedisPipelineWriter() as writer:
+        for clave, vector in vectores.items():
+            item = por_clave[clave]
+            if item["element"] is not None:
+                writer.hset(clave, {
+                    "pagina": str(item["page"]),
+                    "elemento": str(item["element"]),
+                    "texto": item["text"],
+                    "tipo": item["type"] or "",
+                    **datos_embedding(vector),
+                })
+            else:
+                datos_pagina = {"pagina": str(item["page"]), "texto": item["text"], **datos_embedding(vector)}
+                writer.hset(clave, datos_pagina)
+                writer.hset(f"{clave}_full", {**datos_pagina, "tipo": "pagina"})
+            pendientes[clave] = vector
+        fallidas_redis = writer.flush()
+
+    for clave, error in fallidas_redis.items():
+        clave = clave[:-len("_full")] if clave.endswith("_full") else clave
+        if clave in pendientes:
+            del pendientes[clave]
+            fallidos[clave] = f"redis: {error}"
+
+    # Shard del índice vectorial por documento
+    por_documento = {}
+    for clave in pendientes:
+        item = por_clave[clave]
+        storage_case_path = os.path.dirname(os.path.normpath(item["document_folder"]))
+        por_documento.setdefault((storage_case_path, item["document_id"]), []).append(clave)
+    for (storage_case_path, document_id), claves in por_documento.items():
+        try:
+            with ShardWriter(storage_case_path, document_id) as shard:
+                shard.agregar(claves, [pendientes[c] for c in claves])
+        except Exception as e:
+            log.warning(f"[embedding_retry] ⚠️ No se pudo actualizar el shard de {document_id}: {e}")
+
+    return list(pendientes)
+
+
+def drenar_reintentos(limite=EMBEDDING_RETRY_BATCH) -> dict:
+    """Procesa lotes mientras haya items vencidos."""
+    total = {"procesados": 0, "ok": 0, "reprogramados": 0, "descartados": 0}
+    while True:
+        resumen = procesar_reintentos(limite)
+        for k, v in resumen.items():
+            total[k] += v
+        if resumen["procesados"] < limite:
+            return total
@@ -1,9 +1,21 @@
 # embeddings.py
 
-from openai import OpenAI
-from src.config import API_KEY
+import asyncio
+import hashlib
+import logging
+from collections import deque
 
-client = OpenAI(api_key=API_KEY)
+from src.config import (
+    MODEL_EMBEDDING,
+    EMBEDDING_BATCH_MAX_TOKENS,
+    EMBEDDING_BATCH_MAX_ITEMS,
+    EMBEDDING_MAX_RETRIES,
+)
+from src import database, metrics
+from .openai_client import get_openai_client, get_async_openai_client
+from .rate_limiter import limitador
+
+log = logging.getLogger(__name__)
 
 def generar_embedding(texto, model="text-embedding-3-small"):
     """
@@ -17,14 +29,14 @@ def generar_embedding(texto, model="text-embedding-3-small"):
         list: Vector de embedding generado.
     """
     try:
-        respuesta = client.embeddings.create(
+        respuesta = get_openai_client().embeddings.create(
             model=model,
             input=texto
         )
         vector = respuesta.data[0].embedding
         return vector
     except Exception as e:
-        print(f"[❌ ERROR] Al generar embedding: {e}")
+        log.error(f"[❌ ERROR] Al generar embedding: {e}")
         return []
 
 def get_embeddings(textos, model="text-embedding-3-small"):
@@ -39,11 +51,239 @@ def get_embeddings(textos, model="text-embedding-3-small"):
         list[list[float]]: Lista de vectores de embeddings.
     """
     try:
-        respuesta = client.embeddings.create(
+        respuesta = get_openai_client().embeddings.create(
             model=model,
             input=textos
         )
         return [r.embedding for r in respuesta.data]
     except Exception as e:
-        print(f"[❌ ERROR] Al generar embeddings múltiples: {e}")
+        log.error(f"[❌ ERROR] Al generar embeddings múltiples: {e}")
         return []
+
+
+# ---------------------------------------------------------------------------
+# Embeddings por lote
+# ---------------------------------------------------------------------------
+
+# Límite de tokens por input de text-embedding-3-*
+MAX_TOKENS_POR_TEXTO = 8191
+
+_encoding = None
+
+
+def contar_tokens_embedding(texto):
+    """
+    Cuenta tokens con el encoding de los modelos text-embedding-3 (cl100k_base).
+    Si el encoding no está disponible (sin acceso a descargarlo) se estima
+    conservadoramente con ~3 bytes por token: solo se usa para empaquetar lotes.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            from tiktoken import get_encoding
+
+            _encoding = get_encoding("cl100k_base")
+        except Exception as e:
+            log.warning(f"[embeddings] ⚠️ Encoding cl100k_base no disponible, se estiman tokens: {e}")
+            _encoding = False
+    if _encoding is False:
+        return len(texto.encode("utf-8")) // 3 + 1
+    return len(_encoding.encode(texto))
+
+
+def empaquetar_lotes(items, max_tokens=None, max_items=None):
+    """
+    Agrupa items en lotes que respetan el límite de tokens y de inputs por request.
+
+    Args:
+        items (list[tuple]): Lista de (clave, texto, tokens).
+        max_tokens (int): Máximo de tokens sumados por lote.
+        max_items (int): Máximo de textos por lote.
+
+    Returns:
+        list[list[tuple]]: Lotes en el mismo orden de entrada.
+    """
+    max_tokens = max_tokens or EMBEDDING_BATCH_MAX_TOKENS
+    max_items = max_items or EMBEDDING_BATCH_MAX_ITEMS
+
+    lotes = []
+    actual, tokens_actual = [], 0
+    for item in items:
+        tokens = item[2]
+        if actual and (tokens_actual + tokens > max_tokens or len(actual) >= max_items):
+            lotes.append(actual)
+            actual, tokens_actual = [], 0
+        actual.append(item)
+        tokens_actual += tokens
+    if actual:
+        lotes.append(actual)
+    return lotes
+
+
+def hash_texto(texto):
+    """Clave de un texto en batch_api_embeddings."""
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def _precalculados(textos, model):
+    """
+    Separa los textos con vector precalculado por la Batch API (tabla
+    batch_api_embeddings) de los que hay que pedir a la API.
+    Retorna ({clave: vector}, {clave: texto} pendientes).
+    """
+    if not textos or not database.has_batch_embeddings():
+        return {}, textos
+
+    import numpy as np
+
+    hashes = {clave: hash_texto(texto) for clave, texto in textos.items() if texto and str(texto).strip()}
+    guardados = database.get_batch_embeddings(model, list(set(hashes.values())))
+    vectores = {
+        clave: np.frombuffer(guardados[h], dtype="<f4").tolist()
+        for clave, h in hashes.items()
+        if h in guardados
+    }
+    if vectores:
+        log.debug(f"[embeddings] ♻️ {len(vectores)} embeddings precalculados por la Batch API")
+    return vectores, {clave: texto for clave, texto in textos.items() if clave not in vectores}
+
+
+def _crear_embeddings(textos, tokens, model):
+    """
+    Llama a la API dentro del cupo del modelo y devuelve {indice: vector}.
+    Propaga las excepciones (después de los reintentos del rate limiter).
+    """
+    respuesta = limitador(model, "embedding").llamar(
+        lambda: get_openai_client().embeddings.with_raw_response.create(model=model, input=textos),
+        tokens,
+    )
+    return {r.index: r.embedding for r in respuesta.data}
+
+
+async def _crear_embeddings_async(textos, tokens, model):
+    respuesta = await limitador(model, "embedding").allamar(
+        lambda: get_async_openai_client().embeddings.with_raw_response.create(model=model, input=textos),
+        tokens,
+    )
+    return {r.index: r.embedding for r in respuesta.data}
+
+
+def generar_embeddings_lote(textos, model=MODEL_EMBEDDING, max_tokens=None, max_items=None, max_retries=None):
+    """
+    Genera embeddings para muchos textos con el mínimo de requests.
+
+    Los textos se empaquetan en lotes limitados por tokens y los vectores se
+    devuelven asociados a su clave. Solo se reencolan los items que fallan:
+    - request inválido (400): el lote se divide en mitades para aislar al item culpable
+    - vectores faltantes en la respuesta: se reencolan solo esos items
+    Los errores transitorios (rate limit, timeout, 5xx) ya los reintentó el
+    rate limiter: si la llamada igual falla, los items del lote quedan fallidos.
+
+    Args:
+        textos (dict): {clave: texto}. La clave puede ser cualquier hashable.
+        model (str): Modelo de embedding a utilizar.
+
+    Returns:
+        tuple[dict, dict]: ({clave: vector}, {clave: error}) con los items fallidos.
+    """
+    previos, textos = _precalculados(textos, model)
+    proceso = _procesar_lotes(textos, max_tokens, max_items, max_retries, previos)
+    try:
+        lote = next(proceso)
+        while True:
+            try:
+                with metrics.STAGE_SECONDS.time(stage="embedding"):
+                    resultado = _crear_embeddings(*lote, model)
+            except Exception as e:
+                resultado = e
+            lote = proceso.send(resultado)
+    except StopIteration as fin:
+        return fin.value
+
+
+async def generar_embeddings_lote_async(textos, model=MODEL_EMBEDDING, max_tokens=None, max_items=None,
+                                        max_retries=None):
+    """generar_embeddings_lote con AsyncOpenAI (mismos lotes, reintentos y resultado)."""
+    previos, textos = await asyncio.to_thread(_precalculados, textos, model)
+    proceso = _procesar_lotes(textos, max_tokens, max_items, max_retries, previos)
+    try:
+        lote = next(proceso)
+        while True:
+            try:
+                with metrics.STAGE_SECONDS.time(stage="embedding"):
+                    resultado = await _crear_embeddings_async(*lote, model)
+            except Exception as e:
+                resultado = e
+            lote = proceso.send(resultado)
+    except StopIteration as fin:
+        return fin.value
+
+
+def _procesar_lotes(textos, max_tokens=None, max_items=None, max_retries=None, previos=None):
+    """
+    Lógica de lotes y reintentos, independiente de cómo se hace la llamada.
+    Generador que produce (textos, tokens) de cada request y recibe el
+    resultado de la llamada ({indice: vector} o la excepción). Retorna
+    ({clave: vector}, {clave: error}), incluidos los vectores previos ya resueltos.
+    max_retries limita los reenvíos de un item cuya respuesta no trajo vector.
+    """
+    from openai import BadRequestError
+
+    max_retries = max_retries or EMBEDDING_MAX_RETRIES
+
+    vectores, fallidos = dict(previos or {}), {}
+    items = []
+    for clave, texto in textos.items():
+        if not texto or not str(texto).strip():
+            continue
+        tokens = contar_tokens_embedding(texto)
+        if tokens > MAX_TOKENS_POR_TEXTO:
+            fallidos[clave] = f"texto excede {MAX_TOKENS_POR_TEXTO} tokens ({tokens})"
+            continue
+        items.append((clave, texto, tokens))
+
+    intentos = {item[0]: 0 for item in items}
+    cola = deque(empaquetar_lotes(items, max_tokens, max_items))
+    n_requests = 0
+
+    while cola:
+        lote = cola.popleft()
+        n_requests += 1
+        resultado = yield [item[1] for item in lote], sum(item[2] for item in lote)
+        if isinstance(resultado, BadRequestError):
+            if len(lote) > 1:
+                metrics.RETRIES.inc(operation="embedding_split")
+                mitad = len(lote) // 2
+                cola.appendleft(lote[mitad:])
+                cola.appendleft(lote[:mitad])
+            else:
+                fallidos[lote[0][0]] = str(resultado)
+            continue
+        if isinstance(resultado, Exception):
+            # Final: el rate limiter ya reintentó los errores transitorios
+            log.warning(f"[embeddings] ⚠️ Lote de {len(lote)} textos falló: {resultado}")
+            for item in lote:
+                fallidos[item[0]] = str(resultado)
+            continue
+
+        faltantes = []
+        for i, item in enumerate(lote):
+            vector = resultado.get(i)
+            if vector:
+                vectores[item[0]] = vector
+                metrics.TOKENS.inc(item[2], kind="embedding")
+            else:
+                intentos[item[0]] += 1
+                if intentos[item[0]] >= max_retries:
+                    fallidos[item[0]] = "respuesta sin vector"
+                else:
+                    faltantes.append(item)
+        if faltantes:
+            metrics.RETRIES.inc(operation="embedding")
+            cola.append(faltantes)
+
+    if fallidos:
+        metrics.ERRORS.inc(len(fallidos), operation="embedding")
+
+    log.debug(f"[embeddings] ✅ {len(vectores)} embeddings en {n_requests} requests ({len(fallidos)} fallidos)")
+    return vectores, fallidos
@@ -0,0 +1,150 @@
+# image_preprocess.py
+#
+# Reducción adaptativa de la imagen de cada página antes de la llamada de
+# visión (RENDER_ADAPTIVE). Una vista previa de baja resolución mide:
+#   - márgenes en blanco → se rasteriza solo el área con contenido (clip)
+#   - color              → sin color la página va en escala de grises
+#   - densidad de bordes → complejidad: calidad JPEG/WebP
+#   - sin contenido      → detail=low (512 px); con RENDER_LOW_DETAIL_COMPLEXITY > 0
+#                          también las páginas bajo esa complejidad
+# El área con contenido se rasteriza con la misma densidad que la página
+# completa (misma legibilidad, menos píxeles) y el tamaño final se ajusta a la
+# grilla de tiles de 512 px del modelo cuando un lado apenas excede un
+# múltiplo de 512.
+#
+# detail se deduce del tamaño de la imagen (≤ 512 × 512 → low: es lo que el
+# modelo ve en detail=low), así que viaja con los bytes: ai_extractor_pdf lo
+# lee del header sin decodificar la imagen.
+
+import math
+import struct
+
+# Lado de un tile del modelo de visión (detail=high) y tamaño de detail=low
+TILE = 512
+
+# Vista previa para medir la página (≈ 425 × 550 px en carta)
+DPI_VISTA_PREVIA = 50
+
+# Gris sobre el cual un píxel es papel; diferencia entre canales que cuenta como color
+UMBRAL_BLANCO = 235
+UMBRAL_COLOR = 48
+FRACCION_COLOR = 0.001
+
+# Salto de gris entre píxeles vecinos que cuenta como borde, y densidad de
+# bordes desde la cual la página se considera de complejidad máxima (texto denso)
+UMBRAL_BORDE = 48
+COMPLEJIDAD_MAXIMA = 0.12
+
+# Margen que se deja alrededor del contenido (puntos)
+MARGEN_PT = 6
+
+
+def analizar_pagina(page) -> dict:
+    """
+    Mide la página en una vista previa RGB. Retorna:
+      - clip: fitz.Rect con el contenido (None si la página está en blanco)
+      - color: True si hay contenido en color
+      - complejidad: densidad de bordes dentro del contenido (0..1)
+    """
+    import fitz  # PyMuPDF
+    import numpy as np
+
+    pix = page.get_pixmap(dpi=DPI_VISTA_PREVIA, colorspace=fitz.csRGB, alpha=False)
+    rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+    gris = rgb.min(axis=2)
+    tinta = gris < UMBRAL_BLANCO
+
+    filas = np.flatnonzero(tinta.any(axis=1))
+    columnas = np.flatnonzero(tinta.any(axis=0))
+    if filas.size == 0:
+        return {"clip": None, "color": False, "complejidad": 0.0}
+
+    y0, y1 = filas[0], filas[-1] + 1
+    x0, x1 = columnas[0], columnas[-1] + 1
+    contenido = gris[y0:y1, x0:x1].astype(np.int16)
+    bordes = (
+        np.count_nonzero(np.abs(np.diff(contenido, axis=1)) > UMBRAL_BORDE)
+        + np.count_nonzero(np.abs(np.diff(contenido, axis=0)) > UMBRAL_BORDE)
+    ) / (2 * contenido.size)
+
+    croma = rgb.max(axis=2) - gris
+    escala_x = page.rect.width / pix.width
+    escala_y = page.rect.height / pix.height
+    clip = fitz.Rect(
+        page.rect.x0 + x0 * escala_x - MARGEN_PT,
+        page.rect.y0 + y0 * escala_y - MARGEN_PT,
+        page.rect.x0 + x1 * escala_x + MARGEN_PT,
+        page.rect.y0 + y1 * escala_y + MARGEN_PT,
+    ) & page.rect
+    return {
+        "clip": clip,
+        "color": bool(np.count_nonzero(croma > UMBRAL_COLOR) > FRACCION_COLOR * croma.size),
+        "complejidad": min(1.0, float(bordes) / COMPLEJIDAD_MAXIMA),
+    }
+
+
+def ajuste_tiles(ancho_px: float, alto_px: float, holgura: float) -> float:
+    """
+    Factor (≤ 1) que reduce la imagen al múltiplo de TILE inferior cuando un
+    lado lo excede en menos de `holgura` (fracción): un tile menos por fila o
+    columna a cambio de una reducción pequeña.
+    """
+    factor = 1.0
+    for lado in (ancho_px, alto_px):
+        tiles = math.ceil(lado / TILE)
+        if tiles > 1 and lado <= (tiles - 1) * TILE * (1 + holgura):
+            # -1: el redondeo del pixmap puede sumar un píxel
+            factor = min(factor, ((tiles - 1) * TILE - 1) / lado)
+    return factor
+
+
+def calidad_adaptativa(complejidad: float, calidad_min: int, calidad_max: int) -> int:
+    """Calidad JPEG/WebP: las páginas simples toleran más compresión que el texto denso."""
+    if calidad_min >= calidad_max:
+        return calidad_max
+    return round(calidad_min + (calidad_max - calidad_min) * complejidad)
+
+
+# ---------------------------------------------------------------------------
+# detail del request
+# ---------------------------------------------------------------------------
+
+def dimensiones_imagen(img_bytes: bytes):
+    """(ancho, alto) leídos del header PNG / JPEG / WebP, o None si no se reconoce."""
+    if img_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", img_bytes[16:24])
+
+    if img_bytes[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 < len(img_bytes):
+            if img_bytes[i] != 0xFF:
+                return None
+            marcador = img_bytes[i + 1]
+            largo = struct.unpack(">H", img_bytes[i + 2:i + 4])[0]
+            # SOF0..SOF15 (excepto DHT, JPG y DAC) llevan alto y ancho
+            if 0xC0 <= marcador <= 0xCF and marcador not in (0xC4, 0xC8, 0xCC):
+                alto, ancho = struct.unpack(">HH", img_bytes[i + 5:i + 9])
+                return ancho, alto
+            i += 2 + largo
+        return None
+
+    if img_bytes[:4] == b"RIFF" and img_bytes[8:12] == b"WEBP":
+        chunk = img_bytes[12:16]
+        if chunk == b"VP8 ":
+            ancho, alto = struct.unpack("<HH", img_bytes[26:30])
+            return ancho & 0x3FFF, alto & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(img_bytes[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return (int.from_bytes(img_bytes[24:27], "little") + 1,
+                    int.from_bytes(img_bytes[27:30], "little") + 1)
+    return None
+
+
+def detalle_imagen(img_bytes: bytes) -> str:
+    """detail para el request: low si la imagen cabe en 512 × 512, high si no."""
+    dimensiones = dimensiones_imagen(img_bytes)
+    if dimensiones is None:
+        return "auto"
+    return "low" if max(dimensiones) <= TILE else "high"
@@ -0,0 +1,65 @@
+# openai_client.py
+#
+# Cliente OpenAI compartido por visión y embeddings. Se crea en el primer uso
+# (no al importar: openai tarda ~0.5 s en cargar y exige OPENAI_API_KEY) y es
+# propio de cada proceso: después de un fork el hijo crea su cliente en vez de
+# reutilizar las conexiones HTTP del padre.
+#
+# El cliente async (AsyncOpenAI) se crea uno por event loop: sus conexiones
+# quedan ligadas al loop en que se abrieron.
+#
+# Con RATE_LIMIT_ENABLED los reintentos los hace rate_limiter (con el cupo
+# compartido), no el cliente: max_retries=0.
+
+import asyncio
+import os
+import threading
+import weakref
+
+from src.config import requerido, RATE_LIMIT_ENABLED
+
+_cliente = None
+_clientes_async = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_openai_client():
+    """Cliente OpenAI del proceso actual (OPENAI_BASE_URL se toma del entorno)."""
+    global _cliente
+    if _cliente is not None:
+        return _cliente
+
+    with _lock:
+        if _cliente is None:
+            import openai
+
+            _cliente = openai.OpenAI(api_key=requerido("API_KEY"), max_retries=_max_retries())
+        return _cliente
+
+
+def get_async_openai_client():
+    """Cliente AsyncOpenAI del event loop actual (llamar desde una corrutina)."""
+    loop = asyncio.get_running_loop()
+    cliente = _clientes_async.get(loop)
+    if cliente is None:
+        import openai
+
+        cliente = openai.AsyncOpenAI(api_key=requerido("API_KEY"), max_retries=_max_retries())
+        _clientes_async[loop] = cliente
+    return cliente
+
+
+def _max_retries() -> int:
+    import openai
+
+    return 0 if RATE_LIMIT_ENABLED else openai.DEFAULT_MAX_RETRIES
+
+
+def _reiniciar_en_hijo():
+    # Se descartan los clientes del padre; el lock pudo quedar tomado por otro hilo
+    global _cliente, _clientes_async, _lock
+    _cliente, _clientes_async, _lock = None, weakref.WeakKeyDictionary(), threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
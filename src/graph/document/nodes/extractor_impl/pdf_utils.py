@@ -1,15 +1,18 @@
-import fitz  # PyMuPDF
+from .renderer import render_page, opciones_render
+
 
 def get_page_count(pdf_path: str) -> int:
     """Devuelve el número total de páginas del PDF."""
+    import fitz  # PyMuPDF
+
     with fitz.open(pdf_path) as doc:
         return doc.page_count
 
 
-def extract_page_image(pdf_path: str, page_number: int) -> bytes:
-    """Retorna la página como bytes PNG a 300 dpi."""
-    with fitz.open(pdf_path) as doc:
-        page = doc.load_page(page_number)
-        pix = page.get_pixmap(dpi=300)
-        return pix.tobytes("png")
-    
\ No newline at end of file
+def extract_page_image(pdf_path: str, page_number: int, opciones: dict | None = None) -> bytes:
+    """
+    Retorna la página como imagen según las opciones de render
+    (por defecto las de config: RENDER_DPI, RENDER_FORMAT, ...).
+    El documento queda abierto en el proceso para las siguientes páginas.
+    """
+    return render_page(pdf_path, page_number, opciones or opciones_render())
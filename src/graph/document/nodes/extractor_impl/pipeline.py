@@ -0,0 +1,820 @@
+# pipeline.py
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+
+from .ai_extractor_pdf import analyze_page_image, analyze_page_image_async, PROMPT_VERSION
+from .checkpoints import CheckpointsDocumento
+from .embedding_retry import encolar_reintentos, item_reintento
+from .embeddings import generar_embeddings_lote, generar_embeddings_lote_async
+from .renderer import PdfRenderer, cerrar_documento, documento
+from .text_extractor import extraer_pagina_texto, PAGINA_TEXTO
+from .redis_utils import (
+    RedisPipelineWriter,
+    RedisPipelineWriterAsync,
+    datos_embedding,
+    leer_embeddings,
+    leer_embeddings_async,
+)
+from .vision_cache import VisionCache, get_vision_cache
+from .vector_index import ShardWriter
+from src import database, metrics
+from src.config import MODEL_VISION, EXTRACTOR_ASYNC_CONCURRENCY
+
+log = logging.getLogger(__name__)
+
+# Pipelines en curso (para exportar la profundidad de sus colas)
+_activos = weakref.WeakSet()
+
+
+def _profundidad_colas() -> dict:
+    profundidad = {("vision",): 0, ("embedding",): 0, ("sink",): 0}
+    for p in list(_activos):
+        profundidad[("vision",)] += p._q_vision.qsize()
+        profundidad[("embedding",)] += p._q_embedding.qsize()
+        profundidad[("sink",)] += p._q_sink.qsize()
+    return profundidad
+
+
+metrics.Gauge(
+    "etl_pipeline_queue_depth", "Páginas esperando en cada cola del pipeline", ("queue",),
+    funcion=_profundidad_colas,
+)
+
+# Señal de fin de stream entre etapas
+_FIN = object()
+
+# Máximo de páginas que la etapa de embedding agrupa en un mismo lote
+MAX_PAGINAS_POR_LOTE_EMBEDDING = 8
+
+
+def textos_de_pagina(elementos):
+    """
+    Devuelve ({num_elemento: texto}, texto_pagina) con los textos embebibles
+    de una página. El texto de página es la concatenación de sus elementos.
+    """
+    textos = {}
+    for idx, elem in enumerate(elementos):
+        texto = str(elem.get("contenido", "")).strip()
+        if texto:
+            textos[idx + 1] = texto
+    texto_pagina = "\n".join(textos.values()).strip()
+    return textos, texto_pagina
+
+
+def escribir_pagina_txt(f_txt, pagina) -> int:
+    """Escribe la página en el .txt combinado y retorna sus tokens."""
+    total_tokens = 0
+    f_txt.write(f"=== PÁGINA {pagina['pagina']} ===\n")
+    for elem in pagina.get("elementos", []):
+        t = elem.get("tipo")
+        if t == "titulo":
+            f_txt.write(f"\n# {elem.get('contenido', '').strip()}\n")
+        elif t == "texto":
+            f_txt.write(elem.get("contenido", "").strip() + "\n")
+        elif t == "checkbox":
+            f_txt.write("☑️ " + elem.get("contenido", "").strip() + "\n")
+        elif t == "tabla":
+            contenido = elem.get("contenido", [])
+            if isinstance(contenido, list):
+                for row in contenido:
+                    if isinstance(row, list):
+                        f_txt.write("|".join(str(c) for c in row) + "\n")
+                    else:
+                        f_txt.write(str(row) + "\n")
+            else:
+                f_txt.write(str(contenido) + "\n")
+
+        total_tokens += elem.get("tokens", 0)
+
+    f_txt.write("\n\n")
+    return total_tokens
+
+
+class ResultadosWriter:
+    """
+    Escribe incrementalmente los archivos combinados del documento
+    (_resultado_paginas.json, .txt y _tokens.txt). Las páginas deben
+    llegar en orden.
+    """
+
+    def __init__(self, document_folder, nombre_base):
+        self.json_path = os.path.join(document_folder, f"{nombre_base}_resultado_paginas.json")
+        self.txt_path = os.path.join(document_folder, f"{nombre_base}.txt")
+        self.token_path = os.path.join(document_folder, f"{nombre_base}_tokens.txt")
+        self.total_tokens = 0
+        self._primera = True
+
+    def __enter__(self):
+        self._f_json = open(self.json_path, "w", encoding="utf-8")
+        self._f_txt = open(self.txt_path, "w", encoding="utf-8")
+        self._f_json.write("[\n")
+        return self
+
+    def escribir(self, pagina):
+        if not self._primera:
+            self._f_json.write(",\n")
+        json.dump(pagina, self._f_json, ensure_ascii=False, indent=2)
+        self._primera = False
+        self.total_tokens += escribir_pagina_txt(self._f_txt, pagina)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._f_json.write("\n]\n")
+        self._f_json.close()
+        self._f_txt.close()
+        with open(self.token_path, "w", encoding="utf-8") as f_tok:
+            f_tok.write(f"Total tokens: {self.total_tokens}\n")
+        return False
+
+
+class PipelinePaginas:
+    """
+    Pipeline en streaming render → visión → embedding → persistencia.
+
+    - render: rasteriza en el pool de procesos del renderer (documento abierto una vez por proceso).
+      Las páginas clasificadas como texto nativo (page_kinds) no se renderizan:
+      se extraen localmente y saltan la etapa de visión
+    - visión: llamadas al modelo en paralelo (max_workers hilos)
+    - embedding: un solo embedding por elemento y por página, agrupando
+      en lotes las páginas disponibles
+    - sink: guarda en Redis (un round trip por página, pipeline compartido) y en
+      el JSON de la página apenas termina, agrega sus vectores al shard del
+      índice vectorial de la licitación y agrega la página a los archivos
+      combinados en orden
+
+    Una ventana de páginas en vuelo (semáforo) limita cuántas páginas
+    existen a la vez entre render y sink, por lo que la memoria no crece
+    con el tamaño del PDF. Un error en una página no afecta a las demás.
+
+    Cada etapa deja un checkpoint por página (CheckpointsDocumento): si el
+    documento se interrumpe, la siguiente ejecución no reprocesa las páginas
+    persistidas (pasan directo al sink, que regenera los archivos combinados
+    con su resultado guardado) y no vuelve a llamar a visión para las que ya
+    tenían resultado.
+    """
+
+    def __init__(self, document_id, document_path, document_folder, max_workers=4, page_kinds=None):
+        self.document_id = document_id
+        self.document_path = document_path
+        self.document_folder = document_folder
+        self.page_kinds = page_kinds or []
+        self.max_workers = max(1, max_workers)
+        self.renderer = PdfRenderer()
+        self.vision_cache = get_vision_cache()
+        self.checkpoints = CheckpointsDocumento(document_path)
+        # Si quedaron reintentos de una ejecución anterior, las claves que se
+        # escriban ahora los reemplazan
+        self._reintentos_previos = database.has_embedding_retries(document_id)
+        self._completas = 0
+        # True si alguna página reanudada no se pudo agregar al índice
+        self._indice_parcial = False
+
+        ventana = self.max_workers * 2 + 2
+        self._ventana = threading.Semaphore(ventana)
+        self._q_vision = queue.Queue(maxsize=self.max_workers)
+        self._q_embedding = queue.Queue(maxsize=self.max_workers)
+        self._q_sink = queue.Queue(maxsize=self.max_workers)
+
+        self._error = None
+        # Se activa si el sink falla: las demás etapas dejan de trabajar
+        self._detenido = threading.Event()
+        self._siguiente = 0
+        self._inicio_pagina = {}
+        self._resumen_lock = threading.Lock()
+        self.resumen = {
+            "paginas_total": 0,
+            "paginas_ok": 0,
+            "paginas_error": 0,
+            "paginas_cache": 0,
+            "paginas_texto": 0,
+            "paginas_reanudadas": 0,
+            "tokens_in": 0,
+            "tokens_out": 0,
+        }
+
+    def run(self) -> dict:
+        t0 = time.time()
+        _activos.add(self)
+        hilos = [threading.Thread(target=self._etapa_render, name="pipeline-render")]
+        hilos += [
+            threading.Thread(target=self._etapa_vision, name=f"pipeline-vision-{n}")
+            for n in range(self.max_workers)
+        ]
+        hilos.append(threading.Thread(target=self._etapa_embedding, name="pipeline-embedding"))
+
+        for h in hilos:
+            h.start()
+
+        try:
+            # El sink corre en el hilo que llama
+            self._etapa_sink()
+        except BaseException:
+            self._detener(hilos)
+            raise
+        finally:
+            for h in hilos:
+                h.join()
+            _activos.discard(self)
+            cerrar_documento(self.document_path)
+        return self._terminar(t0, f"workers={self.max_workers}")
+
+    def _detener(self, hilos):
+        """
+        Si el sink falló las demás etapas quedarían bloqueadas en la ventana o
+        en sus colas llenas: se vacían las colas, se libera la ventana y se
+        despierta con _FIN a las que esperan, hasta que todas terminan.
+        """
+        self._detenido.set()
+        while any(h.is_alive() for h in hilos):
+            self._ventana.release()
+            for cola in (self._q_vision, self._q_embedding, self._q_sink):
+                try:
+                    while True:
+                        cola.get_nowait()
+                except queue.Empty:
+                    pass
+            for cola in (self._q_vision, self._q_embedding):
+                try:
+                    cola.put_nowait(_FIN)
+                except queue.Full:
+                    pass
+            for h in hilos:
+                h.join(timeout=0.05)
+
+    def _terminar(self, t0, detalle):
+        if self._error is not None:
+            raise self._error
+
+        if self._completas == self.resumen["paginas_total"]:
+            self.checkpoints.limpiar()
+
+        log.info(f"[pipeline] ✅ {self.resumen['paginas_ok']}/{self.resumen['paginas_total']} páginas "
+                 f"en {time.time() - t0:.1f}s ({detalle})")
+        return self.resumen
+
+    # ------------------------------------------------------------------
+    # Etapas
+    # ------------------------------------------------------------------
+
+    def _etapa_render(self):
+        try:
+            for destino, item in self._paginas():
+                self._ventana.acquire()
+                if self._detenido.is_set():
+                    return
+                self.resumen["paginas_total"] += 1
+                (self._q_sink if destino == "sink" else self._q_vision).put(item)
+        except Exception as e:
+            log.error(f"[pipeline] ❌ Error renderizando '{self.document_path}': {e}")
+            self._error = e
+        finally:
+            for _ in range(self.max_workers):
+                self._q_vision.put(_FIN)
+
+    def _paginas(self):
+        """
+        Genera (destino, item) por página en orden: "sink" para las ya persistidas
+        y "vision" para el resto (imagen renderizada, o resultado local/reanudado).
+        Renderiza y extrae el texto nativo en el hilo que lo itera.
+        """
+        total = self.renderer.page_count(self.document_path)
+        persistidas = {}
+        con_vision = {}
+        for i in range(total):
+            pagina = self.checkpoints.persistida(i)
+            if pagina is not None:
+                persistidas[i] = pagina
+                continue
+            pagina = self.checkpoints.con_vision(i)
+            if pagina is not None:
+                con_vision[i] = pagina
+        if persistidas or con_vision:
+            log.info(f"[pipeline] ⏩ Reanudando '{self.document_id}': {len(persistidas)} páginas persistidas, "
+                     f"{len(con_vision)} con visión")
+
+        locales = {i for i, tipo in enumerate(self.page_kinds[:total]) if tipo == PAGINA_TEXTO}
+        imagenes = self.renderer.iter_pages(
+            self.document_path,
+            [i for i in range(total) if i not in locales and i not in persistidas and i not in con_vision],
+        )
+
+        for page_number in range(total):
+            if page_number in persistidas:
+                # Ya persistida: directo al sink (textos=None) para los archivos combinados
+                self.resumen["paginas_reanudadas"] += 1
+                metrics.PAGES.inc(result="resumed")
+                yield "sink", (page_number, persistidas.pop(page_number), None, None, None)
+                continue
+
+            if page_number in con_vision:
+                self.resumen["paginas_reanudadas"] += 1
+                metrics.PAGES.inc(result="resumed")
+                yield "vision", (page_number, None, con_vision.pop(page_number))
+                continue
+
+            if page_number in locales:
+                self._inicio_pagina[page_number] = time.perf_counter()
+                yield "vision", (page_number, None, self._extraer_local(page_number))
+                continue
+
+            self._inicio_pagina[page_number] = time.perf_counter()
+            _, img_bytes = next(imagenes)
+            if img_bytes is not None:
+                self.checkpoints.marcar(page_number, "render")
+            yield "vision", (page_number, img_bytes, None)
+
+    def _etapa_vision(self):
+        while True:
+            item = self._q_vision.get()
+            if self._detenido.is_set():
+                return
+            if item is _FIN:
+                self._q_embedding.put(_FIN)
+                return
+
+            page_number, img_bytes, pagina_local = item
+            if pagina_local is not None or img_bytes is None:
+                # Página de texto nativo (ya extraída) o render fallido
+                self._q_embedding.put((page_number, pagina_local))
+                continue
+            try:
+                pagina = self._pagina_vision(page_number, *self._analizar(img_bytes, page_number))
+            except Exception as e:
+                log.error(f"[❌ ERROR] No se pudo procesar página {page_number + 1}: {e}")
+                self.checkpoints.error(page_number, f"visión: {e}")
+                pagina = None
+            del img_bytes
+            self._q_embedding.put((page_number, pagina))
+
+    def _pagina_vision(self, page_number, elementos, raw, tokens_in, tokens_out):
+        pagina = {
+            "pagina": page_number + 1,
+            "elementos": elementos,
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "raw": raw,
+        }
+        # Una respuesta sin elementos ni JSON no es un resultado a conservar
+        if elementos or raw != "{}":
+            self.checkpoints.marcar(page_number, "vision", pagina)
+        else:
+            self.checkpoints.error(page_number, "visión sin resultado")
+        return pagina
+
+    def _extraer_local(self, page_number):
+        """Extracción desde la capa de texto; si falla, la página se marca con error."""
+        try:
+            with documento(self.document_path) as doc:
+                pagina = extraer_pagina_texto(doc.load_page(page_number), page_number)
+            self.resumen["paginas_texto"] += 1
+            metrics.PAGES.inc(result="text")
+            self.checkpoints.marcar(page_number, "vision", pagina)
+            return pagina
+        except Exception as e:
+            log.error(f"[❌ ERROR] Extracción de texto nativo página {page_number + 1}: {e}")
+            self.checkpoints.error(page_number, f"texto nativo: {e}")
+            return None
+
+    def _analizar(self, img_bytes, page_number):
+        """Consulta el cache de visión antes de llamar al modelo."""
+        clave, cacheado = self._consultar_cache(img_bytes, page_number)
+        if cacheado is not None:
+            return cacheado
+        resultado = analyze_page_image(img_bytes, page_number, mime_type=self.renderer.mime_type)
+        self._guardar_en_cache(clave, resultado)
+        return resultado
+
+    def _consultar_cache(self, img_bytes, page_number):
+        """Retorna (clave, resultado cacheado o None); clave None si no hay cache."""
+        if self.vision_cache is None:
+            return None, None
+
+        clave = VisionCache.clave(img_bytes, MODEL_VISION, PROMPT_VERSION)
+        cacheado = self.vision_cache.obtener(clave, page_number)
+        if cacheado is None:
+            return clave, None
+
+        log.debug(f"[pipeline] ♻️ Página {page_number + 1} desde cache de visión")
+        with self._resumen_lock:
+            self.resumen["paginas_cache"] += 1
+        metrics.PAGES.inc(result="cache")
+        elementos, raw, _, _ = cacheado
+        # No hubo llamada al modelo: no se consumieron tokens
+        return clave, (elementos, raw, 0, 0)
+
+    def _guardar_en_cache(self, clave, resultado):
+        elementos, raw, tokens_in, tokens_out = resultado
+        # tokens_in == 0 indica error/timeout en la llamada: no se cachea
+        if clave is not None and tokens_in:
+            self.vision_cache.guardar(clave, MODEL_VISION, PROMPT_VERSION, elementos, raw, tokens_in, tokens_out)
+
+    def _etapa_embedding(self):
+        fines = 0
+        while fines < self.max_workers:
+            lote = []
+            item = self._q_embedding.get()
+            if self._detenido.is_set():
+                return
+            while True:
+                if item is _FIN:
+                    fines += 1
+                else:
+                    lote.append(item)
+                if fines >= self.max_workers or len(lote) >= MAX_PAGINAS_POR_LOTE_EMBEDDING:
+                    break
+                try:
+                    item = self._q_embedding.get_nowait()
+                except queue.Empty:
+                    break
+
+            if lote:
+                self._embeber_lote(lote)
+
+        self._q_sink.put(_FIN)
+
+    def _embeber_lote(self, lote):
+        """Un solo lote de embeddings para los elementos y páginas disponibles."""
+        textos = self._textos_lote(lote)
+        try:
+            vectores, fallidos = generar_embeddings_lote(textos)
+        except Exception as e:
+            log.error(f"[❌ error] Fallo lote de embeddings: {e}")
+            vectores, fallidos = {}, {clave: str(e) for clave in textos}
+
+        for item in self._salidas_lote(lote, textos, vectores, fallidos):
+            self._q_sink.put(item)
+
+    @staticmethod
+    def _textos_lote(lote):
+        textos = {}
+        for page_number, pagina in lote:
+            if pagina is None:
+                continue
+            textos_elem, texto_pagina = textos_de_pagina(pagina["elementos"])
+            for num_elem, texto in textos_elem.items():
+                textos[(page_number, num_elem)] = texto
+            if texto_pagina:
+                textos[(page_number, "pagina")] = texto_pagina
+        return textos
+
+    def _salidas_lote(self, lote, textos, vectores, fallidos):
+        """Items para el sink (con checkpoint de las páginas sin fallos)."""
+        salidas = []
+        for page_number, pagina in lote:
+            if pagina is not None and not any(c[0] == page_number for c in fallidos):
+                self.checkpoints.marcar(page_number, "embedding")
+            salidas.append((page_number, pagina, textos, vectores, fallidos))
+        return salidas
+
+    def _etapa_sink(self):
+        pendientes = {}
+        with ResultadosWriter(self.document_folder, self.document_id) as writer, \
+                RedisPipelineWriter() as self._redis, \
+                ShardWriter(self._storage_case_path(), self.document_id) as self._indice:
+            while True:
+                item = self._q_sink.get()
+                if item is _FIN:
+                    self._cerrar_indice()
+                    break
+
+                page_number, pagina, textos, vectores, fallidos = item
+                if pagina is not None and textos is None:
+                    # Página reanudada: ya está en Redis y en su JSON, solo falta el índice
+                    try:
+                        claves = self._claves_reanudada(page_number, pagina)
+                        self._indexar(claves, leer_embeddings(claves, self._redis.conexion))
+                    except Exception as e:
+                        log.warning(f"[⚠️] No se pudo indexar página reanudada {page_number + 1}: {e}")
+                        self._indice_parcial = True
+                    self._completas += 1
+                elif pagina is not None:
+                    try:
+                        contexto = self._preparar_pagina(page_number, pagina, textos, vectores, fallidos)
+                        for clave, datos in contexto["escrituras"]:
+                            self._redis.hset(clave, datos)
+                        self._cerrar_pagina(contexto, self._redis.flush())
+                    except Exception as e:
+                        log.error(f"[❌ ERROR] No se pudo guardar página {page_number + 1}: {e}")
+                        self.checkpoints.error(page_number, f"persistencia: {e}")
+                        pagina = None
+
+                self._escribir_en_orden(writer, pendientes, page_number, pagina)
+
+    def _storage_case_path(self):
+        return os.path.dirname(os.path.normpath(self.document_folder))
+
+    def _escribir_en_orden(self, writer, pendientes, page_number, pagina):
+        """Los archivos combinados se escriben en orden de página (libera la ventana)."""
+        pendientes[page_number] = pagina
+        while self._siguiente in pendientes:
+            pagina_ordenada = pendientes.pop(self._siguiente)
+            if pagina_ordenada is not None:
+                writer.escribir(pagina_ordenada)
+                self.resumen["paginas_ok"] += 1
+                metrics.PAGES.inc(result="ok")
+                self.resumen["tokens_in"] += pagina_ordenada.get("tokens_in", 0)
+                self.resumen["tokens_out"] += pagina_ordenada.get("tokens_out", 0)
+            else:
+                self.resumen["paginas_error"] += 1
+                metrics.PAGES.inc(result="error")
+            self._siguiente += 1
+            self._ventana.release()
+
+    def _claves_reanudada(self, page_number, pagina):
+        """Claves Redis con vectores de una página persistida en una ejecución anterior."""
+        key_base = f"doc_raw_page:{self.document_id}:p{page_number + 1}"
+        textos_elem, texto_pagina = textos_de_pagina(pagina["elementos"])
+        claves = [f"{key_base}_e{n}" for n in textos_elem]
+        if texto_pagina:
+            claves.append(key_base)
+        return claves
+
+    def _indexar(self, claves, vectores):
+        encontradas = [c for c in claves if c in vectores]
+        self._indice.agregar(encontradas, [vectores[c] for c in encontradas])
+        # Sin vector en Redis (p.ej. en la cola de reintentos): se conserva su fila anterior
+        self._indice.conservar.update(c for c in claves if c not in vectores)
+
+    def _cerrar_indice(self):
+        """
+        Si todas las páginas se reescribieron en esta ejecución el shard se
+        reemplaza (no quedan claves de elementos que ya no existen); si no, se
+        combina con el anterior.
+        """
+        self._indice.reemplazar = (
+            self._completas == self.resumen["paginas_total"] and not self._indice_parcial
+        )
+
+    def _preparar_pagina(self, page_number, pagina, textos, vectores, fallidos):
+        """
+        Retorna las escrituras Redis de la página (contexto["escrituras"], que
+        el sink acumula en self._redis y envía con un flush) y el contexto que
+        _cerrar_pagina necesita después del flush.
+        """
+        num_pagina = page_number + 1
+        reintentos = {}
+        key_base = f"doc_raw_page:{self.document_id}:p{num_pagina}"
+        claves_redis = {}
+        vectores_indice = {}
+        escrituras = []
+
+        for idx, elem in enumerate(pagina["elementos"]):
+            clave = (page_number, idx + 1)
+            if clave not in textos:
+                continue
+            emb = vectores.get(clave)
+            if not emb:
+                log.error(f"[❌ error] Fallo embedding en p{num_pagina}_e{idx + 1}: {fallidos.get(clave)}")
+                item = item_reintento(self.document_id, self.document_folder, page_number, idx + 1,
+                                      textos[clave], elem.get("tipo", ""), fallidos.get(clave))
+                reintentos[item["redis_key"]] = item
+                continue
+            claves_redis[f"{key_base}_e{idx + 1}"] = (idx + 1, textos[clave], elem.get("tipo", ""))
+            vectores_indice[f"{key_base}_e{idx + 1}"] = emb
+            escrituras.append((f"{key_base}_e{idx + 1}", {
+                "pagina": str(num_pagina),
+                "elemento": str(idx + 1),
+                "texto": textos[clave],
+                "tipo": elem.get("tipo", ""),
+                **datos_embedding(emb),
+            }))
+
+        clave_pagina = (page_number, "pagina")
+        if clave_pagina in textos:
+            emb_pagina = vectores.get(clave_pagina)
+            if emb_pagina:
+                datos_pagina = {
+                    "pagina": str(num_pagina),
+                    "texto": textos[clave_pagina],
+                    **datos_embedding(emb_pagina),
+                }
+                claves_redis[key_base] = (None, textos[clave_pagina], None)
+                claves_redis[f"{key_base}_full"] = (None, textos[clave_pagina], None)
+                vectores_indice[key_base] = emb_pagina
+                escrituras.append((key_base, datos_pagina))
+                escrituras.append((f"{key_base}_full", {**datos_pagina, "tipo": "pagina"}))
+            else:
+                log.error(f"[❌ error] Fallo embedding página {num_pagina}: {fallidos.get(clave_pagina)}")
+                item = item_reintento(self.document_id, self.document_folder, page_number, None,
+                                      textos[clave_pagina], error=fallidos.get(clave_pagina))
+                reintentos[item["redis_key"]] = item
+
+        return {
+            "page_number": page_number,
+            "pagina": pagina,
+            "escrituras": escrituras,
+            "reintentos": reintentos,
+            "claves_redis": claves_redis,
+            "vectores_indice": vectores_indice,
+        }
+
+    def _cerrar_pagina(self, contexto, fallidas_redis) -> bool:
+        """
+        Con el resultado del flush (todas las escrituras de la página en un
+        round trip): índice, JSON de la página, reintentos y checkpoint.
+        """
+        page_number = contexto["page_number"]
+        num_pagina = page_number + 1
+        reintentos = contexto["reintentos"]
+        claves_redis = contexto["claves_redis"]
+        vectores_indice = contexto["vectores_indice"]
+
+        for clave, error in fallidas_redis.items():
+            log.error(f"[❌ error] Fallo escritura Redis {clave}: {error}")
+            elemento, texto, tipo = claves_redis[clave]
+            item = item_reintento(self.document_id, self.document_folder, page_number, elemento,
+                                  texto, tipo, f"redis: {error}")
+            reintentos[item["redis_key"]] = item
+
+        # Solo se indexan los vectores que quedaron guardados en Redis
+        indexables = [c for c in vectores_indice if c not in fallidas_redis]
+        self._indice.agregar(indexables, [vectores_indice[c] for c in indexables])
+        self._indice.conservar.update(reintentos)
+
+        archivo_pagina = os.path.join(self.document_folder, f"{self.document_id}_pag_{num_pagina}.json")
+        with open(archivo_pagina, "w", encoding="utf-8") as f:
+            json.dump(contexto["pagina"], f, ensure_ascii=False, indent=2)
+        log.debug(f"[📄] Página {num_pagina} persistida")
+
+        if self._reintentos_previos:
+            database.delete_embedding_retries([c for c in claves_redis if c not in fallidas_redis])
+        try:
+            encolar_reintentos(list(reintentos.values()))
+        except Exception as e:
+            log.error(f"[❌ error] No se pudieron encolar reintentos de la página {num_pagina}: {e}")
+            completa = False
+        else:
+            completa = True
+
+        if completa:
+            self.checkpoints.marcar(page_number, "persisted")
+            self._completas += 1
+            inicio = self._inicio_pagina.pop(page_number, None)
+            if inicio is not None:
+                metrics.PAGE_SECONDS.observe(time.perf_counter() - inicio)
+        else:
+            self.checkpoints.error(page_number, "persistencia incompleta")
+        return completa
+
+
+class PipelinePaginasAsync(PipelinePaginas):
+    """
+    PipelinePaginas sobre asyncio (await arun()): visión y embeddings con
+    AsyncOpenAI y escrituras con redis.asyncio. Las esperas de red no ocupan
+    un hilo por request: cada documento mantiene hasta `concurrencia` llamadas
+    de visión en vuelo y un mismo event loop atiende varios documentos.
+
+    Las etapas, checkpoints, cache y orden de escritura son los de
+    PipelinePaginas. Lo que bloquea se ejecuta en un hilo (asyncio.to_thread)
+    para no detener el event loop compartido: render y texto nativo, cache de
+    visión y checkpoints (SQLite), y el cierre de cada página (shard, JSON y
+    cola de reintentos) en una sola llamada por página.
+    """
+
+    def __init__(self, document_id, document_path, document_folder, concurrencia=None, page_kinds=None):
+        super().__init__(document_id, document_path, document_folder, page_kinds=page_kinds)
+        self.concurrencia = max(1, concurrencia or EXTRACTOR_ASYNC_CONCURRENCY)
+        self._ventana = asyncio.Semaphore(self.concurrencia * 2 + 2)
+        self._q_vision = asyncio.Queue(maxsize=self.concurrencia)
+        self._q_embedding = asyncio.Queue(maxsize=self.concurrencia)
+        self._q_sink = asyncio.Queue(maxsize=self.concurrencia)
+
+    async def arun(self) -> dict:
+        t0 = time.time()
+        _activos.add(self)
+        tareas = [asyncio.create_task(self._etapa_render_async())]
+        tareas += [asyncio.create_task(self._etapa_vision_async()) for _ in range(self.concurrencia)]
+        tareas.append(asyncio.create_task(self._etapa_embedding_async()))
+        try:
+            await self._etapa_sink_async()
+        finally:
+            # Si el sink falló las demás etapas quedarían esperando en sus colas
+            for tarea in tareas:
+                tarea.cancel()
+            await asyncio.gather(*tareas, return_exceptions=True)
+            _activos.discard(self)
+            cerrar_documento(self.document_path)
+        return self._terminar(t0, f"async, concurrencia={self.concurrencia}")
+
+    async def _etapa_render_async(self):
+        try:
+            paginas = self._paginas()
+            while True:
+                paso = await asyncio.to_thread(next, paginas, None)
+                if paso is None:
+                    break
+                destino, item = paso
+                await self._ventana.acquire()
+                self.resumen["paginas_total"] += 1
+                await (self._q_sink if destino == "sink" else self._q_vision).put(item)
+        except Exception as e:
+            log.error(f"[pipeline] ❌ Error renderizando '{self.document_path}': {e}")
+            self._error = e
+        finally:
+            for _ in range(self.concurrencia):
+                await self._q_vision.put(_FIN)
+
+    async def _etapa_vision_async(self):
+        while True:
+            item = await self._q_vision.get()
+            if item is _FIN:
+                await self._q_embedding.put(_FIN)
+                return
+
+            page_number, img_bytes, pagina_local = item
+            if pagina_local is not None or img_bytes is None:
+                await self._q_embedding.put((page_number, pagina_local))
+                continue
+            try:
+                resultado = await self._analizar_async(img_bytes, page_number)
+                pagina = await asyncio.to_thread(self._pagina_vision, page_number, *resultado)
+            except Exception as e:
+                log.error(f"[❌ ERROR] No se pudo procesar página {page_number + 1}: {e}")
+                await asyncio.to_thread(self.checkpoints.error, page_number, f"visión: {e}")
+                pagina = None
+            del img_bytes
+            await self._q_embedding.put((page_number, pagina))
+
+    async def _analizar_async(self, img_bytes, page_number):
+        clave, cacheado = await asyncio.to_thread(self._consultar_cache, img_bytes, page_number)
+        if cacheado is not None:
+            return cacheado
+        resultado = await analyze_page_image_async(img_bytes, page_number, mime_type=self.renderer.mime_type)
+        await asyncio.to_thread(self._guardar_en_cache, clave, resultado)
+        return resultado
+
+    async def _etapa_embedding_async(self):
+        fines = 0
+        while fines < self.concurrencia:
+            lote = []
+            item = await self._q_embedding.get()
+            while True:
+                if item is _FIN:
+                    fines += 1
+                else:
+                    lote.append(item)
+                if fines >= self.concurrencia or len(lote) >= MAX_PAGINAS_POR_LOTE_EMBEDDING:
+                    break
+                try:
+                    item = self._q_embedding.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+
+            if lote:
+                textos = self._textos_lote(lote)
+                try:
+                    vectores, fallidos = await generar_embeddings_lote_async(textos)
+                except Exception as e:
+                    log.error(f"[❌ error] Fallo lote de embeddings: {e}")
+                    vectores, fallidos = {}, {clave: str(e) for clave in textos}
+                for salida in self._salidas_lote(lote, textos, vectores, fallidos):
+                    await self._q_sink.put(salida)
+
+        await self._q_sink.put(_FIN)
+
+    async def _etapa_sink_async(self):
+        pendientes = {}
+        # El cierre del shard combina el anterior bajo un lock de archivo: en un hilo
+        self._indice = await asyncio.to_thread(ShardWriter, self._storage_case_path(), self.document_id)
+        try:
+            with ResultadosWriter(self.document_folder, self.document_id) as writer:
+                async with RedisPipelineWriterAsync() as self._redis:
+                    while True:
+                        item = await self._q_sink.get()
+                        if item is _FIN:
+                            self._cerrar_indice()
+                            break
+
+                        page_number, pagina, textos, vectores, fallidos = item
+                        if pagina is not None and textos is None:
+                            try:
+                                claves = self._claves_reanudada(page_number, pagina)
+                                vectores = await leer_embeddings_async(claves, self._redis.conexion)
+                                await asyncio.to_thread(self._indexar, claves, vectores)
+                            except Exception as e:
+                                log.warning(f"[⚠️] No se pudo indexar página reanudada {page_number + 1}: {e}")
+                                self._indice_parcial = True
+                            self._completas += 1
+                        elif pagina is not None:
+                            try:
+                                contexto = self._preparar_pagina(page_number, pagina, textos, vectores, fallidos)
+                                for clave, datos in contexto["escrituras"]:
+                                    await self._redis.hset_async(clave, datos)
+                                fallidas = await self._redis.flush()
+                                await asyncio.to_thread(self._cerrar_pagina, contexto, fallidas)
+                            except Exception as e:
+                                log.error(f"[❌ ERROR] No se pudo guardar página {page_number + 1}: {e}")
+                                await asyncio.to_thread(self.checkpoints.error, page_number, f"persistencia: {e}")
+                                pagina = None
+
+                        self._escribir_en_orden(writer, pendientes, page_number, pagina)
+        except BaseException:
+            self._indice.descartar()
+            raise
+        await asyncio.to_thread(self._indice.cerrar)
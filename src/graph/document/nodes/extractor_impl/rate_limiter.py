@@ -0,0 +1,353 @@
+# rate_limiter.py
+#
+# Límite de tasa del lado del cliente para las llamadas a OpenAI (un
+# limitador por modelo: gpt-4o y text-embedding-3-small tienen cupos RPM/TPM
+# independientes).
+#
+# - Cupo compartido: token bucket de requests y tokens por modelo en la tabla
+#   rate_limits de ETL_DB_PATH, por lo que todos los procesos (workers batch,
+#   retry_embeddings) consumen del mismo presupuesto. Los límites se corrigen
+#   con los headers x-ratelimit-* de cada respuesta y un 429 bloquea el
+#   modelo para todos durante el retry-after.
+# - Concurrencia AIMD por proceso: las llamadas en vuelo bajan a la mitad con
+#   un 429 y suben de a una por ventana de respuestas exitosas.
+# - Reintentos: 429, timeouts, errores de conexión y 5xx se reintentan con
+#   backoff exponencial con jitter; al agotarse se propaga la excepción (el
+#   llamador decide, nunca se retorna un resultado vacío).
+#
+# Uso (la función retorna la respuesta cruda para poder leer los headers):
+#   resp = limitador(MODEL_VISION, "vision").llamar(
+#       lambda: cliente.chat.completions.with_raw_response.create(...))
+
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+from functools import partial
+
+from src import database, metrics
+from src.config import (
+    MODEL_VISION,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_VISION_RPM,
+    RATE_LIMIT_VISION_TPM,
+    RATE_LIMIT_EMBEDDING_RPM,
+    RATE_LIMIT_EMBEDDING_TPM,
+    RATE_LIMIT_BURST_SECONDS,
+    RATE_LIMIT_MAX_CONCURRENCY,
+    RATE_LIMIT_MAX_RETRIES,
+)
+
+log = logging.getLogger(__name__)
+
+# Tokens por request mientras no hay respuestas para promediar (si el
+# llamador no da una estimación)
+_TOKENS_INICIALES = 1000
+# Espera máxima entre reintentos sin indicación del servidor
+_BACKOFF_MAXIMO = 60.0
+
+_limitadores = {}
+_lock = threading.Lock()
+
+
+def limitador(modelo: str, operacion: str, tokens_iniciales: int | None = None) -> "LimitadorModelo":
+    """
+    Limitador del modelo en este proceso.
+    operacion: etiqueta de métricas y logs.
+    tokens_iniciales: tokens por request hasta tener respuestas para promediar.
+    """
+    actual = _limitadores.get(modelo)
+    if actual is not None:
+        return actual
+    with _lock:
+        if modelo not in _limitadores:
+            if modelo == MODEL_VISION:
+                rpm, tpm = RATE_LIMIT_VISION_RPM, RATE_LIMIT_VISION_TPM
+            else:
+                rpm, tpm = RATE_LIMIT_EMBEDDING_RPM, RATE_LIMIT_EMBEDDING_TPM
+            _limitadores[modelo] = LimitadorModelo(modelo, operacion, rpm, tpm,
+                                                   tokens_iniciales=tokens_iniciales)
+        return _limitadores[modelo]
+
+
+def _duracion(valor) -> float | None:
+    """Segundos de un header de reset ("20ms", "1s", "6m0s", "1h2m3.5s")."""
+    if not valor:
+        return None
+    partes = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", str(valor))
+    if not partes:
+        try:
+            return float(valor)
+        except ValueError:
+            return None
+    escala = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(n) * escala[u] for n, u in partes)
+
+
+def _numero(valor) -> float | None:
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _cabeceras(headers) -> dict:
+    """Límites, cupo restante y espera sugerida informados por la API."""
+    if headers is None:
+        return {}
+    retry_after = _numero(headers.get("retry-after-ms"))
+    retry_after = retry_after / 1000 if retry_after is not None else _numero(headers.get("retry-after"))
+    return {
+        "rpm": _numero(headers.get("x-ratelimit-limit-requests")),
+        "tpm": _numero(headers.get("x-ratelimit-limit-tokens")),
+        "remaining_requests": _numero(headers.get("x-ratelimit-remaining-requests")),
+        "remaining_tokens": _numero(headers.get("x-ratelimit-remaining-tokens")),
+        "reset_requests": _duracion(headers.get("x-ratelimit-reset-requests")),
+        "reset_tokens": _duracion(headers.get("x-ratelimit-reset-tokens")),
+        "retry_after": retry_after,
+    }
+
+
+def _clasificar(error) -> str | None:
+    """'rate_limit', 'transitorio' o None si reintentar no sirve (400, auth, sin saldo)."""
+    import openai
+
+    if isinstance(error, openai.RateLimitError):
+        return None if getattr(error, "code", None) == "insufficient_quota" else "rate_limit"
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)):
+        return "transitorio"
+    if isinstance(error, openai.APIStatusError) and error.status_code >= 500:
+        return "transitorio"
+    return None
+
+
+class LimitadorModelo:
+    def __init__(self, modelo, operacion, rpm, tpm, max_concurrencia=RATE_LIMIT_MAX_CONCURRENCY,
+                 max_reintentos=RATE_LIMIT_MAX_RETRIES, tokens_iniciales=None):
+        self.modelo = modelo
+        self.operacion = operacion
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrencia = max(1, max_concurrencia)
+        self.max_reintentos = max_reintentos
+        self._lock = threading.Lock()
+        self._concurrencia = float(self.max_concurrencia)
+        self._en_vuelo = 0
+        self._ultima_reduccion = 0.0
+        self._tokens_promedio = None
+        self._tokens_iniciales = tokens_iniciales or _TOKENS_INICIALES
+        metrics.RATE_LIMIT_CONCURRENCY.set(self._concurrencia, model=modelo)
+
+    # ------------------------------------------------------------------
+    # Drivers (sync / async) de la misma secuencia de intentos
+    # ------------------------------------------------------------------
+
+    def llamar(self, funcion, tokens=None):
+        """
+        Ejecuta funcion() (retorna la respuesta cruda de with_raw_response)
+        dentro del cupo y retorna la respuesta parseada.
+        tokens: consumo conocido del request (None = promedio de las respuestas).
+        """
+        if not RATE_LIMIT_ENABLED:
+            return funcion().parse()
+        intentos = self._intentos(tokens)
+        try:
+            accion, valor = next(intentos)
+            while True:
+                if accion == "esperar":
+                    time.sleep(valor)
+                    resultado = None
+                elif accion == "cupo":
+                    resultado = valor()
+                else:
+                    try:
+                        resultado = funcion()
+                    except Exception as e:
+                        resultado = e
+                accion, valor = intentos.send(resultado)
+        except StopIteration as fin:
+            return fin.value
+        finally:
+            intentos.close()
+
+    async def allamar(self, funcion, tokens=None):
+        """llamar() para clientes async: funcion() retorna una corrutina."""
+        if not RATE_LIMIT_ENABLED:
+            return (await funcion()).parse()
+        intentos = self._intentos(tokens)
+        try:
+            accion, valor = next(intentos)
+            while True:
+                if accion == "esperar":
+                    await asyncio.sleep(valor)
+                    resultado = None
+                elif accion == "cupo":
+                    # BEGIN IMMEDIATE en SQLite: fuera del event loop
+                    resultado = await asyncio.to_thread(valor)
+                else:
+                    try:
+                        resultado = await funcion()
+                    except Exception as e:
+                        resultado = e
+                accion, valor = intentos.send(resultado)
+        except StopIteration as fin:
+            return fin.value
+        finally:
+            intentos.close()
+
+    def _intentos(self, tokens):
+        """
+        Generador que produce ("esperar", segundos), ("cupo", función que lee o
+        actualiza el cupo compartido en SQLite y recibe su resultado) o
+        ("llamar", None) y recibe la respuesta cruda o la excepción de la
+        llamada. Retorna la respuesta parseada o lanza la excepción cuando no
+        corresponde reintentar.
+        """
+        estimados = self._estimar(tokens)
+        intento = 0
+        while True:
+            while not self._entrar():
+                yield "esperar", random.uniform(0.01, 0.05)
+
+            inicio = None
+            limitado = False
+            try:
+                while True:
+                    espera = yield "cupo", partial(
+                        database.acquire_rate_budget,
+                        self.modelo, estimados, self.rpm, self.tpm, RATE_LIMIT_BURST_SECONDS,
+                    )
+                    if espera <= 0:
+                        break
+                    # Jitter: los procesos que esperaban el mismo cupo no despiertan juntos
+                    espera += random.uniform(0, min(1.0, espera * 0.25) + 0.01)
+                    metrics.RATE_LIMIT_WAIT.inc(espera, model=self.modelo)
+                    yield "esperar", espera
+
+                inicio = time.monotonic()
+                resultado = yield "llamar", None
+                limitado = isinstance(resultado, Exception) and _clasificar(resultado) == "rate_limit"
+            finally:
+                self._salir(inicio, limitado)
+
+            if not isinstance(resultado, Exception):
+                respuesta, cupo = self._exito(resultado, estimados)
+                yield "cupo", partial(self._actualizar_cupo, **cupo)
+                return respuesta
+
+            tipo = _clasificar(resultado)
+            if tipo is None or intento >= self.max_reintentos:
+                if tipo is not None:
+                    log.error(f"[rate limit] ❌ {self.modelo}: {intento + 1} intentos fallidos ({resultado})")
+                raise resultado
+            intento += 1
+            metrics.RETRIES.inc(operation=f"{self.operacion}_{tipo}")
+            espera, cupo = self._fallo(resultado, tipo, intento, estimados)
+            if cupo is not None:
+                yield "cupo", partial(self._actualizar_cupo, **cupo)
+            yield "esperar", espera
+
+    # ------------------------------------------------------------------
+    # Resultado de cada intento
+    # ------------------------------------------------------------------
+
+    def _exito(self, crudo, estimados):
+        """(respuesta parseada, cambios del cupo compartido según uso y headers)."""
+        respuesta = crudo.parse()
+        usage = getattr(respuesta, "usage", None)
+        reales = getattr(usage, "total_tokens", None) if usage else None
+        if reales:
+            with self._lock:
+                previo = self._tokens_promedio
+                self._tokens_promedio = reales if previo is None else 0.8 * previo + 0.2 * reales
+
+        h = _cabeceras(getattr(crudo, "headers", None))
+        if h.get("rpm"):
+            self.rpm = h["rpm"]
+        if h.get("tpm"):
+            self.tpm = h["tpm"]
+        return respuesta, {
+            "tokens_delta": estimados - reales if reales else 0,
+            "rpm": h.get("rpm"), "tpm": h.get("tpm"),
+            "remaining_requests": h.get("remaining_requests"),
+            "remaining_tokens": h.get("remaining_tokens"),
+        }
+
+    def _fallo(self, error, tipo, intento, estimados) -> tuple[float, dict | None]:
+        """
+        Registra el fallo. Retorna la espera antes del siguiente intento y los
+        cambios del cupo compartido (None si no hay que tocarlo).
+        """
+        espera = random.uniform(0, min(_BACKOFF_MAXIMO, 2 ** intento))
+        if tipo != "rate_limit":
+            log.warning(f"[rate limit] ⚠️ {self.modelo}: {error}. Reintento {intento} en {espera:.1f}s")
+            return espera, None
+
+        h = _cabeceras(getattr(getattr(error, "response", None), "headers", None))
+        bloqueo = h.get("retry_after")
+        if bloqueo is None:
+            agotados = [h.get("reset_requests") if h.get("remaining_requests") == 0 else None,
+                        h.get("reset_tokens") if h.get("remaining_tokens") == 0 else None]
+            bloqueo = max((s for s in agotados if s is not None), default=None)
+        log.warning(f"[rate limit] ⏳ 429 en {self.modelo} (bloqueo {bloqueo or 0:.1f}s, "
+                    f"concurrencia {self._concurrencia:.1f}). Reintento {intento}")
+        # El request rechazado no consumió tokens: se devuelven al bucket
+        return espera, {
+            "tokens_delta": estimados,
+            "rpm": h.get("rpm"), "tpm": h.get("tpm"),
+            "remaining_requests": h.get("remaining_requests"),
+            "remaining_tokens": h.get("remaining_tokens"),
+            "blocked_until": time.time() + bloqueo if bloqueo else None,
+        }
+
+    def _actualizar_cupo(self, **cambios) -> None:
+        try:
+            database.update_rate_budget(self.modelo, RATE_LIMIT_BURST_SECONDS, **cambios)
+        except Exception as e:
+            log.warning(f"[rate limit] ⚠️ No se pudo actualizar el cupo de {self.modelo}: {e}")
+
+    # ------------------------------------------------------------------
+    # Concurrencia AIMD
+    # ------------------------------------------------------------------
+
+    def _estimar(self, tokens) -> int:
+        if tokens:
+            return int(tokens)
+        return int(self._tokens_promedio or self._tokens_iniciales)
+
+    def _entrar(self) -> bool:
+        with self._lock:
+            if self._en_vuelo >= max(1, int(self._concurrencia)):
+                return False
+            self._en_vuelo += 1
+            return True
+
+    def _salir(self, inicio, limitado) -> None:
+        with self._lock:
+            self._en_vuelo -= 1
+            if inicio is None:
+                return
+            if limitado:
+                # Una reducción por ventana: los 429 de llamadas que empezaron
+                # antes de la última reducción ya están contemplados
+                if inicio >= self._ultima_reduccion:
+                    self._concurrencia = max(1.0, self._concurrencia / 2)
+                    self._ultima_reduccion = time.monotonic()
+            else:
+                self._concurrencia = min(float(self.max_concurrencia),
+                                         self._concurrencia + 1 / self._concurrencia)
+            concurrencia = self._concurrencia
+        metrics.RATE_LIMIT_CONCURRENCY.set(concurrencia, model=self.modelo)
+
+
+def _reiniciar_en_hijo():
+    # Cada proceso tiene su propia concurrencia; el cupo compartido sigue en la base
+    global _limitadores, _lock
+    _limitadores, _lock = {}, threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
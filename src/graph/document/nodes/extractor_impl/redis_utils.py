@@ -1,60 +1,104 @@
 # utils/redis_utils.py
 
+import asyncio
+import logging
+import os
 import redis
 import json
-import os
-from dotenv import load_dotenv
-
-# Cargar variables desde .env si existe
-load_dotenv()
-
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-REDIS_DB = int(os.getenv("REDIS_DB", 0))
-REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
-REDIS_USERNAME = os.getenv("REDIS_USERNAME", None)
-REDIS_SSL = os.getenv("REDIS_USE_SSL", "false").lower() == "true"
-
-print(f"[redis_utils] 🧩 REDIS_HOST: {REDIS_HOST}")
-print(f"[redis_utils] 🧩 REDIS_PORT: {REDIS_PORT}")
-print(f"[redis_utils] 🧩 REDIS_DB: {REDIS_DB}")
-print(f"[redis_utils] 🧩 REDIS_USERNAME: {REDIS_USERNAME}")
-print(f"[redis_utils] 🧩 REDIS_SSL: {REDIS_SSL}")
-
-# Conexión global
-try:
-    redis_params = {
+import threading
+import time
+import weakref
+import numpy as np
+
+from src.config import (
+    REDIS_HOST,
+    REDIS_PORT,
+    REDIS_DB,
+    REDIS_PASSWORD,
+    REDIS_USERNAME,
+    REDIS_USE_SSL,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_WRITER_MAX_ITEMS,
+    REDIS_WRITER_MAX_BYTES,
+)
+from src import metrics
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Pool de conexiones compartido
+# ---------------------------------------------------------------------------
+# Todos los nodos usan los mismos pools (uno binario y uno con decode_responses)
+# para no abrir conexiones nuevas por cliente ni por escritura.
+# Los pools se crean en el primer uso (importar el módulo no conecta) y son
+# propios de cada proceso: un hijo creado con fork abre sus conexiones.
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Pools de redis.asyncio: uno por event loop (sus conexiones quedan ligadas al loop)
+_pools_async = weakref.WeakKeyDictionary()
+
+
+def _redis_params(decode_responses: bool) -> dict:
+    params = {
         "host": REDIS_HOST,
-        "port": REDIS_PORT,
-        "db": REDIS_DB,
-        "decode_responses": True,
+        "port": int(REDIS_PORT),
+        "db": int(REDIS_DB),
+        "decode_responses": decode_responses,
+        "max_connections": REDIS_MAX_CONNECTIONS,
     }
-
     if REDIS_PASSWORD:
-        redis_params["password"] = REDIS_PASSWORD
-        print("[redis_utils] 🔑 Usando contraseña para Redis")
-
+        params["password"] = REDIS_PASSWORD
     if REDIS_USERNAME:
-        redis_params["username"] = REDIS_USERNAME
-        print("[redis_utils] 👤 Usando usuario para Redis")
+        params["username"] = REDIS_USERNAME
+    if REDIS_USE_SSL:
+        params["connection_class"] = redis.SSLConnection
+    return params
+
+
+def get_redis_pool(decode_responses: bool = True) -> redis.ConnectionPool:
+    with _pools_lock:
+        pool = _pools.get(decode_responses)
+        if pool is None:
+            log.debug(f"[redis_utils] 🧩 Pool Redis {REDIS_HOST}:{REDIS_PORT}/{REDIS_DB} "
+                      f"(usuario={REDIS_USERNAME or None}, ssl={REDIS_USE_SSL}, binario={not decode_responses})")
+            pool = redis.ConnectionPool(**_redis_params(decode_responses))
+            _pools[decode_responses] = pool
+        return pool
+
+
+def get_redis_connection(decode_responses: bool = True) -> redis.Redis:
+    """
+    Devuelve un cliente Redis sobre el pool compartido.
+    Para leer embeddings binarios usar decode_responses=False.
+    """
+    return redis.Redis(connection_pool=get_redis_pool(decode_responses))
+
+
+def get_async_redis_connection(decode_responses: bool = True):
+    """Cliente redis.asyncio del event loop actual (llamar desde una corrutina)."""
+    import redis.asyncio as aioredis
 
-    if REDIS_SSL:
-        redis_params["ssl"] = True
-        print("[redis_utils] 🔐 Conexión con SSL ACTIVADA")
-    else:
-        print("[redis_utils] 🛡️ Conexión sin SSL")
+    pools = _pools_async.setdefault(asyncio.get_running_loop(), {})
+    pool = pools.get(decode_responses)
+    if pool is None:
+        params = _redis_params(decode_responses)
+        if REDIS_USE_SSL:
+            params["connection_class"] = aioredis.SSLConnection
+        pool = aioredis.ConnectionPool(**params)
+        pools[decode_responses] = pool
+    return aioredis.Redis(connection_pool=pool)
 
-    print(f"[redis_utils] 🚀 Conectando a Redis con parámetros: {redis_params}")
 
-    r = redis.Redis(**redis_params)
-    r.ping()
-    print("[redis_utils] ✅ Conexión exitosa a Redis")
+def _reiniciar_en_hijo():
+    # Se descartan (sin cerrar) los pools del padre; el lock pudo quedar tomado
+    global _pools, _pools_async, _pools_lock
+    _pools, _pools_async, _pools_lock = {}, weakref.WeakKeyDictionary(), threading.Lock()
 
-except Exception as e:
-    print(f"[redis_utils] ❌ Error conectando a Redis: {e}")
-    import traceback
-    traceback.print_exc()
-    r = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
 
 
 def guardar_en_redis(clave, datos):
@@ -62,66 +106,325 @@ def guardar_en_redis(clave, datos):
     Guarda un diccionario como hash en Redis.
     Convierte automáticamente valores que sean listas o diccionarios a JSON string.
     """
-    if r is None:
-        print(f"[redis_utils] ⚠️ Redis no está conectado. No se puede guardar {clave}")
-        return
-
     try:
-        print(f"[redis_utils] 💾 Guardando clave: {clave}")
+        log.debug(f"[redis_utils] 💾 Guardando clave: {clave}")
         datos_serializados = {
             k: json.dumps(v) if isinstance(v, (dict, list)) else v
             for k, v in datos.items()
         }
-        r.hset(clave, mapping=datos_serializados)
-        print(f"[redis_utils] ✅ Guardado en Redis: {clave}")
+        get_redis_connection().hset(clave, mapping=datos_serializados)
+        log.debug(f"[redis_utils] ✅ Guardado en Redis: {clave}")
     except Exception as e:
-        print(f"[redis_utils] ❌ Error guardando {clave}: {e}")
+        log.error(f"[redis_utils] ❌ Error guardando {clave}: {e}")
         import traceback
         traceback.print_exc()
 
 
 def leer_hash(clave):
-    """Lee un hash de Redis y deserializa campos JSON si aplica"""
-    if r is None:
-        print(f"[redis_utils] ⚠️ Redis no está conectado. No se puede leer {clave}")
-        return {}
-
+    """
+    Lee un hash de Redis y deserializa campos JSON si aplica.
+    El campo embedding se devuelve como np.ndarray float32 (binario o JSON legado).
+    """
     try:
-        print(f"[redis_utils] 📥 Leyendo hash: {clave}")
-        data = r.hgetall(clave)
-        for k, v in data.items():
+        log.debug(f"[redis_utils] 📥 Leyendo hash: {clave}")
+        crudo = get_redis_connection(decode_responses=False).hgetall(clave)
+        data = {}
+        for k, v in crudo.items():
+            k = k.decode("utf-8")
+            if k == "embedding":
+                continue
+            v = v.decode("utf-8")
             try:
                 data[k] = json.loads(v)
             except Exception:
-                pass  # Mantener valor como string si no es JSON
+                data[k] = v  # Mantener valor como string si no es JSON
+        if b"embedding" in crudo:
+            data["embedding"] = decodificar_embedding(crudo[b"embedding"], crudo.get(b"embedding_format"))
         return data
     except Exception as e:
-        print(f"[redis_utils] ❌ Error al leer {clave}: {e}")
+        log.error(f"[redis_utils] ❌ Error al leer {clave}: {e}")
         import traceback
         traceback.print_exc()
         return {}
 
 
-import redis
-from src.config import (
-    REDIS_HOST,
-    REDIS_PORT,
-    REDIS_DB,
-    REDIS_PASSWORD,
-    REDIS_USERNAME,
-)
+# ---------------------------------------------------------------------------
+# Escritura por pipeline
+# ---------------------------------------------------------------------------
+
+def _tamano(valor) -> int:
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return len(valor)
+    return len(str(valor).encode("utf-8"))
 
 
-def get_redis_connection() -> redis.Redis:
+class RedisPipelineWriter:
     """
-    Devuelve una conexión directa a Redis para operaciones como scan_iter.
+    Acumula escrituras (HSET) y las envía en un solo round trip con un
+    pipeline sin transacción.
+
+    - flush automático al alcanzar max_items comandos o max_bytes
+    - flush explícito en los límites de página/documento (flush() o al salir del with)
+    - los errores se reportan por clave: flush() retorna {clave: error} de
+      todas las escrituras desde el flush explícito anterior (incluidos los
+      automáticos) y se acumulan en self.fallidos
     """
-    return redis.Redis(
-        host=REDIS_HOST,
-        port=REDIS_PORT,
-        db=REDIS_DB,
-        decode_responses=True,
-        username=REDIS_USERNAME,
-        password=REDIS_PASSWORD,
-        ssl=False  # conexión sin SSL
-    )
\ No newline at end of file
+
+    def __init__(self, conexion=None, max_items=REDIS_WRITER_MAX_ITEMS, max_bytes=REDIS_WRITER_MAX_BYTES):
+        self.conexion = conexion or get_redis_connection(decode_responses=False)
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.fallidos = {}
+        self.escritas = 0
+        self._pendientes = []
+        self._bytes = 0
+        # Fallos de los flush automáticos que aún no retornó flush()
+        self._fallidos_tramo = {}
+
+    def hset(self, clave, datos: dict):
+        self._agregar(clave, datos)
+        if self._lleno():
+            self._fallidos_tramo.update(self._enviar())
+
+    def _lleno(self) -> bool:
+        return len(self._pendientes) >= self.max_items or self._bytes >= self.max_bytes
+
+    def _agregar(self, clave, datos: dict):
+        datos_serializados = {
+            k: json.dumps(v) if isinstance(v, (dict, list)) else v
+            for k, v in datos.items()
+        }
+        self._pendientes.append((clave, datos_serializados))
+        self._bytes += _tamano(clave) + sum(_tamano(k) + _tamano(v) for k, v in datos_serializados.items())
+
+    def _pipeline(self, pendientes):
+        pipe = self.conexion.pipeline(transaction=False)
+        for clave, datos in pendientes:
+            pipe.hset(clave, mapping=datos)
+        return pipe
+
+    def flush(self) -> dict:
+        fallidos = {**self._fallidos_tramo, **self._enviar()}
+        self._fallidos_tramo = {}
+        return fallidos
+
+    def _enviar(self) -> dict:
+        if not self._pendientes:
+            return {}
+
+        pendientes, self._pendientes, self._bytes = self._pendientes, [], 0
+        inicio = time.perf_counter()
+        try:
+            resultados = self._pipeline(pendientes).execute(raise_on_error=False)
+        except Exception as e:
+            resultados = e
+        return self._registrar(pendientes, resultados, inicio)
+
+    def _registrar(self, pendientes, resultados, inicio) -> dict:
+        """Claves fallidas del pipeline (una excepción en resultados = fallan todas)."""
+        if isinstance(resultados, Exception):
+            # Error de conexión: fallan todas las claves del pipeline
+            fallidos = {clave: str(resultados) for clave, _ in pendientes}
+        else:
+            fallidos = {
+                clave: str(resultado)
+                for (clave, _), resultado in zip(pendientes, resultados)
+                if isinstance(resultado, Exception)
+            }
+
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - inicio, stage="redis")
+        self.escritas += len(pendientes) - len(fallidos)
+        if fallidos:
+            metrics.ERRORS.inc(len(fallidos), operation="redis")
+            log.error(f"[redis_utils] ❌ {len(fallidos)}/{len(pendientes)} escrituras fallidas")
+            self.fallidos.update(fallidos)
+        return fallidos
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+
+class RedisPipelineWriterAsync(RedisPipelineWriter):
+    """
+    RedisPipelineWriter sobre redis.asyncio: await hset_async() (con el mismo
+    flush automático por max_items/max_bytes) y await flush() en los límites
+    de página/documento o al salir del async with.
+    """
+
+    def __init__(self, conexion=None, max_items=REDIS_WRITER_MAX_ITEMS, max_bytes=REDIS_WRITER_MAX_BYTES):
+        super().__init__(conexion or get_async_redis_connection(decode_responses=False), max_items, max_bytes)
+
+    def hset(self, clave, datos: dict):
+        # El flush automático necesita await
+        raise TypeError("RedisPipelineWriterAsync: usar await hset_async()")
+
+    async def hset_async(self, clave, datos: dict):
+        self._agregar(clave, datos)
+        if self._lleno():
+            self._fallidos_tramo.update(await self._enviar_async())
+
+    async def flush(self) -> dict:
+        fallidos = {**self._fallidos_tramo, **await self._enviar_async()}
+        self._fallidos_tramo = {}
+        return fallidos
+
+    async def _enviar_async(self) -> dict:
+        if not self._pendientes:
+            return {}
+
+        pendientes, self._pendientes, self._bytes = self._pendientes, [], 0
+        inicio = time.perf_counter()
+        try:
+            resultados = await self._pipeline(pendientes).execute(raise_on_error=False)
+        except Exception as e:
+            resultados = e
+        return self._registrar(pendientes, resultados, inicio)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.flush()
+        return False
+
+
+# ---------------------------------------------------------------------------
+# Embeddings binarios
+# ---------------------------------------------------------------------------
+# Los vectores se guardan como bytes float32 little-endian (4 bytes por
+# dimensión) con el campo embedding_format = "f32le". Los hashes antiguos
+# guardan el vector como lista JSON y no tienen embedding_format.
+
+EMBEDDING_FORMAT = "f32le"
+_DTYPE = np.dtype("<f4")
+
+
+def codificar_embedding(vector) -> bytes:
+    """Convierte un vector (lista o ndarray) a bytes float32 little-endian."""
+    return np.asarray(vector, dtype=_DTYPE).tobytes()
+
+
+def decodificar_embedding(valor, formato=None) -> np.ndarray:
+    """
+    Convierte el campo embedding leído de Redis a np.ndarray float32.
+    El formato binario se decodifica sin copia (array de solo lectura sobre los bytes).
+    """
+    if isinstance(formato, bytes):
+        formato = formato.decode("ascii")
+    if formato == EMBEDDING_FORMAT:
+        return np.frombuffer(valor, dtype=_DTYPE)
+    if isinstance(valor, bytes):
+        valor = valor.decode("utf-8")
+    return np.asarray(json.loads(valor), dtype=_DTYPE)
+
+
+def datos_embedding(vector) -> dict:
+    """Campos de hash para guardar un embedding en formato binario."""
+    return {"embedding": codificar_embedding(vector), "embedding_format": EMBEDDING_FORMAT}
+
+
+def leer_embeddings(claves, conexion=None) -> dict:
+    """
+    Lee el embedding de varias claves en un solo round trip.
+    Retorna {clave: np.ndarray}; las claves sin embedding se omiten.
+    """
+    conexion = conexion or get_redis_connection(decode_responses=False)
+    pipe = conexion.pipeline(transaction=False)
+    for clave in claves:
+        pipe.hmget(clave, "embedding", "embedding_format")
+
+    vectores = {}
+    for clave, (valor, formato) in zip(claves, pipe.execute()):
+        if valor is not None:
+            vectores[clave] = decodificar_embedding(valor, formato)
+    return vectores
+
+
+async def leer_embeddings_async(claves, conexion=None) -> dict:
+    """leer_embeddings sobre redis.asyncio."""
+    conexion = conexion or get_async_redis_connection(decode_responses=False)
+    pipe = conexion.pipeline(transaction=False)
+    for clave in claves:
+        pipe.hmget(clave, "embedding", "embedding_format")
+
+    vectores = {}
+    for clave, (valor, formato) in zip(claves, await pipe.execute()):
+        if valor is not None:
+            vectores[clave] = decodificar_embedding(valor, formato)
+    return vectores
+
+
+def leer_embedding(clave, conexion=None):
+    """Lee el embedding de una clave como np.ndarray (None si no existe)."""
+    return leer_embeddings([clave], conexion).get(clave)
+
+
+# Reemplaza el embedding solo si el hash sigue con el JSON leído y sin
+# embedding_format: una escritura concurrente (p.ej. un reintento) no se pisa
+_MIGRAR_EMBEDDING_LUA = """
+if redis.call('HEXISTS', KEYS[1], 'embedding_format') == 1
+        or redis.call('HGET', KEYS[1], 'embedding') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'embedding', ARGV[2], 'embedding_format', ARGV[3])
+return 1
+"""
+
+
+def migrar_embeddings_binarios(patron="doc_raw_page:*", lote=500, dry_run=False) -> dict:
+    """
+    Convierte en su lugar los embeddings JSON legados a formato binario float32.
+    Es idempotente: los hashes que ya tienen embedding_format se omiten, y
+    cada conversión es atómica (script Lua) frente a escrituras concurrentes.
+    """
+    conexion = get_redis_connection(decode_responses=False)
+    migrar = conexion.register_script(_MIGRAR_EMBEDDING_LUA)
+    resumen = {"revisadas": 0, "migradas": 0, "omitidas": 0, "errores": 0}
+
+    claves = []
+    for clave in conexion.scan_iter(match=patron, count=1000):
+        claves.append(clave)
+        if len(claves) >= lote:
+            _migrar_lote(conexion, migrar, claves, resumen, dry_run)
+            claves = []
+    if claves:
+        _migrar_lote(conexion, migrar, claves, resumen, dry_run)
+
+    log.info(f"[redis_utils] ✅ Migración embeddings: {resumen}")
+    return resumen
+
+
+def _migrar_lote(conexion, migrar, claves, resumen, dry_run):
+    pipe = conexion.pipeline(transaction=False)
+    for clave in claves:
+        pipe.hmget(clave, "embedding", "embedding_format")
+    valores = pipe.execute()
+
+    pipe = conexion.pipeline(transaction=False)
+    convertidas = 0
+    for clave, (valor, formato) in zip(claves, valores):
+        resumen["revisadas"] += 1
+        if valor is None or formato is not None:
+            resumen["omitidas"] += 1
+            continue
+        try:
+            vector = decodificar_embedding(valor)
+        except Exception as e:
+            log.error(f"[redis_utils] ❌ Embedding inválido en {clave!r}: {e}")
+            resumen["errores"] += 1
+            continue
+        if dry_run:
+            resumen["migradas"] += 1
+        else:
+            migrar(keys=[clave], args=[valor, codificar_embedding(vector), EMBEDDING_FORMAT], client=pipe)
+            convertidas += 1
+
+    if convertidas:
+        # 0 = el hash cambió entre la lectura y el script: se omite
+        migradas = sum(1 for r in pipe.execute() if r == 1)
+        resumen["migradas"] += migradas
+        resumen["omitidas"] += convertidas - migradas
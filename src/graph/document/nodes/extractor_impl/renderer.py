@@ -0,0 +1,344 @@
+# renderer.py
+
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.config import (
+    RENDER_DPI,
+    RENDER_FORMAT,
+    RENDER_COLORSPACE,
+    RENDER_QUALITY,
+    RENDER_MAX_LONG_SIDE,
+    RENDER_MAX_SHORT_SIDE,
+    RENDER_PROCESSES,
+    RENDER_ADAPTIVE,
+    RENDER_QUALITY_MIN,
+    RENDER_LOW_DETAIL_COMPLEXITY,
+    RENDER_TILE_SLACK,
+)
+from src import metrics
+from .image_preprocess import TILE, analizar_pagina, ajuste_tiles, calidad_adaptativa
+
+log = logging.getLogger(__name__)
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+# Documentos abiertos por proceso (cada worker del pool mantiene los suyos).
+# PyMuPDF no es thread-safe: el acceso a los documentos se serializa con un lock.
+# fitz se importa al abrir el primer documento (no al importar el módulo).
+MAX_DOCUMENTOS_ABIERTOS = 4
+_documentos = OrderedDict()
+_documentos_lock = threading.RLock()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def opciones_render(**cambios) -> dict:
+    """Opciones de render según config, con cambios opcionales."""
+    opciones = {
+        "dpi": RENDER_DPI,
+        "formato": RENDER_FORMAT,
+        "colorspace": RENDER_COLORSPACE,
+        "calidad": RENDER_QUALITY,
+        "max_lado_largo": RENDER_MAX_LONG_SIDE,
+        "max_lado_corto": RENDER_MAX_SHORT_SIDE,
+        "adaptativo": RENDER_ADAPTIVE,
+        "calidad_min": RENDER_QUALITY_MIN,
+        "complejidad_detalle_bajo": RENDER_LOW_DETAIL_COMPLEXITY,
+        "holgura_tiles": RENDER_TILE_SLACK,
+    }
+    opciones.update(cambios)
+    if opciones["formato"] == "jpg":
+        opciones["formato"] = "jpeg"
+    if opciones["formato"] not in MIME_TYPES:
+        raise ValueError(f"Formato de render no soportado: {opciones['formato']}")
+    if opciones["colorspace"] not in ("rgb", "gray"):
+        raise ValueError(f"Colorspace de render no soportado: {opciones['colorspace']}")
+    return opciones
+
+
+def calcular_zoom(ancho_pt, alto_pt, dpi, max_lado_largo=0, max_lado_corto=0) -> float:
+    """
+    Factor de escala para el dpi pedido, limitado para que la imagen no
+    supere el tamaño que el modelo de visión realmente utiliza.
+    """
+    zoom = dpi / 72
+    largo, corto = max(ancho_pt, alto_pt), min(ancho_pt, alto_pt)
+    if max_lado_largo and largo * zoom > max_lado_largo:
+        zoom = max_lado_largo / largo
+    if max_lado_corto and corto * zoom > max_lado_corto:
+        zoom = max_lado_corto / corto
+    return zoom
+
+
+def _abrir_documento(pdf_path):
+    """
+    Retorna el documento abierto en este proceso (lo abre una sola vez).
+    La clave incluye tamaño y mtime para no reutilizar un archivo que cambió.
+    """
+    import fitz  # PyMuPDF
+
+    st = os.stat(pdf_path)
+    clave = (pdf_path, st.st_size, st.st_mtime_ns)
+    with _documentos_lock:
+        doc = _documentos.get(clave)
+        if doc is not None:
+            _documentos.move_to_end(clave)
+            return doc
+
+        doc = fitz.open(pdf_path)
+        _documentos[clave] = doc
+        while len(_documentos) > MAX_DOCUMENTOS_ABIERTOS:
+            _, antiguo = _documentos.popitem(last=False)
+            antiguo.close()
+        return doc
+
+
+@contextmanager
+def documento(pdf_path):
+    """Acceso exclusivo (thread-safe) al documento abierto en este proceso."""
+    with _documentos_lock:
+        yield _abrir_documento(pdf_path)
+
+
+def cerrar_documento(pdf_path):
+    """Cierra el documento en el proceso actual si estaba abierto."""
+    with _documentos_lock:
+        for clave in [c for c in _documentos if c[0] == pdf_path]:
+            _documentos.pop(clave).close()
+
+
+def _codificar(pix, formato, calidad) -> bytes:
+    if formato == "png":
+        return pix.tobytes("png")
+    if formato == "jpeg":
+        return pix.tobytes("jpg", jpg_quality=calidad)
+
+    # webp: PyMuPDF no lo codifica, se usa Pillow (dependencia opcional)
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise RuntimeError("RENDER_FORMAT=webp requiere Pillow instalado") from e
+    modo = "L" if pix.n == 1 else "RGB"
+    img = Image.frombytes(modo, (pix.width, pix.height), pix.samples)
+    buffer = io.BytesIO()
+    img.save(buffer, "WEBP", quality=calidad)
+    return buffer.getvalue()
+
+
+def render_page(pdf_path: str, page_number: int, opciones: dict | None = None) -> bytes:
+    """Rasteriza una página y la codifica según las opciones de render."""
+    import fitz  # PyMuPDF
+
+    opciones = opciones or opciones_render()
+    with _documentos_lock:
+        doc = _abrir_documento(pdf_path)
+        page = doc.load_page(page_number)
+
+        zoom = calcular_zoom(
+            page.rect.width,
+            page.rect.height,
+            opciones["dpi"],
+            opciones["max_lado_largo"],
+            opciones["max_lado_corto"],
+        )
+        colorspace = fitz.csGRAY if opciones["colorspace"] == "gray" else fitz.csRGB
+        clip, calidad = None, opciones["calidad"]
+        if opciones["adaptativo"]:
+            zoom, clip, colorspace, calidad = _plan_adaptativo(page, zoom, opciones)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=colorspace, alpha=False)
+    return _codificar(pix, opciones["formato"], calidad)
+
+
+def _plan_adaptativo(page, zoom: float, opciones: dict):
+    """
+    (zoom, clip, colorspace, calidad) según el análisis de la página: solo el
+    área con contenido, con la densidad de la página completa ajustada a la
+    grilla de tiles, en gris si no hay color.
+    """
+    import fitz  # PyMuPDF
+
+    analisis = analizar_pagina(page)
+    clip = analisis["clip"] or page.rect
+    if analisis["clip"] is None or analisis["complejidad"] < opciones["complejidad_detalle_bajo"]:
+        # En blanco (o bajo el umbral configurado): alcanza con lo que el modelo ve en detail=low
+        zoom = min(zoom, (TILE - 1) / max(clip.width, clip.height))
+    zoom *= ajuste_tiles(clip.width * zoom, clip.height * zoom, opciones["holgura_tiles"])
+
+    gris = opciones["colorspace"] == "gray" or not analisis["color"]
+    calidad = calidad_adaptativa(analisis["complejidad"], opciones["calidad_min"], opciones["calidad"])
+    return zoom, clip, fitz.csGRAY if gris else fitz.csRGB, calidad
+
+
+def _render_medido(pdf_path: str, page_number: int, opciones: dict) -> tuple[bytes, float]:
+    """render_page + su duración (medida en el worker del pool, sin la espera en cola)."""
+    inicio = time.perf_counter()
+    return render_page(pdf_path, page_number, opciones), time.perf_counter() - inicio
+
+
+def get_render_pool():
+    """
+    Pool de procesos compartido para rasterizar (None si RENDER_PROCESSES <= 0).
+    Usa spawn para no heredar hilos ni conexiones del proceso principal.
+    """
+    global _pool
+    if RENDER_PROCESSES <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=RENDER_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _reiniciar_en_hijo():
+    # Un hijo creado con fork no comparte el pool ni los documentos del padre
+    global _pool, _pool_lock, _documentos, _documentos_lock
+    _pool, _pool_lock = None, threading.Lock()
+    _documentos, _documentos_lock = OrderedDict(), threading.RLock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
+
+
+def _descartar_pool(pool):
+    """Saca del uso un pool roto (un worker murió): el próximo get_render_pool crea otro."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_render_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+class PdfRenderer:
+    """
+    Renderiza las páginas de un PDF en el pool de procesos.
+
+    iter_pages mantiene hasta `prefetch` páginas en render y las entrega en
+    orden, de modo que la rasterización corre en paralelo a las llamadas
+    al modelo sin acumular imágenes en memoria.
+
+    Si un worker muere (BrokenProcessPool) el pool se reemplaza y las páginas
+    en vuelo se reintentan una vez en el nuevo; las que estaban en vuelo en
+    dos caídas se entregan como fallidas.
+    """
+
+    # Caídas del pool que toleran las páginas en vuelo antes de darse por fallidas
+    MAX_CAIDAS_POOL = 1
+
+    def __init__(self, opciones: dict | None = None, prefetch: int | None = None):
+        self.opciones = opciones or opciones_render()
+        self.prefetch = prefetch or max(RENDER_PROCESSES, 1) * 2
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES[self.opciones["formato"]]
+
+    def page_count(self, pdf_path: str) -> int:
+        with _documentos_lock:
+            return _abrir_documento(pdf_path).page_count
+
+    def iter_pages(self, pdf_path: str, page_numbers=None):
+        """
+        Genera (page_number, bytes) en orden.
+        Si una página no se puede renderizar se entrega (page_number, None).
+        """
+        if page_numbers is None:
+            page_numbers = range(self.page_count(pdf_path))
+
+        pool = get_render_pool()
+        if pool is None:
+            for page_number in page_numbers:
+                try:
+                    img_bytes, segundos = _render_medido(pdf_path, page_number, self.opciones)
+                except Exception as e:
+                    log.error(f"[renderer] ❌ Error renderizando página {page_number + 1}: {e}")
+                    metrics.ERRORS.inc(operation="render")
+                    yield page_number, None
+                    continue
+                metrics.STAGE_SECONDS.observe(segundos, stage="render")
+                yield page_number, img_bytes
+            return
+
+        pendientes = deque(page_numbers)
+        caidas = {}
+        while pendientes:
+            try:
+                yield from self._iter_pool(pool, pdf_path, pendientes, caidas)
+            except BrokenProcessPool as e:
+                log.warning(f"[renderer] ⚠️ Pool de render roto ({e}): se recrea y se reintentan las páginas en vuelo")
+                metrics.ERRORS.inc(operation="render_pool")
+                _descartar_pool(pool)
+                pool = get_render_pool()
+
+    def _iter_pool(self, pool, pdf_path, pendientes, caidas):
+        """
+        Renderiza `pendientes` en el pool (consumiéndolas en orden). Si el pool
+        se rompe, las páginas en vuelo vuelven al inicio de `pendientes`, se
+        cuenta la caída en `caidas` y se relanza BrokenProcessPool.
+        """
+        en_vuelo = deque()
+        try:
+            while pendientes or en_vuelo:
+                while pendientes and len(en_vuelo) < self.prefetch:
+                    page_number = pendientes[0]
+                    if caidas.get(page_number, 0) > self.MAX_CAIDAS_POOL:
+                        futuro = None
+                    else:
+                        futuro = pool.submit(_render_medido, pdf_path, page_number, self.opciones)
+                    en_vuelo.append((page_number, futuro))
+                    pendientes.popleft()
+                resultado = self._resultado(*en_vuelo[0])
+                en_vuelo.popleft()
+                yield resultado
+        except BrokenProcessPool:
+            for page_number, _ in en_vuelo:
+                caidas[page_number] = caidas.get(page_number, 0) + 1
+            pendientes.extendleft(reversed([page_number for page_number, _ in en_vuelo]))
+            en_vuelo.clear()
+            raise
+        finally:
+            for _, futuro in en_vuelo:
+                if futuro is not None:
+                    futuro.cancel()
+
+    @staticmethod
+    def _resultado(page_number, futuro):
+        if futuro is None:
+            log.error(f"[renderer] ❌ Página {page_number + 1} descartada: el pool de render se rompió dos veces con ella en vuelo")
+            metrics.ERRORS.inc(operation="render")
+            return page_number, None
+        try:
+            img_bytes, segundos = futuro.result()
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            log.error(f"[renderer] ❌ Error renderizando página {page_number + 1}: {e}")
+            metrics.ERRORS.inc(operation="render")
+            return page_number, None
+        metrics.STAGE_SECONDS.observe(segundos, stage="render")
+        return page_number, img_bytes
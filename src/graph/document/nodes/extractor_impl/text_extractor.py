@@ -0,0 +1,119 @@
+# text_extractor.py
+
+import json
+import statistics
+
+from src.config import REVIEW_MIN_CHARS, REVIEW_MAX_IMAGE_COVERAGE
+
+# Tipos de página según su contenido
+PAGINA_TEXTO = "texto"          # capa de texto nativa utilizable → extracción local
+PAGINA_ESCANEADA = "escaneada"  # sin texto, imagen de página completa → visión
+PAGINA_MIXTA = "mixta"          # texto + imágenes/firmas relevantes → visión
+
+
+def clasificar_pagina(page) -> str:
+    """
+    Clasifica una página de PyMuPDF según su capa de texto y la superficie
+    cubierta por imágenes.
+    """
+    texto = page.get_text("text").strip()
+    n_chars = len(texto)
+    # Fuentes sin mapeo unicode generan caracteres de reemplazo: texto inutilizable
+    if n_chars and texto.count("�") / n_chars > 0.05:
+        n_chars = 0
+
+    area_pagina = abs(page.rect) or 1
+    area_imagenes = 0
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        area_imagenes += max(0, x1 - x0) * max(0, y1 - y0)
+    cobertura = min(area_imagenes / area_pagina, 1.0)
+
+    if n_chars < REVIEW_MIN_CHARS:
+        return PAGINA_ESCANEADA if cobertura > 0.5 or n_chars == 0 else PAGINA_MIXTA
+    if cobertura > REVIEW_MAX_IMAGE_COVERAGE:
+        return PAGINA_MIXTA
+    return PAGINA_TEXTO
+
+
+def _tablas(page):
+    """Tablas detectadas por PyMuPDF (find_tables existe desde la 1.23)."""
+    try:
+        return list(page.find_tables().tables)
+    except AttributeError:
+        return []
+
+
+def _intersecta(a, b) -> bool:
+    return not (a[2] <= b[0] or b[2] <= a[0] or a[3] <= b[1] or b[3] <= a[1])
+
+
+def extraer_pagina_texto(page, page_number: int) -> dict:
+    """
+    Extrae títulos, textos y tablas desde la capa de texto de la página y
+    retorna el mismo esquema de página que produce el análisis con visión.
+    """
+    candidatos = []
+
+    tablas = _tablas(page)
+    bboxes_tablas = [tuple(t.bbox) for t in tablas]
+    for tabla in tablas:
+        filas = [["" if c is None else str(c).strip() for c in fila] for fila in tabla.extract()]
+        candidatos.append((tuple(tabla.bbox), "tabla", filas, False))
+
+    bloques = []
+    for bloque in page.get_text("dict", sort=True)["blocks"]:
+        if bloque.get("type") != 0:
+            continue
+        bbox = tuple(bloque["bbox"])
+        if any(_intersecta(bbox, t) for t in bboxes_tablas):
+            continue
+
+        lineas, tamanos, negrita = [], [], True
+        for linea in bloque["lines"]:
+            texto_linea = "".join(span["text"] for span in linea["spans"]).strip()
+            if not texto_linea:
+                continue
+            lineas.append(texto_linea)
+            for span in linea["spans"]:
+                if span["text"].strip():
+                    tamanos.extend([span["size"]] * len(span["text"]))
+                    negrita = negrita and bool(span["flags"] & 16)
+        if lineas:
+            bloques.append((bbox, "\n".join(lineas), max(tamanos), negrita, len(lineas)))
+
+    tamanos_pagina = [b[2] for b in bloques]
+    tamano_base = statistics.median(tamanos_pagina) if tamanos_pagina else 0
+    for bbox, texto, tamano, negrita, n_lineas in bloques:
+        es_titulo = n_lineas <= 2 and len(texto) <= 150 and (tamano >= tamano_base * 1.2 or negrita)
+        candidatos.append((bbox, "titulo" if es_titulo else "texto", texto, es_titulo))
+
+    candidatos.sort(key=lambda c: (round(c[0][1]), c[0][0]))
+
+    elementos = []
+    titulo_pagina = ""
+    for posicion, (bbox, tipo, contenido, es_titulo) in enumerate(candidatos, start=1):
+        if es_titulo and not titulo_pagina and posicion <= 3:
+            titulo_pagina = contenido
+        elementos.append({
+            "id": f"p{page_number + 1}_e{posicion}",
+            "tipo": tipo,
+            "posicion": posicion,
+            "titulo": "",
+            "descripcion": "",
+            "contenido": contenido,
+            "coordenadas": {},
+            "metadatos": {"origen": "texto_nativo"},
+        })
+
+    raw = json.dumps(
+        {"titulo_pagina": titulo_pagina, "confianza": 1.0, "elementos": elementos},
+        ensure_ascii=False,
+    )
+    return {
+        "pagina": page_number + 1,
+        "elementos": elementos,
+        "tokens_in": 0,
+        "tokens_out": 0,
+        "raw": raw,
+    }
@@ -0,0 +1,293 @@
+# vector_index.py
+
+import json
+import logging
+import os
+from contextlib import contextmanager
+from uuid import uuid4
+
+import numpy as np
+
+from .redis_utils import get_redis_connection, leer_embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+log = logging.getLogger(__name__)
+
+# Directorio del índice dentro de la carpeta de la licitación en storage
+INDEX_DIRNAME = ".vector_index"
+
+_DTYPE = np.dtype("<f4")
+
+
+def _normalizar(matriz: np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1
+    return (matriz / normas).astype(_DTYPE, copy=False)
+
+
+def _rutas_shard(index_dir, document_id):
+    return (
+        os.path.join(index_dir, f"{document_id}.f32"),
+        os.path.join(index_dir, f"{document_id}.json"),
+    )
+
+
+@contextmanager
+def _bloqueo(path):
+    """Lock exclusivo entre procesos e hilos sobre el archivo `path` (flock / msvcrt)."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK se rinde tras ~10 s: se sigue esperando
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ShardWriter:
+    """
+    Escribe el shard de vectores de un documento (matriz float32 normalizada
+    en disco + lista de claves Redis).
+
+    Se usa desde el extractor a medida que se persisten las páginas: las
+    filas nuevas se agregan a un archivo temporal y al cerrar se combinan con
+    las filas del shard anterior cuyas claves no se reescribieron; luego se
+    reemplaza el shard de forma atómica. Con reemplazar=True (el documento se
+    reescribió completo) del shard anterior solo se conservan las claves de
+    `conservar` (p.ej. las que quedaron en la cola de reintentos), así no
+    sobreviven claves de elementos que ya no existen.
+
+    Cada documento tiene su propio shard, por lo que documentos procesados en
+    paralelo no compiten por el archivo. Dos escritores del mismo documento
+    (el extractor y la cola de reintentos) usan temporales con sufijo único y
+    combinan y reemplazan el shard bajo un lock de archivo, por lo que
+    ninguno pierde las filas que el otro acaba de escribir.
+    """
+
+    def __init__(self, storage_case_path, document_id):
+        self.index_dir = os.path.join(storage_case_path, INDEX_DIRNAME)
+        self.document_id = document_id
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        self.vectores_path, self.claves_path = _rutas_shard(self.index_dir, document_id)
+        self._sufijo = f".{uuid4().hex[:8]}.tmp"
+        self._tmp_path = self.vectores_path + self._sufijo
+        self._f = open(self._tmp_path, "wb")
+        self._claves = []
+        self._vistas = set()
+        self.dim = None
+        self.reemplazar = False
+        self.conservar = set()
+
+    def agregar(self, claves, vectores):
+        if not claves:
+            return
+        matriz = _normalizar(np.asarray(vectores, dtype=_DTYPE))
+        if self.dim is None:
+            self.dim = matriz.shape[1]
+        elif matriz.shape[1] != self.dim:
+            raise ValueError(f"Dimensión de embedding inconsistente: {matriz.shape[1]} != {self.dim}")
+        self._f.write(matriz.tobytes())
+        self._claves.extend(claves)
+        self._vistas.update(claves)
+
+    def cerrar(self):
+        with _bloqueo(os.path.join(self.index_dir, f"{self.document_id}.lock")):
+            self._combinar_anterior()
+            self._f.close()
+
+            if not self._claves:
+                os.remove(self._tmp_path)
+                if self.reemplazar:
+                    for path in (self.claves_path, self.vectores_path):
+                        if os.path.exists(path):
+                            os.remove(path)
+                return
+
+            claves_tmp = self.claves_path + self._sufijo
+            with open(claves_tmp, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "claves": self._claves}, f)
+            os.replace(self._tmp_path, self.vectores_path)
+            os.replace(claves_tmp, self.claves_path)
+        log.debug(f"[vector_index] ✅ Shard {self.document_id}: {len(self._claves)} vectores")
+
+    def _combinar_anterior(self):
+        """Agrega las filas del shard anterior que no fueron reescritas (y se conservan)."""
+        anterior = ShardVectorial.abrir(self.index_dir, self.document_id)
+        if anterior is None or (self.dim is not None and anterior.dim != self.dim):
+            return
+        self.dim = anterior.dim
+        filas = [
+            i for i, c in enumerate(anterior.claves)
+            if c not in self._vistas and (not self.reemplazar or c in self.conservar)
+        ]
+        for inicio in range(0, len(filas), 4096):
+            bloque = filas[inicio:inicio + 4096]
+            self._f.write(np.ascontiguousarray(anterior.matriz[bloque]).tobytes())
+            self._claves.extend(anterior.claves[i] for i in bloque)
+
+    def __enter__(self):
+        return self
+
+    def descartar(self):
+        """Elimina el temporal sin tocar el shard (escritura fallida)."""
+        self._f.close()
+        os.remove(self._tmp_path)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.cerrar()
+        else:
+            self.descartar()
+        return False
+
+
+class ShardVectorial:
+    """Shard de un documento abierto como memmap de solo lectura."""
+
+    def __init__(self, document_id, claves, matriz):
+        self.document_id = document_id
+        self.claves = claves
+        self.matriz = matriz
+
+    @property
+    def dim(self):
+        return self.matriz.shape[1]
+
+    @classmethod
+    def abrir(cls, index_dir, document_id):
+        vectores_path, claves_path = _rutas_shard(index_dir, document_id)
+        if not (os.path.exists(vectores_path) and os.path.exists(claves_path)):
+            return None
+        with open(claves_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        claves = meta["claves"]
+        if not claves:
+            return None
+        matriz = np.memmap(vectores_path, dtype=_DTYPE, mode="r", shape=(len(claves), meta["dim"]))
+        return cls(document_id, claves, matriz)
+
+
+def construir_shard_desde_redis(storage_case_path, document_id, lote=1000):
+    """Reconstruye el shard de un documento leyendo sus vectores desde Redis."""
+    conexion = get_redis_connection(decode_responses=False)
+    with ShardWriter(storage_case_path, document_id) as writer:
+        writer.reemplazar = True
+        claves = []
+        for clave in conexion.scan_iter(match=f"doc_raw_page:{document_id}:*", count=1000):
+            clave = clave.decode("utf-8")
+            # p{n}_full guarda el mismo vector que p{n}
+            if clave.endswith("_full"):
+                continue
+            claves.append(clave)
+            if len(claves) >= lote:
+                _agregar_desde_redis(writer, claves, conexion)
+                claves = []
+        if claves:
+            _agregar_desde_redis(writer, claves, conexion)
+
+
+def _agregar_desde_redis(writer, claves, conexion):
+    vectores = leer_embeddings(claves, conexion)
+    encontradas = [c for c in claves if c in vectores]
+    writer.agregar(encontradas, [vectores[c] for c in encontradas])
+
+
+def documentos_de_licitacion(storage_case_path):
+    """Ids de documento procesados en la licitación (carpetas con resultados)."""
+    ids = []
+    for nombre in sorted(os.listdir(storage_case_path)):
+        carpeta = os.path.join(storage_case_path, nombre)
+        if os.path.isdir(carpeta) and os.path.exists(os.path.join(carpeta, f"{nombre}_resultado_paginas.json")):
+            ids.append(nombre)
+    return ids
+
+
+class IndiceLicitacion:
+    """
+    Búsqueda top-k por similitud coseno sobre los vectores de una licitación.
+
+    Cada documento es un shard memmap (abrirlo no lee el archivo completo); la
+    búsqueda calcula en bloque Q @ M.T por shard y combina los top-k.
+
+    Uso:
+        indice = IndiceLicitacion.cargar(storage_case_path)
+        resultados = indice.buscar_textos(["plazo de entrega"], k=5)
+        # → [[(clave_redis, score), ...], ...]
+    """
+
+    def __init__(self, shards):
+        self.shards = shards
+
+    def __len__(self):
+        return sum(len(s.claves) for s in self.shards)
+
+    @classmethod
+    def cargar(cls, storage_case_path, reconstruir_faltantes=True):
+        index_dir = os.path.join(storage_case_path, INDEX_DIRNAME)
+        shards = []
+        for document_id in documentos_de_licitacion(storage_case_path):
+            shard = ShardVectorial.abrir(index_dir, document_id)
+            if shard is None and reconstruir_faltantes:
+                log.info(f"[vector_index] 🔧 Construyendo shard faltante desde Redis: {document_id}")
+                construir_shard_desde_redis(storage_case_path, document_id)
+                shard = ShardVectorial.abrir(index_dir, document_id)
+            if shard is not None:
+                shards.append(shard)
+        return cls(shards)
+
+    def buscar(self, consultas, k=10):
+        """
+        consultas: vector o matriz (n_consultas × dim).
+        Retorna por consulta una lista [(clave, score)] ordenada por score descendente.
+        """
+        q = np.asarray(consultas, dtype=_DTYPE)
+        if q.ndim == 1:
+            q = q[None, :]
+        q = _normalizar(q)
+
+        mejores_scores = np.full((q.shape[0], 0), -np.inf, dtype=_DTYPE)
+        mejores_claves = np.empty((q.shape[0], 0), dtype=object)
+
+        for shard in self.shards:
+            if shard.dim != q.shape[1]:
+                continue
+            scores = q @ shard.matriz.T
+            kk = min(k, scores.shape[1])
+            idx = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            claves = np.asarray(shard.claves, dtype=object)[idx]
+            mejores_scores = np.concatenate([mejores_scores, np.take_along_axis(scores, idx, axis=1)], axis=1)
+            mejores_claves = np.concatenate([mejores_claves, claves], axis=1)
+
+        orden = np.argsort(-mejores_scores, axis=1)[:, :k]
+        return [
+            [(mejores_claves[i, j], float(mejores_scores[i, j])) for j in orden[i]]
+            for i in range(q.shape[0])
+        ]
+
+    def buscar_textos(self, textos, k=10):
+        """Embebe las consultas (un solo lote) y busca."""
+        from .embeddings import generar_embeddings_lote
+
+        vectores, fallidos = generar_embeddings_lote(dict(enumerate(textos)))
+        if fallidos:
+            raise RuntimeError(f"No se pudieron embeber consultas: {fallidos}")
+        return self.buscar([vectores[i] for i in range(len(textos))], k=k)
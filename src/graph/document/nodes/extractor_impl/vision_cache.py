@@ -0,0 +1,168 @@
+# vision_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from src.config import VISION_CACHE_ENABLED, VISION_CACHE_PATH, VISION_CACHE_MAX_MB, ETL_DB_JOURNAL_MODE
+
+log = logging.getLogger(__name__)
+
+# Inserciones entre recálculos del tamaño total: los demás procesos (workers,
+# fusión de la Batch API) también escriben en el archivo
+RECALCULO_CADA = 256
+
+
+class VisionCache:
+    """
+    Cache persistente (SQLite) de resultados de visión.
+
+    La clave es sha256(imagen renderizada) + modelo + versión de prompt, por lo
+    que una página idéntica en un documento re-subido no vuelve a enviarse al
+    modelo. Cuando el tamaño total supera max_bytes se eliminan las entradas
+    usadas hace más tiempo (LRU) hasta bajar al 90% del límite. El total se
+    lleva en memoria y se recalcula en SQLite al superar el límite o cada
+    RECALCULO_CADA inserciones.
+    """
+
+    def __init__(self, path=VISION_CACHE_PATH, max_bytes=VISION_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        carpeta = os.path.dirname(path)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+
+        # Compartido entre procesos: mismo modo de journal y espera que database._open
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute(f"PRAGMA journal_mode = {ETL_DB_JOURNAL_MODE}")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("PRAGMA busy_timeout = 30000")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vision_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                prompt_version TEXT,
+                elementos TEXT,
+                raw TEXT,
+                tokens_in INTEGER,
+                tokens_out INTEGER,
+                size_bytes INTEGER,
+                created_at REAL,
+                last_used_at REAL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_vision_cache_last_used ON vision_cache (last_used_at)"
+        )
+        self._conn.commit()
+        self._total = self._tamano_total()
+        self._inserciones = 0
+
+    @staticmethod
+    def clave(img_bytes: bytes, model: str, prompt_version: str) -> str:
+        h = hashlib.sha256(img_bytes).hexdigest()
+        return f"{h}:{model}:{prompt_version}"
+
+    def obtener(self, clave: str, page_number: int):
+        """
+        Retorna (elementos, raw, tokens_in, tokens_out) o None si no existe.
+        Los ids de elementos ('p3_e1') se ajustan al número de página actual.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT elementos, raw, tokens_in, tokens_out FROM vision_cache WHERE key = ?",
+                (clave,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE vision_cache SET last_used_at = ? WHERE key = ?",
+                (time.time(), clave),
+            )
+            self._conn.commit()
+
+        elementos = json.loads(row[0])
+        for elem in elementos:
+            if isinstance(elem, dict) and isinstance(elem.get("id"), str):
+                elem["id"] = re.sub(r"^p\d+_", f"p{page_number + 1}_", elem["id"])
+        return elementos, row[1], row[2], row[3]
+
+    def guardar(self, clave: str, model: str, prompt_version: str, elementos, raw, tokens_in, tokens_out):
+        elementos_json = json.dumps(elementos, ensure_ascii=False)
+        size_bytes = len(elementos_json.encode("utf-8")) + len(raw.encode("utf-8"))
+        ahora = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO vision_cache (
+                    key, model, prompt_version, elementos, raw,
+                    tokens_in, tokens_out, size_bytes, created_at, last_used_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (clave, model, prompt_version, elementos_json, raw,
+                 tokens_in, tokens_out, size_bytes, ahora, ahora),
+            )
+            self._total += size_bytes
+            self._inserciones += 1
+            if self._total > self.max_bytes or self._inserciones >= RECALCULO_CADA:
+                self._evictar()
+            self._conn.commit()
+
+    def _tamano_total(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM vision_cache").fetchone()[0]
+
+    def _evictar(self):
+        total = self._tamano_total()
+        self._inserciones = 0
+        self._total = total
+        if total <= self.max_bytes:
+            return
+
+        objetivo = int(self.max_bytes * 0.9)
+        eliminadas = 0
+        cur = self._conn.execute("SELECT key, size_bytes FROM vision_cache ORDER BY last_used_at")
+        claves = []
+        for key, size in cur.fetchall():
+            if total <= objetivo:
+                break
+            claves.append((key,))
+            total -= size
+            eliminadas += 1
+        self._conn.executemany("DELETE FROM vision_cache WHERE key = ?", claves)
+        self._total = total
+        log.info(f"[vision_cache] 🧹 {eliminadas} entradas eliminadas por tamaño")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_vision_cache():
+    """Cache de visión compartido en el proceso (None si está desactivado)."""
+    global _cache
+    if not VISION_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = VisionCache()
+        return _cache
+
+
+def _reiniciar_en_hijo():
+    # La conexión SQLite del padre no se usa en el hijo (se abre una nueva)
+    global _cache, _cache_lock
+    _cache, _cache_lock = None, threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
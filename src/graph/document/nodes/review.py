@@ -1,9 +1,68 @@
 # src/graph/document/nodes/review.py
 
+import asyncio
+import logging
+
+from .extractor_impl.renderer import documento
+from .extractor_impl.text_extractor import clasificar_pagina, PAGINA_TEXTO
+from src.config import REVIEW_TEXT_FASTPATH
+
+log = logging.getLogger(__name__)
+
+
 class DocumentReviewNode:
+    """
+    DocumentReviewNode
+
+    RESPONSABILIDAD
+    ----------------
+    - Clasifica cada página del PDF según su capa de texto:
+        texto     → texto nativo utilizable, se extrae localmente
+        escaneada → imagen sin texto, requiere visión
+        mixta     → texto + imágenes/firmas relevantes, requiere visión
+    - Deja la clasificación en el state para que el extractor enrute cada página
+
+    BEHAVIOR / INVARIANTS
+    --------------------
+    - Si REVIEW_TEXT_FASTPATH está desactivado o el archivo no es PDF:
+        → no clasifica, todas las páginas van a visión
+    - Si ocurre cualquier error:
+        → no se clasifica (todas las páginas van a visión) y el flujo continúa
+
+    STATE OUTPUT
+    ------------
+    - page_kinds (lista con el tipo de cada página, índice = página - 1)
+    - pages_text_native
+    """
+
     @staticmethod
     def execute(state: dict) -> dict:
-        #print("🔍 DocumentReviewNode.execute llamado")
-        #print(f"📦 State recibido en DocumentReviewNode: {state}")
+        try:
+            return DocumentReviewNode._run(state)
+        except Exception as e:
+            state.pop("page_kinds", None)
+            log.warning(f"⚠️ Error en DocumentReviewNode, todas las páginas irán a visión: {e}")
+            return state
+
+    @staticmethod
+    async def aexecute(state: dict) -> dict:
+        """execute para graph.ainvoke (la clasificación con PyMuPDF corre en un hilo)."""
+        return await asyncio.to_thread(DocumentReviewNode.execute, state)
+
+    @staticmethod
+    def _run(state: dict) -> dict:
+
+        document_path = state.get("document_path")
+
+        if not REVIEW_TEXT_FASTPATH or not str(document_path).lower().endswith(".pdf"):
+            return state
+
+        with documento(document_path) as doc:
+            page_kinds = [clasificar_pagina(page) for page in doc]
+
+        state["page_kinds"] = page_kinds
+        state["pages_text_native"] = sum(1 for k in page_kinds if k == PAGINA_TEXTO)
+
+        log.info(f"🔍 Revisión: {state['pages_text_native']}/{len(page_kinds)} páginas con texto nativo")
 
         return state
@@ -1,7 +1,11 @@
+import asyncio
+import logging
 import os
 import re
 import unicodedata
 
+log = logging.getLogger(__name__)
+
 
 class DocumentStartNode:
     """
@@ -42,9 +46,14 @@ class DocumentStartNode:
             state["status"] = "failed"
             state["error_node"] = "document_start"
             state["error"] = str(e)
-            print(f"❌ Error en DocumentStartNode: {e}")
+            log.error(f"❌ Error en DocumentStartNode: {e}")
             return state
 
+    @staticmethod
+    async def aexecute(state: dict) -> dict:
+        """execute para graph.ainvoke (el makedirs corre fuera del event loop)."""
+        return await asyncio.to_thread(DocumentStartNode.execute, state)
+
     @staticmethod
     def _run(state: dict) -> dict:
 
@@ -6,25 +6,22 @@ from src.graph.etl.nodes.start import StartNode
 from src.graph.etl.nodes.cost import CostNode
 from src.graph.etl.nodes.process_documents import ProcessDocumentsNode
 from src.graph.etl.nodes.cleanup import CleanupNode
+from src.metrics import instrumentar
 
 
 def start_node(state: dict) -> dict:
-    print("➡️ Entrando al nodo: start")
     return StartNode.execute(state)
 
 
 def cost_node(state: dict) -> dict:
-    print("➡️ Entrando al nodo: cost")
     return CostNode.execute(state)
 
 
 def process_documents_node(state: dict) -> dict:
-    print("➡️ Entrando al nodo: process_documents")
     return ProcessDocumentsNode.execute(state)
 
 
 def cleanup_node(state: dict) -> dict:
-    print("➡️ Entrando al nodo: cleanup")
     return CleanupNode.execute(state)
 
 
@@ -32,13 +29,18 @@ def route_after_start(state: dict) -> str:
     return "cost" if state.get("status") == "ok" else END
 
 
+def route_after_cost(state: dict) -> str:
+    # paused / deferred: el presupuesto no permite procesar la licitación ahora
+    return END if state.get("status") in ("paused", "deferred") else "process_documents"
+
+
 def build_graph():
     graph = StateGraph(dict)
 
-    graph.add_node("start", start_node)
-    graph.add_node("cost", cost_node)
-    graph.add_node("process_documents", process_documents_node)
-    graph.add_node("cleanup", cleanup_node)
+    graph.add_node("start", instrumentar("etl", "start", start_node))
+    graph.add_node("cost", instrumentar("etl", "cost", cost_node))
+    graph.add_node("process_documents", instrumentar("etl", "process_documents", process_documents_node))
+    graph.add_node("cleanup", instrumentar("etl", "cleanup", cleanup_node))
 
     graph.set_entry_point("start")
 
@@ -51,7 +53,14 @@ def build_graph():
         },
     )
 
-    graph.add_edge("cost", "process_documents")
+    graph.add_conditional_edges(
+        "cost",
+        route_after_cost,
+        {
+            "process_documents": "process_documents",
+            END: END,
+        },
+    )
     graph.add_edge("process_documents", "cleanup")
     graph.add_edge("cleanup", END)
 
@@ -1,14 +1,110 @@
 # src/graph/etl/nodes/cost.py
 
+import logging
+import os
+import time
+
+from src import database
+from src.config import COST_MAX_USD_PER_LICITATION, COST_TOKENS_PER_HOUR
+from src.graph.etl.nodes.cost_impl.estimator import Calibracion, estimar_archivos, sumar
+
+log = logging.getLogger(__name__)
+
+
 class CostNode:
+    """
+    CostNode
+
+    RESPONSABILIDAD
+    ----------------
+    - Estima tokens, costo (USD) y tiempo de los archivos en estado 'NEW' de
+      la licitación, sin renderizar páginas (solo cuenta páginas y su tamaño)
+    - Calibra la estimación con el consumo real de documentos anteriores
+    - Aplica el presupuesto antes de gastar tokens
+
+    BEHAVIOR / INVARIANTS
+    --------------------
+    - Si la estimación supera COST_MAX_USD_PER_LICITATION y la licitación no
+      fue aprobada:
+        state["status"] = "paused"
+        → el grafo NO continúa hasta aprobarla (py -m src.batch --approve <ID>)
+    - Si no cabe en los tokens por hora que quedan (COST_TOKENS_PER_HOUR):
+        state["status"] = "deferred"
+        → el grafo NO continúa, se reintenta más tarde
+    - Si ocurre un error al estimar:
+        → el flujo continúa sin estimación (la estimación nunca bloquea el ETL)
+    - Si todo es correcto:
+        state["status"] = "ok"
+
+    SIDE EFFECTS
+    ------------
+    - Lectura de los PDF en storage (solo estructura)
+    - Escritura en SQLite (tabla licitation_estimates)
+
+    STATE OUTPUT
+    ------------
+    - cost_total (USD estimado)
+    - cost_estimate (totales: pages, tokens_in, tokens_out, tokens_embedding, cost_usd, seconds)
+    - cost_files (estimación por archivo)
+    - status
+    - pause_reason (opcional)
+    """
+
     @staticmethod
     def execute(state: dict) -> dict:
-        #print("➡️ Entrando al nodo: cost")
-        #print(f"📦 State recibido: {state}")
+        try:
+            return CostNode._run(state)
+        except Exception as e:
+            log.warning(f"⚠️ Error en CostNode, se continúa sin estimación: {e}")
+            state["cost_files"] = {}
+            return state
+
+    @staticmethod
+    def _run(state: dict) -> dict:
+
+        licitation_id = state.get("licitation_id")
+        storage_case_path = state.get("storage_case_path")
+
+        files = database.get_new_files(licitation_id)
+        paths = {f["filename"]: os.path.join(storage_case_path, f["filename"]) for f in files}
+
+        cost_files = estimar_archivos(paths, Calibracion())
+        total = sumar(cost_files.values())
+
+        state["cost_files"] = cost_files
+        state["cost_estimate"] = total
+        state["cost_total"] = total["cost_usd"]
+        database.save_licitation_estimate(licitation_id, None, total)
+
+        log.info(f"💰 Estimación {licitation_id}: {total['pages']} páginas, "
+                 f"{total['tokens_in']}/{total['tokens_out']} tokens in/out, "
+                 f"USD {total['cost_usd']:.2f}, ~{total['seconds']:.0f}s")
 
-        # Valor dummy de costo para pruebas
-        state["cost_total"] = 12345
+        if (
+            COST_MAX_USD_PER_LICITATION
+            and total["cost_usd"] > COST_MAX_USD_PER_LICITATION
+            and not database.is_licitation_approved(licitation_id)
+        ):
+            state["status"] = "paused"
+            state["pause_reason"] = (
+                f"costo estimado USD {total['cost_usd']:.2f} supera el máximo "
+                f"USD {COST_MAX_USD_PER_LICITATION:.2f}"
+            )
+            log.info(f"⏸️ Licitación {licitation_id} en pausa: {state['pause_reason']}")
+            return state
 
-        #print(f"💰 Costo calculado (dummy): {state['cost_total']}")
+        if COST_TOKENS_PER_HOUR:
+            usados = database.tokens_used_since(time.time() - 3600)
+            necesarios = total["tokens_in"] + total["tokens_out"]
+            # Una licitación más grande que el presupuesto completo solo se
+            # posterga si ya se consumió algo en la hora (si no, nunca correría)
+            if usados and usados + necesarios > COST_TOKENS_PER_HOUR:
+                state["status"] = "deferred"
+                state["pause_reason"] = (
+                    f"{usados} tokens usados en la última hora + {necesarios} estimados "
+                    f"superan {COST_TOKENS_PER_HOUR}"
+                )
+                log.info(f"⏳ Licitación {licitation_id} diferida: {state['pause_reason']}")
+                return state
 
         return state
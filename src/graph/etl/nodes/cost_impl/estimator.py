@@ -0,0 +1,167 @@
+# estimator.py
+#
+# Estimación previa de tokens, costo y tiempo de una licitación sin renderizar
+# páginas: solo se abre el PDF para contar páginas y leer su tamaño.
+#
+# - tokens de imagen: tamaño de render (RENDER_* / calcular_zoom) → tiles de
+#   512 px del modelo de visión (85 + 170 por tile, detail=high)
+# - tokens de prompt: SYSTEM_PROMPT por página
+# - tokens de salida y embeddings: COST_TOKENS_OUT_PER_PAGE por página
+# - calibración: las estimaciones se corrigen con el consumo real registrado
+#   en document_costs (últimos CALIBRATION_DOCUMENTS documentos)
+
+import logging
+import math
+import os
+
+from src import database
+from src.config import (
+    VISION_PRICE_IN_PER_M,
+    VISION_PRICE_OUT_PER_M,
+    EMBEDDING_PRICE_PER_M,
+    COST_TOKENS_OUT_PER_PAGE,
+    EXTRACTOR_MAX_WORKERS,
+)
+from src.graph.document.nodes.extractor_impl.renderer import opciones_render, calcular_zoom
+from src.graph.document.nodes.extractor_impl.ai_extractor_pdf import SYSTEM_PROMPT
+from src.graph.document.nodes.extractor_impl.embeddings import contar_tokens_embedding
+
+log = logging.getLogger(__name__)
+
+CALIBRATION_DOCUMENTS = 50
+
+# Segundos por página antes de tener historial (una llamada de visión ~10s)
+SEGUNDOS_POR_PAGINA_INICIAL = 10.0
+
+# El texto embebido (elementos + página completa) ≈ 2 veces el texto extraído
+FACTOR_EMBEDDING = 2
+
+# Límites de los factores de calibración (un historial raro no debe anular la estimación)
+FACTOR_MIN, FACTOR_MAX = 0.25, 4.0
+
+_tokens_prompt = None
+
+
+def tokens_imagen(ancho_px: float, alto_px: float) -> int:
+    """Tokens de una imagen en detail=high (escala a 2048 y lado corto a 768, tiles de 512)."""
+    if max(ancho_px, alto_px) > 2048:
+        escala = 2048 / max(ancho_px, alto_px)
+        ancho_px, alto_px = ancho_px * escala, alto_px * escala
+    if min(ancho_px, alto_px) > 768:
+        escala = 768 / min(ancho_px, alto_px)
+        ancho_px, alto_px = ancho_px * escala, alto_px * escala
+    tiles = math.ceil(ancho_px / 512) * math.ceil(alto_px / 512)
+    return 85 + 170 * tiles
+
+
+def tokens_prompt() -> int:
+    global _tokens_prompt
+    if _tokens_prompt is None:
+        # prompt de sistema + texto de usuario + overhead de mensajes
+        _tokens_prompt = contar_tokens_embedding(SYSTEM_PROMPT) + 20
+    return _tokens_prompt
+
+
+def _tamanos_pagina(doc):
+    """(ancho, alto) en puntos de cada página, sin cargar el contenido."""
+    for i in range(doc.page_count):
+        try:
+            rect = doc.page_cropbox(i)
+        except AttributeError:  # PyMuPDF antiguo
+            rect = doc.load_page(i).rect
+        yield rect.width, rect.height
+
+
+def estimar_archivo_sin_calibrar(path: str) -> dict:
+    """Páginas y tokens (sin calibrar) de un archivo; 0 si no es un PDF legible."""
+    import fitz  # PyMuPDF
+
+    estimacion = {"pages": 0, "tokens_in": 0, "tokens_out": 0}
+    if not path.lower().endswith(".pdf"):
+        return estimacion
+
+    opciones = opciones_render()
+    try:
+        with fitz.open(path) as doc:
+            tokens_in = 0
+            for ancho, alto in _tamanos_pagina(doc):
+                zoom = calcular_zoom(ancho, alto, opciones["dpi"],
+                                     opciones["max_lado_largo"], opciones["max_lado_corto"])
+                tokens_in += tokens_imagen(ancho * zoom, alto * zoom) + tokens_prompt()
+            estimacion["pages"] = doc.page_count
+    except Exception as e:
+        log.warning(f"[cost] ⚠️ No se pudo estimar '{os.path.basename(path)}': {e}")
+        return estimacion
+
+    estimacion["tokens_in"] = tokens_in
+    estimacion["tokens_out"] = estimacion["pages"] * COST_TOKENS_OUT_PER_PAGE
+    return estimacion
+
+
+def _acotar(factor: float) -> float:
+    return min(max(factor, FACTOR_MIN), FACTOR_MAX)
+
+
+class Calibracion:
+    """Factores reales/estimados del historial reciente (1.0 sin historial)."""
+
+    def __init__(self):
+        self.factor_in = 1.0
+        self.factor_out = 1.0
+        self.segundos_por_pagina = SEGUNDOS_POR_PAGINA_INICIAL / max(1, EXTRACTOR_MAX_WORKERS)
+        try:
+            h = database.get_cost_history(CALIBRATION_DOCUMENTS)
+        except Exception as e:
+            log.warning(f"[cost] ⚠️ Sin historial de calibración: {e}")
+            return
+        if h["est_tokens_in"]:
+            self.factor_in = _acotar(h["tokens_in"] / h["est_tokens_in"])
+        if h["est_tokens_out"]:
+            self.factor_out = _acotar(h["tokens_out"] / h["est_tokens_out"])
+        if h["pages"] and h["seconds"]:
+            self.segundos_por_pagina = h["seconds"] / h["pages"]
+
+    def aplicar(self, sin_calibrar: dict) -> dict:
+        tokens_in = int(sin_calibrar["tokens_in"] * self.factor_in)
+        tokens_out = int(sin_calibrar["tokens_out"] * self.factor_out)
+        tokens_embedding = tokens_out * FACTOR_EMBEDDING
+        costo = (
+            tokens_in * VISION_PRICE_IN_PER_M
+            + tokens_out * VISION_PRICE_OUT_PER_M
+            + tokens_embedding * EMBEDDING_PRICE_PER_M
+        ) / 1_000_000
+        return {
+            "pages": sin_calibrar["pages"],
+            "raw_tokens_in": sin_calibrar["tokens_in"],
+            "raw_tokens_out": sin_calibrar["tokens_out"],
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "tokens_embedding": tokens_embedding,
+            "cost_usd": round(costo, 4),
+            "seconds": round(sin_calibrar["pages"] * self.segundos_por_pagina, 1),
+        }
+
+
+def sumar(estimaciones) -> dict:
+    total = {"pages": 0, "tokens_in": 0, "tokens_out": 0, "tokens_embedding": 0, "cost_usd": 0.0, "seconds": 0.0}
+    for e in estimaciones:
+        for k in total:
+            total[k] += e[k]
+    total["cost_usd"] = round(total["cost_usd"], 4)
+    total["seconds"] = round(total["seconds"], 1)
+    return total
+
+
+def estimar_archivos(paths: dict, calibracion: Calibracion | None = None) -> dict:
+    """{nombre: path} → {nombre: estimación calibrada}"""
+    calibracion = calibracion or Calibracion()
+    return {nombre: calibracion.aplicar(estimar_archivo_sin_calibrar(path)) for nombre, path in paths.items()}
+
+
+def estimar_carpeta(carpeta: str, calibracion: Calibracion | None = None) -> dict:
+    """Estimación total de todos los archivos de una carpeta (recursivo)."""
+    paths = {}
+    for root, _, files in os.walk(carpeta):
+        for filename in files:
+            paths[os.path.join(root, filename)] = os.path.join(root, filename)
+    return sumar(estimar_archivos(paths, calibracion).values())
@@ -1,8 +1,13 @@
-import sqlite3
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.graph.document.graph import build_document_graph
+from src.config import DOCUMENTS_MAX_PARALLEL, DOCUMENTS_ASYNC
+from src import database, metrics
 import os
+import time
 
-DB_PATH = os.path.join("data", "etl.db")
+log = logging.getLogger(__name__)
 
 class ProcessDocumentsNode:
 
@@ -13,7 +18,11 @@ class ProcessDocumentsNode:
     ----------------
     - Orquesta el procesamiento de documentos asociados a una licitación
     - Recupera desde SQLite todos los archivos con estado 'new' para la licitación actual
-    - Ejecuta el subgrafo de documentos una vez por cada archivo
+    - Ejecuta el subgrafo de documentos una vez por cada archivo, en paralelo
+      (hasta DOCUMENTS_MAX_PARALLEL archivos a la vez, los más largos primero
+      según la estimación de CostNode, o por tamaño si no hay estimación)
+    - Con DOCUMENTS_ASYNC los archivos se procesan con ainvoke en un solo
+      event loop en vez de un hilo por archivo
     - Actualiza el estado de cada archivo según el resultado del procesamiento
 
     BEHAVIOR / INVARIANTS
@@ -23,6 +32,12 @@ class ProcessDocumentsNode:
         state["status"] = "processed"
     - Cada archivo se procesa de forma independiente:
         → un error en un archivo NO detiene el procesamiento de los demás
+        → si el subgrafo termina con status "failed" el archivo queda en error
+        → si termina con status "partial" (páginas con error) el archivo sigue
+          en 'NEW' para que la próxima ejecución reanude sus páginas pendientes
+    - Si algún archivo quedó incompleto (sigue en 'NEW'):
+        state["status"] = "partial" → el claim de la licitación no se cierra
+        como done y se vuelve a procesar (ver batch.procesar_reclamada)
     - Si ocurre un error no controlado a nivel de nodo:
         state["status"] = "error"
         state["error"] contiene el detalle del fallo
@@ -31,9 +46,10 @@ class ProcessDocumentsNode:
     ------------
     - Lectura desde SQLite (tabla files)
     - Escritura / actualización en SQLite:
-        - status = processed | error
+        - status = processed | error | NEW (archivo incompleto)
         - processed_at
         - error (si aplica)
+    - Escritura en SQLite (tabla document_costs): consumo real vs estimado
     - Ejecución de subgrafo de documentos (OCR / parsing / chunking / RAG)
 
     STATE OUTPUT
@@ -50,27 +66,34 @@ class ProcessDocumentsNode:
         Maneja errores y controla estado general del nodo.
         """
         try:
-            ProcessDocumentsNode._run(state)
-            state["status"] = "processed"
+            pendientes = ProcessDocumentsNode._run(state)
+            if pendientes:
+                state["status"] = "partial"
+                state["error"] = f"{pendientes} archivos quedaron incompletos y siguen pendientes"
+                log.warning(f"⚠️ Licitación {state.get('licitation_id')}: {state['error']}")
+            else:
+                state["status"] = "processed"
         except Exception as e:
-            print(f"❌ Error en StartNode: {e}")
+            log.error(f"❌ Error en StartNode: {e}")
             state["status"] = "error"
             state["error"] = str(e)
 
         return state
 
     @staticmethod
-    def _run(state: dict) -> None:
+    def _run(state: dict) -> int:
 
-        print("📦 State recibido:")
-        for k, v in state.items():
-            print(f"   - {k}: {v}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("📦 State recibido:")
+            for k, v in state.items():
+                log.debug(f"   - {k}: {v}")
 
         """
         Lógica de negocio:
         - obtiene licitation_id
         - recupera archivos en estado 'new'
         - ejecuta subgrafo por cada archivo
+        Retorna cuántos archivos siguen en 'NEW' al terminar (incompletos)
         """
         licitation_id = state.get("licitation_id")
         #print('licitacion ID',licitation_id)
@@ -81,48 +104,152 @@ class ProcessDocumentsNode:
         files = ProcessDocumentsNode._get_new_files(licitation_id)
 
         if not files:
-            print(f"ℹ️ No hay archivos nuevos para licitación {licitation_id}")
-            return
+            log.info(f"ℹ️ No hay archivos nuevos para licitación {licitation_id}")
+            return 0
 
         document_graph = build_document_graph()
 
-        for file_row in files:
-            file_state = ProcessDocumentsNode._build_file_state(state, file_row)
+        # Los archivos más largos se agendan primero para que no queden al final
+        storage_case_path = state.get("storage_case_path")
+        cost_files = state.get("cost_files") or {}
+        files.sort(
+            key=lambda f: (
+                cost_files.get(f["filename"], {}).get("seconds", 0),
+                ProcessDocumentsNode._file_size(storage_case_path, f["filename"]),
+            ),
+            reverse=True,
+        )
+
+        max_parallel = max(1, min(DOCUMENTS_MAX_PARALLEL, len(files)))
+        log.info(f"📚 Procesando {len(files)} archivos (paralelo={max_parallel}{', async' if DOCUMENTS_ASYNC else ''})")
+
+        if DOCUMENTS_ASYNC:
+            asyncio.run(ProcessDocumentsNode._process_files_async(document_graph, state, files, max_parallel))
+            return len(ProcessDocumentsNode._get_new_files(licitation_id))
+
+        with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="document") as executor:
+            futures = {
+                executor.submit(ProcessDocumentsNode._process_file, document_graph, state, file_row): file_row
+                for file_row in files
+            }
+            for future in as_completed(futures):
+                file_row = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    # _process_file ya maneja sus errores; esto cubre fallos al actualizar SQLite
+                    log.error(f"❌ Error procesando archivo {file_row['filename']}: {e}")
 
-            try:
-                document_graph.invoke(file_state)
-                ProcessDocumentsNode._update_file_status(
-                    file_row["id"], "processed"
-                )
-            except Exception as e:
-                ProcessDocumentsNode._update_file_status(
-                    file_row["id"], "error", str(e)
-                )
-                print(f"❌ Error procesando archivo {file_row['filename']}")
+        return len(ProcessDocumentsNode._get_new_files(licitation_id))
 
     @staticmethod
-    def _get_new_files(licitation_id: str) -> list[dict]:
+    async def _process_files_async(document_graph, state: dict, files: list[dict], max_parallel: int) -> None:
+        """Todos los archivos en el event loop actual, hasta max_parallel a la vez."""
+        semaforo = asyncio.Semaphore(max_parallel)
+
+        async def procesar(file_row):
+            async with semaforo:
+                try:
+                    await ProcessDocumentsNode._process_file_async(document_graph, state, file_row)
+                except Exception as e:
+                    log.error(f"❌ Error procesando archivo {file_row['filename']}: {e}")
+
+        await asyncio.gather(*(procesar(file_row) for file_row in files))
+
+    @staticmethod
+    def _process_file(document_graph, state: dict, file_row: dict) -> None:
         """
-        Recupera archivos con status = 'new' desde SQLite
+        Ejecuta el subgrafo para un archivo y actualiza su estado.
+        Los errores quedan aislados en el archivo.
         """
+        file_state = ProcessDocumentsNode._build_file_state(state, file_row)
 
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-
-        cur.execute(
-            """
-            SELECT *
-            FROM files
-            WHERE licitation_id = ?
-              AND status = 'NEW'
-            """,
-            (licitation_id,),
-        )
+        metrics.DOCUMENTS_IN_PROGRESS.inc()
+        try:
+            inicio = time.monotonic()
+            result = document_graph.invoke(file_state)
+            ProcessDocumentsNode._finish_file(state, file_row, result, time.monotonic() - inicio)
+        except Exception as e:
+            ProcessDocumentsNode._update_file_status(
+                file_row["id"], "error", str(e)
+            )
+            log.error(f"❌ Error procesando archivo {file_row['filename']}")
+        finally:
+            metrics.DOCUMENTS_IN_PROGRESS.dec()
+
+    @staticmethod
+    async def _process_file_async(document_graph, state: dict, file_row: dict) -> None:
+        """_process_file con document_graph.ainvoke."""
+        file_state = ProcessDocumentsNode._build_file_state(state, file_row)
+
+        metrics.DOCUMENTS_IN_PROGRESS.inc()
+        try:
+            inicio = time.monotonic()
+            result = await document_graph.ainvoke(file_state)
+            ProcessDocumentsNode._finish_file(state, file_row, result, time.monotonic() - inicio)
+        except Exception as e:
+            ProcessDocumentsNode._update_file_status(
+                file_row["id"], "error", str(e)
+            )
+            log.error(f"❌ Error procesando archivo {file_row['filename']}")
+        finally:
+            metrics.DOCUMENTS_IN_PROGRESS.dec()
 
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+    @staticmethod
+    def _finish_file(state: dict, file_row: dict, result: dict | None, seconds: float) -> None:
+        """Registra el costo y actualiza el estado del archivo según el resultado del subgrafo"""
+        ProcessDocumentsNode._record_cost(state, file_row, result, seconds)
+        if result and result.get("status") == "failed":
+            ProcessDocumentsNode._update_file_status(
+                file_row["id"], "error", result.get("error")
+            )
+            log.error(f"❌ Error procesando archivo {file_row['filename']}: {result.get('error')}")
+        elif result and result.get("status") == "partial":
+            ProcessDocumentsNode._update_file_status(
+                file_row["id"], "NEW", result.get("error")
+            )
+            log.warning(f"⚠️ Archivo {file_row['filename']} incompleto, queda pendiente: {result.get('error')}")
+        else:
+            ProcessDocumentsNode._update_file_status(
+                file_row["id"], "processed"
+            )
+
+    @staticmethod
+    def _record_cost(state: dict, file_row: dict, result: dict | None, seconds: float) -> None:
+        """
+        Registra el consumo real del archivo junto a su estimación sin calibrar
+        (alimenta la calibración de CostNode y el presupuesto por hora)
+        """
+        if not result or not result.get("pages_total"):
+            return
+        estimate = (state.get("cost_files") or {}).get(file_row["filename"], {})
+        try:
+            database.record_document_cost(
+                state.get("licitation_id"),
+                file_row["filename"],
+                result["pages_total"],
+                estimate.get("raw_tokens_in", 0),
+                estimate.get("raw_tokens_out", 0),
+                result.get("tokens_in", 0),
+                result.get("tokens_out", 0),
+                seconds,
+            )
+        except Exception as e:
+            log.warning(f"⚠️ No se pudo registrar el costo de {file_row['filename']}: {e}")
+
+    @staticmethod
+    def _file_size(storage_case_path: str | None, filename: str) -> int:
+        try:
+            return os.path.getsize(os.path.join(storage_case_path or "", filename))
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _get_new_files(licitation_id: str) -> list[dict]:
+        """
+        Recupera archivos con status = 'new' desde SQLite
+        """
+        return database.get_new_files(licitation_id)
 
     @staticmethod
     def _build_file_state(base_state: dict, file_row: dict) -> dict:
@@ -139,19 +266,4 @@ class ProcessDocumentsNode:
         """
         Actualiza estado del archivo en SQLite
         """
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-
-        cur.execute(
-            """
-            UPDATE files
-            SET status = ?,
-                processed_at = datetime('now'),
-                error = ?
-            WHERE id = ?
-            """,
-            (status, error, file_id),
-        )
-
-        conn.commit()
-        conn.close()
+        database.update_file_status(file_id, status, error)
@@ -1,14 +1,16 @@
 # src/graph/etl/nodes/start.py
 
-from src.config import STORAGE,REPOSITORY
+from src.config import HASH_WORKERS, requerido
+import logging
 import os
-import shutil
-import sqlite3
-import hashlib
-from datetime import datetime
-from uuid import uuid4
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-DB_PATH = os.path.join("data", "etl.db")
+from src import database
+from src.graph.etl.nodes.start_impl.sync import sincronizar_archivo, sha256_archivo, al_dia
+
+log = logging.getLogger(__name__)
 
 
 class StartNode:
@@ -18,9 +20,16 @@ class StartNode:
     RESPONSABILIDAD
     ----------------
     - Detecta licitaciones disponibles en el directorio repository
-    - Selecciona una licitación (primer subdirectorio encontrado)
-    - Copia los archivos a storage (si no existen previamente)
+    - Selecciona una licitación (la indicada en state["licitation_id"] o el
+      primer subdirectorio encontrado)
+    - Sincroniza los archivos a storage de forma incremental
+        → solo archivos nuevos o modificados (destino con otro size / mtime)
+        → hardlink o reflink cuando es posible (SYNC_MODE), si no copia por
+          kernel o en una sola lectura que también calcula el checksum
     - Registra y sincroniza archivos en base de datos SQLite
+        → un archivo cuyo size y mtime_ns coinciden con los registrados se
+          considera sin cambios y no se vuelve a leer
+        → el resto se hashea en paralelo (HASH_WORKERS hilos)
 
     BEHAVIOR / INVARIANTS
     --------------------
@@ -58,120 +67,134 @@ class StartNode:
             state["status"] = "failed"
             state["error_node"] = "start"
             state["error"] = str(e)
-            print(f"❌ Error en StartNode: {e}")
+            log.error(f"❌ Error en StartNode: {e}")
             return state
 
     @staticmethod
     def _run(state: dict) -> dict:
         
-        subdirs = [
-            d for d in os.listdir(REPOSITORY)
-            if os.path.isdir(os.path.join(REPOSITORY, d))
-        ]
+        # Si el state ya trae una licitación (modo batch: reclamada por un worker)
+        # se procesa esa; si no, se elige el primer subdirectorio
+        licitation_id = state.get("licitation_id")
+        repository, storage = requerido("REPOSITORY", "STORAGE")
+
+        if licitation_id:
+            if not os.path.isdir(os.path.join(repository, licitation_id)):
+                state["status"] = "empty"
+                return state
+        else:
+            subdirs = [
+                d for d in os.listdir(repository)
+                if os.path.isdir(os.path.join(repository, d))
+            ]
 
-        if not subdirs:
-            state["status"] = "empty"
-            return state
+            if not subdirs:
+                state["status"] = "empty"
+                return state
 
-        licitation_id = subdirs[0]
+            licitation_id = subdirs[0]
         state["licitation_id"] = licitation_id
 
-        src_dir = os.path.join(REPOSITORY, licitation_id)
-        dst_dir = os.path.join(STORAGE, licitation_id)
+        src_dir = os.path.join(repository, licitation_id)
+        dst_dir = os.path.join(storage, licitation_id)
 
         #print(f"🆔 Licitación seleccionada: {licitation_id}")
 
-        if not os.path.exists(dst_dir):
-            shutil.copytree(src_dir, dst_dir)
-            #print(f"📁 Directorio copiado a storage: {dst_dir}")
-        else:
-            pass
-            #print(f"ℹ️ Directorio ya existe en storage: {dst_dir}")
-
-        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS files (
-                id TEXT PRIMARY KEY,
-                licitation_id TEXT,
-                filename TEXT,
-                checksum TEXT,
-                status TEXT,
-                created_at TEXT,
-                processed_at TEXT,
-                error TEXT
-            )
-            """
-        )
-
-        now = datetime.utcnow().isoformat()
+        # Una sola consulta por licitación; altas y cambios se escriben en bloque
+        registered = database.get_files(licitation_id)
+        new_files = []
+        changed_files = []
+        touched_files = []
 
+        # 1) stat de todos los archivos: se hashean los que no coinciden con la
+        #    base y se sincronizan los que no están al día en storage
+        pending = []
         for root, _, files in os.walk(src_dir):
             for filename in files:
                 src_file = os.path.join(root, filename)
-                checksum = StartNode._checksum(src_file)
-
-                cursor.execute(
-                    """
-                    SELECT checksum FROM files
-                    WHERE licitation_id = ? AND filename = ?
-                    """,
-                    (licitation_id, filename),
+                dst_file = os.path.join(dst_dir, os.path.relpath(src_file, src_dir))
+                st = os.stat(src_file)
+                entry = {
+                    "filename": filename,
+                    "path": src_file,
+                    "dst": dst_file,
+                    "stat": st,
+                    "size": st.st_size,
+                    "mtime_ns": StartNode._stable_mtime(st),
+                }
+                row = registered.get(filename)
+                entry["hash"] = not (
+                    row is not None
+                    and row.get("mtime_ns") is not None
+                    and row.get("size") == entry["size"]
+                    and row.get("mtime_ns") == entry["mtime_ns"]
                 )
-                row = cursor.fetchone()
-
-                if row is None:
-                    cursor.execute(
-                        """
-                        INSERT INTO files (
-                            id, licitation_id, filename, checksum,
-                            status, created_at, processed_at, error
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            str(uuid4()),
-                            licitation_id,
-                            filename,
-                            checksum,
-                            "NEW",
-                            now,
-                            None,
-                            None,
-                        ),
-                    )
-                    print(f"🆕 Archivo registrado: {filename}")
-                else:
-                    old_checksum = row[0]
-                    if old_checksum != checksum:
-                        cursor.execute(
-                            """
-                            UPDATE files
-                            SET checksum = ?, status = ?, error = ?
-                            WHERE licitation_id = ? AND filename = ?
-                            """,
-                            (checksum, "NEW", None, licitation_id, filename),
-                        )
-                        print(f"🔄 Archivo actualizado (checksum): {filename}")
-
-        conn.commit()
-        conn.close()
+                entry["sync"] = not al_dia(st, dst_file)
+                if entry["hash"] or entry["sync"]:
+                    pending.append(entry)
+
+        # 2) sincronización + checksums en paralelo (hashlib y la copia
+        #    liberan el GIL)
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, min(HASH_WORKERS, len(pending)))) as executor:
+                list(executor.map(StartNode._sync_file, pending))
+
+            methods = Counter(e["method"] for e in pending if e["sync"])
+            if methods:
+                log.debug(f"📁 Sincronizados a storage: {dict(methods)}")
+
+        to_hash = [e for e in pending if e["hash"]]
+
+        for entry in to_hash:
+            filename = entry["filename"]
+            row = registered.get(filename)
+
+            if row is None:
+                new_files.append(entry)
+                registered[filename] = entry
+                log.debug(f"🆕 Archivo registrado: {filename}")
+            elif row["checksum"] != entry["checksum"]:
+                changed_files.append(entry)
+                log.debug(f"🔄 Archivo actualizado (checksum): {filename}")
+            else:
+                touched_files.append(entry)
+
+        database.register_files(licitation_id, new_files)
+        database.mark_files_changed(licitation_id, changed_files)
+        database.update_files_stat(licitation_id, touched_files)
 
         state["status"] = "ok"
         state["storage_case_path"] = dst_dir
 
         return state
 
+    @staticmethod
+    def _sync_file(entry: dict) -> None:
+        """
+        Copia / enlaza el archivo a storage si hace falta y calcula su checksum
+        si corresponde (en la misma lectura cuando hay que copiar datos).
+        """
+        if entry["sync"]:
+            entry["method"], entry["checksum"] = sincronizar_archivo(
+                entry["path"], entry["dst"], entry["stat"], entry["hash"]
+            )
+        elif entry["hash"]:
+            entry["checksum"] = StartNode._checksum(entry["path"])
+
     @staticmethod
     def _checksum(path: str) -> str:
         """
         Calcula checksum SHA256 de un archivo.
         """
-        h = hashlib.sha256()
-        with open(path, "rb") as f:
-            for chunk in iter(lambda: f.read(8192), b""):
-                h.update(chunk)
-        return h.hexdigest()
+        return sha256_archivo(path)
+
+    @staticmethod
+    def _stable_mtime(st: os.stat_result) -> int | None:
+        """
+        mtime_ns a guardar como referencia. Si el archivo se modificó hace muy
+        poco podría volver a cambiar dentro de la misma marca de tiempo, así que
+        no se guarda (None) y en la próxima ejecución se vuelve a hashear.
+        """
+        if time.time_ns() - st.st_mtime_ns < 2_000_000_000:
+            return None
+        return st.st_mtime_ns
@@ -0,0 +1,164 @@
+# sync.py
+#
+# Sincronización incremental repository → storage.
+#
+# Solo se copian archivos nuevos o modificados (size / mtime_ns distintos o
+# destino inexistente). Por orden de preferencia:
+#   link    → hardlink (mismo filesystem): sin copiar datos
+#   reflink → clon copy-on-write (btrfs / xfs): sin copiar datos
+#   kernel  → copy_file_range / sendfile: la copia no pasa por Python
+#   copia   → lectura única que calcula el checksum y escribe el destino
+#
+# El destino se escribe en un temporal y se reemplaza de forma atómica, con el
+# mismo mtime que el origen para poder detectar cambios solo con stat.
+
+import errno
+import hashlib
+import os
+import shutil
+
+from src.config import SYNC_MODE
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_FICLONE = 0x40049409
+_BUFFER = 1024 * 1024
+
+# Errores con los que se pasa a la siguiente estrategia
+_NO_SOPORTADO = {
+    errno.EXDEV, errno.EPERM, errno.EACCES, errno.ENOTSUP, errno.EOPNOTSUPP,
+    errno.EINVAL, errno.ENOSYS, errno.EMLINK, errno.EBADF,
+}
+
+
+def sha256_archivo(path: str) -> str:
+    """Checksum SHA256 con lecturas de 1 MB sobre un buffer reutilizado."""
+    h = hashlib.sha256()
+    buffer = bytearray(_BUFFER)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def al_dia(src_stat: os.stat_result, dst: str) -> bool:
+    """True si dst ya corresponde a la versión actual del origen."""
+    try:
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        return False
+    if os.path.samestat(src_stat, dst_stat):
+        return True
+    return dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime_ns == src_stat.st_mtime_ns
+
+
+def _hardlink(src, tmp):
+    os.link(src, tmp)
+
+
+def _reflink(src, tmp):
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "reflink no disponible")
+    with open(src, "rb") as fi, open(tmp, "wb") as fo:
+        try:
+            fcntl.ioctl(fo.fileno(), _FICLONE, fi.fileno())
+        except OSError:
+            fo.close()
+            os.remove(tmp)
+            raise
+
+
+def _copia_kernel(src, tmp):
+    """copy_file_range (Linux) y si no, shutil.copyfile (sendfile / fcopyfile)."""
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fi, open(tmp, "wb") as fo:
+                restante = os.fstat(fi.fileno()).st_size
+                while restante > 0:
+                    n = os.copy_file_range(fi.fileno(), fo.fileno(), min(restante, 1 << 30))
+                    if n == 0:
+                        break
+                    restante -= n
+            return
+        except OSError as e:
+            if e.errno not in _NO_SOPORTADO:
+                raise
+    shutil.copyfile(src, tmp)
+
+
+def _copia_con_checksum(src, tmp) -> str:
+    """Copia en una sola lectura calculando el checksum en el mismo pase."""
+    h = hashlib.sha256()
+    buffer = bytearray(_BUFFER)
+    view = memoryview(buffer)
+    with open(src, "rb", buffering=0) as fi, open(tmp, "wb") as fo:
+        while True:
+            n = fi.readinto(buffer)
+            if not n:
+                break
+            h.update(view[:n])
+            fo.write(view[:n])
+    return h.hexdigest()
+
+
+def sincronizar_archivo(src: str, dst: str, src_stat: os.stat_result, calcular_checksum: bool):
+    """
+    Lleva src a dst si hace falta.
+
+    Retorna (metodo, checksum):
+      metodo   → "al_dia" | "link" | "reflink" | "kernel" | "copia"
+      checksum → sha256 del contenido si calcular_checksum, si no None
+    """
+    if al_dia(src_stat, dst):
+        return "al_dia", sha256_archivo(src) if calcular_checksum else None
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f"{dst}.sync.tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+
+    estrategias = []
+    if SYNC_MODE == "link":
+        estrategias.append(("link", _hardlink))
+    if SYNC_MODE in ("link", "reflink"):
+        estrategias.append(("reflink", _reflink))
+
+    metodo = None
+    checksum = None
+    try:
+        for nombre, estrategia in estrategias:
+            try:
+                estrategia(src, tmp)
+                metodo = nombre
+                break
+            except OSError as e:
+                if e.errno not in _NO_SOPORTADO:
+                    raise
+
+        if metodo is None:
+            if calcular_checksum:
+                checksum = _copia_con_checksum(src, tmp)
+                metodo = "copia"
+            else:
+                _copia_kernel(src, tmp)
+                metodo = "kernel"
+
+        if metodo != "link":
+            os.utime(tmp, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+    if calcular_checksum and checksum is None:
+        # link / reflink / kernel no leen los datos: una lectura para el checksum
+        checksum = sha256_archivo(src)
+    return metodo, checksum
@@ -0,0 +1,20 @@
+# src/logs.py
+#
+# Logging con niveles para el ETL. LOG_LEVEL (config) controla el detalle:
+#   - DEBUG: entrada a cada nodo, state recibido, detalle por página / llamada
+#   - INFO:  progreso por licitación y documento (default)
+#   - WARNING / ERROR: solo problemas
+
+import logging
+
+from src.config import LOG_LEVEL
+
+FORMATO = "%(asctime)s %(levelname)-7s %(processName)s %(threadName)s %(name)s: %(message)s"
+
+
+def configurar(nivel: str = LOG_LEVEL) -> None:
+    """Configura el logger raíz (idempotente; llamar desde cada entrypoint / proceso)."""
+    logging.basicConfig(level=nivel.upper(), format=FORMATO)
+    # httpx registra cada request en INFO
+    for nombre in ("httpx", "httpcore", "openai", "urllib3"):
+        logging.getLogger(nombre).setLevel(logging.WARNING)
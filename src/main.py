@@ -1,19 +1,32 @@
 
+import argparse
 import os
-from src.config import REPOSITORY, STORAGE
-from src.graph.etl.graph import build_graph
+from src import config, logs, metrics
 
 
 def main():
 
+    parser = argparse.ArgumentParser(description="ETL de licitaciones")
+    parser.add_argument("--watch", action="store_true", help="quedar escuchando repository (inotify)")
+    args = parser.parse_args()
+    logs.configurar()
+    repository, storage, _ = config.requerido("REPOSITORY", "STORAGE", "API_KEY")
+
+    if args.watch:
+        from src.watch import watch
+        watch()
+        return
 
     # 🧱 State inicial del ETL
     state = {
         "licitation_id": None,
-        "repository_path": REPOSITORY,
-        "storage_path": STORAGE,
+        "repository_path": repository,
+        "storage_path": storage,
     }
 
+    from src.graph.etl.graph import build_graph
+
+    metrics.exportar()
     graph = build_graph()
     graph.invoke(state)
 
@@ -0,0 +1,383 @@
+# src/metrics.py
+#
+# Métricas del ETL en formato de texto Prometheus (sin dependencias externas).
+#
+# Exportación (config):
+#   - METRICS_PORT: endpoint HTTP /metrics en METRICS_HOST (cada worker batch usa METRICS_PORT + n)
+#   - METRICS_FILE: archivo .prom reescrito cada METRICS_FILE_SECONDS y al salir
+#     (para el textfile collector de node_exporter; cada worker batch escribe
+#     su propio archivo con el sufijo -n)
+#
+# Uso:
+#   from src import metrics
+#   metrics.TOKENS.inc(tokens_in, kind="vision_in")
+#   with metrics.STAGE_SECONDS.time(stage="vision"):
+#       ...
+
+import atexit
+import inspect
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.config import METRICS_HOST, METRICS_PORT, METRICS_FILE, METRICS_FILE_SECONDS
+
+BUCKETS_SEGUNDOS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600,
+)
+
+log = logging.getLogger(__name__)
+
+_registro = []
+_registro_lock = threading.Lock()
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres, valores, extra=None) -> str:
+    pares = list(zip(nombres, valores)) + list((extra or {}).items())
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _numero(valor: float) -> str:
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+        with _registro_lock:
+            _registro.append(self)
+
+    def _clave(self, labels: dict) -> tuple:
+        if set(labels) != set(self.etiquetas):
+            raise ValueError(f"{self.nombre}: etiquetas {sorted(labels)} ≠ {list(self.etiquetas)}")
+        return tuple(str(labels[k]) for k in self.etiquetas)
+
+    def _muestras(self, extra):
+        raise NotImplementedError
+
+    def render(self, extra=None) -> list[str]:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        lineas += self._muestras(extra)
+        return lineas
+
+
+class Counter(_Metrica):
+    tipo = "counter"
+
+    def inc(self, cantidad: float = 1, **labels) -> None:
+        if cantidad < 0:
+            raise ValueError("un counter no puede decrecer")
+        clave = self._clave(labels)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def valor(self, **labels) -> float:
+        clave = self._clave(labels)
+        with self._lock:
+            return self._valores.get(clave, 0)
+
+    def _muestras(self, extra):
+        with self._lock:
+            valores = list(self._valores.items())
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, k, extra)} {_numero(v)}" for k, v in valores]
+
+
+class Gauge(_Metrica):
+    """Gauge con valor explícito o calculado al exportar (funcion → {(etiquetas...): valor})."""
+
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = (), funcion=None):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+
+    def set(self, valor: float, **labels) -> None:
+        clave = self._clave(labels)
+        with self._lock:
+            self._valores[clave] = valor
+
+    def inc(self, cantidad: float = 1, **labels) -> None:
+        clave = self._clave(labels)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def dec(self, cantidad: float = 1, **labels) -> None:
+        self.inc(-cantidad, **labels)
+
+    def _muestras(self, extra):
+        if self.funcion is not None:
+            try:
+                valores = list(self.funcion().items())
+            except Exception:
+                return []
+        else:
+            with self._lock:
+                valores = list(self._valores.items())
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, k, extra)} {_numero(v)}" for k, v in valores]
+
+
+class Histogram(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = (), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, valor: float, **labels) -> None:
+        clave = self._clave(labels)
+        with self._lock:
+            serie = self._valores.get(clave)
+            if serie is None:
+                serie = self._valores[clave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def quantile(self, q: float, **labels) -> float | None:
+        """Cuantil aproximado (interpolación lineal en el bucket, como histogram_quantile)."""
+        clave = self._clave(labels)
+        with self._lock:
+            serie = self._valores.get(clave)
+            if serie is None or not serie[2]:
+                return None
+            conteos, total = list(serie[0]), serie[2]
+        objetivo = q * total
+        acumulado, inferior = 0, 0.0
+        for limite, conteo in zip(self.buckets, conteos):
+            if conteo and acumulado + conteo >= objetivo:
+                if math.isinf(limite):
+                    return inferior
+                return inferior + (limite - inferior) * (objetivo - acumulado) / conteo
+            acumulado += conteo
+            inferior = limite
+        return inferior
+
+    @contextmanager
+    def time(self, **labels):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **labels)
+
+    def _muestras(self, extra):
+        with self._lock:
+            valores = [(k, (list(s[0]), s[1], s[2])) for k, s in self._valores.items()]
+        lineas = []
+        nombres_le = self.etiquetas + ("le",)
+        for clave, (conteos, suma, total) in valores:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                lineas.append(
+                    f"{self.nombre}_bucket{_etiquetas(nombres_le, clave + (_numero(limite),), extra)} {acumulado}"
+                )
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave, extra)} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave, extra)} {total}")
+        return lineas
+
+
+def render(extra: dict | None = None) -> str:
+    """Todas las métricas registradas en formato de texto Prometheus."""
+    with _registro_lock:
+        metricas = list(_registro)
+    lineas = []
+    for m in metricas:
+        lineas += m.render(extra)
+    return "\n".join(lineas) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Métricas del ETL
+# ---------------------------------------------------------------------------
+
+NODE_SECONDS = Histogram(
+    "etl_node_duration_seconds", "Duración de cada nodo de los grafos", ("graph", "node"),
+)
+NODE_RUNS = Counter(
+    "etl_node_runs_total", "Ejecuciones de nodos por status resultante", ("graph", "node", "status"),
+)
+STAGE_SECONDS = Histogram(
+    "etl_stage_duration_seconds",
+    "Latencia por operación: render (página), vision (llamada), embedding (request), redis (flush)",
+    ("stage",),
+)
+PAGE_SECONDS = Histogram(
+    "etl_page_duration_seconds", "Latencia de cada página desde el render hasta quedar persistida",
+    buckets=tuple(round(0.01 * 1.25 ** i, 4) for i in range(50)),
+)
+PAGES = Counter(
+    "etl_pages_total", "Páginas procesadas por resultado (ok, error, cache, text, resumed)", ("result",),
+)
+TOKENS = Counter(
+    "etl_tokens_total", "Tokens consumidos (vision_in, vision_out, embedding)", ("kind",),
+)
+VISION_IMAGE_BYTES = Counter(
+    "etl_vision_image_bytes_total", "Bytes de imagen enviados al modelo de visión por detail", ("detail",),
+)
+RETRIES = Counter(
+    "etl_retries_total", "Reintentos por operación", ("operation",),
+)
+ERRORS = Counter(
+    "etl_errors_total", "Errores por operación", ("operation",),
+)
+RATE_LIMIT_WAIT = Counter(
+    "etl_rate_limit_wait_seconds_total", "Segundos esperando cupo RPM/TPM por modelo", ("model",),
+)
+RATE_LIMIT_CONCURRENCY = Gauge(
+    "etl_rate_limit_concurrency", "Llamadas en vuelo permitidas por modelo (AIMD, por proceso)", ("model",),
+)
+DOCUMENTS_IN_PROGRESS = Gauge(
+    "etl_documents_in_progress", "Documentos en procesamiento",
+)
+LICITATIONS_PENDING = Gauge(
+    "etl_licitations_pending", "Licitaciones reclamables en la última revisión del repository",
+)
+
+
+# ---------------------------------------------------------------------------
+# Instrumentación de nodos
+# ---------------------------------------------------------------------------
+
+def instrumentar(grafo: str, nodo: str, funcion):
+    """
+    Envuelve un nodo de LangGraph: registra su duración y el status con el
+    que deja el state (excepción → "exception", se propaga igual).
+    Si la función es una corrutina el nodo también lo es.
+    """
+    log = logging.getLogger(f"src.graph.{grafo}")
+
+    def registrar(inicio, status):
+        NODE_SECONDS.observe(time.perf_counter() - inicio, graph=grafo, node=nodo)
+        NODE_RUNS.inc(graph=grafo, node=nodo, status=status)
+
+    if inspect.iscoroutinefunction(funcion):
+        async def nodo_instrumentado(state: dict) -> dict:
+            log.debug(f"➡️ Entrando al nodo {grafo}: {nodo}")
+            inicio = time.perf_counter()
+            status = "exception"
+            try:
+                resultado = await funcion(state)
+                status = (resultado or {}).get("status") or "ok"
+                return resultado
+            finally:
+                registrar(inicio, status)
+    else:
+        def nodo_instrumentado(state: dict) -> dict:
+            log.debug(f"➡️ Entrando al nodo {grafo}: {nodo}")
+            inicio = time.perf_counter()
+            status = "exception"
+            try:
+                resultado = funcion(state)
+                status = (resultado or {}).get("status") or "ok"
+                return resultado
+            finally:
+                registrar(inicio, status)
+
+    nodo_instrumentado.__name__ = getattr(funcion, "__name__", nodo)
+    return nodo_instrumentado
+
+
+# ---------------------------------------------------------------------------
+# Exportación
+# ---------------------------------------------------------------------------
+
+_servidor = None
+_volcar = None
+_exportar_lock = threading.Lock()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        cuerpo = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def escribir_archivo(path: str, extra: dict | None = None) -> None:
+    """Escritura atómica (el collector nunca lee un archivo a medias)."""
+    carpeta = os.path.dirname(path)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render(extra))
+    os.replace(tmp, path)
+
+
+def exportar(worker: int | None = None) -> None:
+    """
+    Inicia la exportación configurada para este proceso (idempotente).
+    worker: índice del worker batch (desplaza el puerto y el nombre del archivo).
+    """
+    global _servidor, _volcar
+    with _exportar_lock:
+        if METRICS_PORT and _servidor is None:
+            puerto = METRICS_PORT + (worker or 0)
+            try:
+                _servidor = ThreadingHTTPServer((METRICS_HOST, puerto), _Handler)
+            except OSError as e:
+                log.warning(f"⚠️ No se pudo exponer métricas en {METRICS_HOST}:{puerto}: {e}")
+            else:
+                _servidor.daemon_threads = True
+                threading.Thread(target=_servidor.serve_forever, name="metrics-http", daemon=True).start()
+                log.info(f"📈 Métricas en http://{METRICS_HOST}:{puerto}/metrics")
+
+        if METRICS_FILE and _volcar is None:
+            base, ext = os.path.splitext(METRICS_FILE)
+            archivo = f"{base}-{worker}{ext}" if worker is not None else METRICS_FILE
+            extra = {"worker": str(worker)} if worker is not None else None
+
+            def escribir():
+                try:
+                    escribir_archivo(archivo, extra)
+                except OSError as e:
+                    log.warning(f"⚠️ No se pudo escribir {archivo}: {e}")
+
+            def loop():
+                while True:
+                    time.sleep(METRICS_FILE_SECONDS)
+                    escribir()
+
+            _volcar = escribir
+            threading.Thread(target=loop, name="metrics-file", daemon=True).start()
+            atexit.register(escribir)
+
+
+def volcar() -> None:
+    """
+    Escribe METRICS_FILE ahora. Los procesos de multiprocessing terminan sin
+    ejecutar atexit: los workers lo llaman explícitamente al salir.
+    """
+    if _volcar is not None:
+        _volcar()
@@ -0,0 +1,24 @@
+# src/migrate_embeddings.py
+#
+# Convierte los embeddings guardados como JSON en Redis al formato binario float32.
+# Uso: py -m src.migrate_embeddings [--pattern "doc_raw_page:*"] [--dry-run]
+
+import argparse
+
+from src import logs
+from src.graph.document.nodes.extractor_impl.redis_utils import migrar_embeddings_binarios
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra embeddings JSON de Redis a float32 binario")
+    parser.add_argument("--pattern", default="doc_raw_page:*", help="patrón de claves a migrar")
+    parser.add_argument("--batch", type=int, default=500, help="claves por round trip")
+    parser.add_argument("--dry-run", action="store_true", help="solo cuenta, no escribe")
+    args = parser.parse_args()
+    logs.configurar()
+
+    migrar_embeddings_binarios(args.pattern, lote=args.batch, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
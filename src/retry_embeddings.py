@@ -0,0 +1,31 @@
+# src/retry_embeddings.py
+#
+# Procesa la cola de reintentos de embeddings fallidos (tabla embedding_retries).
+# Uso: py -m src.retry_embeddings [--batch 256] [--daemon] [--poll 30]
+
+import argparse
+import time
+
+from src.config import EMBEDDING_RETRY_BATCH, BATCH_POLL_SECONDS
+from src import logs, metrics
+from src.graph.document.nodes.extractor_impl.embedding_retry import drenar_reintentos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reintenta embeddings fallidos y los escribe en Redis")
+    parser.add_argument("--batch", type=int, default=EMBEDDING_RETRY_BATCH, help="items por lote de embeddings")
+    parser.add_argument("--daemon", action="store_true", help="no terminar al vaciar la cola")
+    parser.add_argument("--poll", type=int, default=BATCH_POLL_SECONDS, help="segundos entre revisiones (daemon)")
+    args = parser.parse_args()
+    logs.configurar()
+    metrics.exportar()
+
+    while True:
+        drenar_reintentos(args.batch)
+        if not args.daemon:
+            break
+        time.sleep(args.poll)
+
+
+if __name__ == "__main__":
+    main()
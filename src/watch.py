@@ -0,0 +1,290 @@
+# src/watch.py
+#
+# Modo watch: queda escuchando REPOSITORY con inotify (Linux) y ejecuta el
+# grafo ETL apenas una licitación termina de subirse.
+#
+# Uso:
+#   py -m src.watch
+#   py -m src.main --watch
+#
+# Una licitación se considera completa cuando:
+#   - pasaron WATCH_DEBOUNCE_SECONDS sin eventos en su carpeta
+#   - ningún archivo quedó abierto para escritura (IN_CREATE / IN_MODIFY sin
+#     su IN_CLOSE_WRITE)
+#   - la huella stat (size / mtime de todos sus archivos) no cambió entre dos
+#     revisiones consecutivas
+#
+# El procesamiento usa los mismos claims que src.batch, por lo que el watcher
+# puede convivir con workers batch sin procesar dos veces una licitación.
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from src.config import REPOSITORY, WATCH_DEBOUNCE_SECONDS, WATCH_WORKERS, BATCH_POLL_SECONDS
+from src import config, database, logs, metrics
+from src.batch import fingerprint, reclamar, procesar_reclamada
+
+log = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+MASCARA = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+
+_EVENTO = struct.Struct("iIII")
+
+# Un archivo sin eventos por este tiempo deja de considerarse abierto (p.ej. un
+# hardlink creado con IN_CREATE que nunca emite IN_CLOSE_WRITE)
+ESCRITOR_TIMEOUT = 60
+
+
+class Inotify:
+    """Envoltorio mínimo de inotify vía ctypes (sin dependencias externas)."""
+
+    def __init__(self):
+        nombre = ctypes.util.find_library("c")
+        try:
+            self._libc = ctypes.CDLL(nombre or "libc.so.6", use_errno=True)
+            self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            raise RuntimeError("El modo watch requiere Linux (inotify); usar 'py -m src.batch --daemon'")
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+    def agregar(self, path: str, mascara: int = MASCARA) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mascara)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e), path)
+        return wd
+
+    def leer(self) -> list[tuple[int, int, str]]:
+        """Eventos disponibles: [(wd, mask, nombre), ...] (no bloquea)."""
+        eventos = []
+        while True:
+            try:
+                datos = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return eventos
+            offset = 0
+            while offset < len(datos):
+                wd, mask, _cookie, largo = _EVENTO.unpack_from(datos, offset)
+                offset += _EVENTO.size
+                nombre = datos[offset:offset + largo].rstrip(b"\0")
+                offset += largo
+                eventos.append((wd, mask, os.fsdecode(nombre)))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class RepositoryWatcher:
+    """
+    Escucha REPOSITORY y cada licitación (recursivo) y despacha al ETL las
+    licitaciones completas a un pool de WATCH_WORKERS hilos.
+    """
+
+    def __init__(self, repository=REPOSITORY, debounce=WATCH_DEBOUNCE_SECONDS, workers=WATCH_WORKERS):
+        self.repository = os.path.abspath(repository)
+        self.debounce = debounce
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:watch-{uuid4().hex[:8]}"
+
+        self._inotify = Inotify()
+        self._rutas = {}           # wd → carpeta vigilada
+        self._plazos = {}          # licitación → instante de la próxima revisión
+        self._escribiendo = {}     # licitación → {archivo abierto para escritura: último evento}
+        self._huellas = {}         # licitación → huella de la revisión anterior
+        self._en_curso = set()
+        self._repetir = set()      # cambiaron mientras se procesaban
+        self._lock = threading.Lock()
+        self._despertar_r, self._despertar_w = os.pipe()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="watch")
+
+    # ------------------------------------------------------------------
+    # Registro de carpetas
+    # ------------------------------------------------------------------
+
+    def _vigilar(self, carpeta: str) -> None:
+        for root, dirs, _ in os.walk(carpeta):
+            try:
+                self._rutas[self._inotify.agregar(root)] = root
+            except OSError as e:
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+
+    def _licitacion(self, path: str) -> str | None:
+        rel = os.path.relpath(path, self.repository)
+        if rel == "." or rel.startswith(".."):
+            return None
+        return rel.split(os.sep, 1)[0]
+
+    def _agendar(self, licitation_id: str, demora: float | None = None) -> None:
+        with self._lock:
+            self._plazos[licitation_id] = time.monotonic() + (self.debounce if demora is None else demora)
+
+    # ------------------------------------------------------------------
+    # Eventos
+    # ------------------------------------------------------------------
+
+    def _evento(self, wd: int, mask: int, nombre: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            log.warning("⚠️ [watch] Cola inotify desbordada, revisando todo el repository")
+            self._vigilar(self.repository)
+            for d in os.listdir(self.repository):
+                if os.path.isdir(os.path.join(self.repository, d)):
+                    self._agendar(d)
+            return
+
+        carpeta = self._rutas.get(wd)
+        if carpeta is None:
+            return
+        if mask & IN_IGNORED:
+            del self._rutas[wd]
+            return
+
+        path = os.path.join(carpeta, nombre) if nombre else carpeta
+        licitation_id = self._licitacion(path)
+        if licitation_id is None:
+            return
+
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            # carpeta nueva (licitación o subcarpeta): vigilar y revisar lo que ya tenga
+            self._vigilar(path)
+        elif not mask & IN_ISDIR:
+            abiertos = self._escribiendo.setdefault(licitation_id, {})
+            if mask & (IN_CREATE | IN_MODIFY):
+                abiertos[path] = time.monotonic()
+            elif mask & (IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO):
+                abiertos.pop(path, None)
+
+        self._huellas.pop(licitation_id, None)
+        self._agendar(licitation_id)
+
+    # ------------------------------------------------------------------
+    # Revisión y despacho
+    # ------------------------------------------------------------------
+
+    def _revisar(self, licitation_id: str) -> None:
+        carpeta = os.path.join(self.repository, licitation_id)
+        if not os.path.isdir(carpeta):
+            self._escribiendo.pop(licitation_id, None)
+            self._huellas.pop(licitation_id, None)
+            return
+
+        abiertos = self._escribiendo.get(licitation_id, {})
+        limite = time.monotonic() - ESCRITOR_TIMEOUT
+        for path in [p for p, visto in abiertos.items() if visto < limite]:
+            del abiertos[path]
+        if abiertos:
+            self._agendar(licitation_id)
+            return
+
+        huella = fingerprint(carpeta)
+        if self._huellas.get(licitation_id) != huella:
+            # primera revisión tras los eventos (o siguió cambiando): confirmar
+            self._huellas[licitation_id] = huella
+            self._agendar(licitation_id)
+            return
+
+        with self._lock:
+            if licitation_id in self._en_curso:
+                self._repetir.add(licitation_id)
+                return
+            self._en_curso.add(licitation_id)
+        self._executor.submit(self._ejecutar, licitation_id, huella)
+
+    def _ejecutar(self, licitation_id: str, huella: str) -> None:
+        try:
+            if reclamar(licitation_id, huella, self.worker_id):
+                if procesar_reclamada(licitation_id, self.worker_id) == "deferred":
+                    # Sin eventos nuevos no se volvería a revisar: reintento agendado
+                    self._agendar(licitation_id, demora=BATCH_POLL_SECONDS + 1)
+        except Exception as e:
+            log.error(f"❌ [watch] Error despachando {licitation_id}: {e}")
+        finally:
+            with self._lock:
+                self._en_curso.discard(licitation_id)
+                if licitation_id in self._repetir:
+                    self._repetir.discard(licitation_id)
+                    self._plazos.setdefault(licitation_id, time.monotonic())
+            os.write(self._despertar_w, b"\0")
+
+    # ------------------------------------------------------------------
+    # Loop principal
+    # ------------------------------------------------------------------
+
+    def run(self) -> None:
+        log.info(f"👀 [watch] Escuchando {self.repository} ({self.worker_id})")
+        self._vigilar(self.repository)
+
+        # Licitaciones que ya estaban en el repository al iniciar
+        for d in os.listdir(self.repository):
+            if os.path.isdir(os.path.join(self.repository, d)):
+                self._agendar(d, demora=0)
+
+        try:
+            while True:
+                with self._lock:
+                    proximo = min(self._plazos.values(), default=None)
+                timeout = None if proximo is None else max(0.0, proximo - time.monotonic())
+
+                listos, _, _ = select.select([self._inotify.fd, self._despertar_r], [], [], timeout)
+
+                if self._despertar_r in listos:
+                    os.read(self._despertar_r, 4096)
+                if self._inotify.fd in listos:
+                    for wd, mask, nombre in self._inotify.leer():
+                        self._evento(wd, mask, nombre)
+
+                ahora = time.monotonic()
+                with self._lock:
+                    vencidas = [lic for lic, plazo in self._plazos.items() if plazo <= ahora]
+                    for lic in vencidas:
+                        del self._plazos[lic]
+                for licitation_id in vencidas:
+                    self._revisar(licitation_id)
+        finally:
+            self._executor.shutdown(wait=True)
+            self._inotify.close()
+            os.close(self._despertar_r)
+            os.close(self._despertar_w)
+
+
+def watch() -> None:
+    logs.configurar()
+    config.requerido("REPOSITORY", "STORAGE", "API_KEY")
+    metrics.exportar()
+    database.get_connection()
+    RepositoryWatcher().run()
+
+
+if __name__ == "__main__":
+    watch()
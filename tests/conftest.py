@@ -0,0 +1,16 @@
+# tests/conftest.py
+#
+# Correr desde la raíz del repositorio:
+#   py -m pytest -q
+
+import pytest
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """etl.db temporal: cada hilo abre (y migra) su conexión sobre este archivo."""
+    from src import database
+
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "etl.db"))
+    yield database
+    database.close_connection()
@@ -0,0 +1,103 @@
+# tests/test_claims.py
+
+import pytest
+
+from src import batch
+from src.config import BATCH_POLL_SECONDS, CLAIM_TTL_SECONDS
+
+AHORA = 1_000_000.0
+
+
+@pytest.mark.parametrize("claim, omitir", [
+    (("claimed", "h1", AHORA - 1, None), True),
+    (("claimed", "h1", AHORA - CLAIM_TTL_SECONDS - 1, None), False),
+    (("batch", "h0", AHORA - 10 * CLAIM_TTL_SECONDS, None), True),
+    (("done", "h1", AHORA, AHORA), True),
+    (("done", "h0", AHORA, AHORA), False),
+    (("failed", "h1", AHORA, AHORA), True),
+    (("failed", "h0", AHORA, AHORA), False),
+    (("paused", "h1", AHORA, AHORA), True),
+    (("paused", "h0", AHORA, AHORA), False),
+    (("deferred", "h1", AHORA, AHORA - 1), True),
+    (("deferred", "h1", AHORA, AHORA - BATCH_POLL_SECONDS - 1), False),
+])
+def test_omitir(claim, omitir):
+    assert batch._omitir(claim, "h1", AHORA) is omitir
+
+
+def test_reclamar_un_solo_dueno(db):
+    assert batch.reclamar("LIC-1", "h1", "w1")
+    assert not batch.reclamar("LIC-1", "h1", "w2")
+    assert db.get_claims()["LIC-1"][:2] == ("claimed", "h1")
+
+
+def test_reclamar_claim_expirado(db, monkeypatch):
+    assert batch.reclamar("LIC-1", "h1", "w1")
+    # Sin heartbeat dentro del TTL el claim es de un worker caído
+    monkeypatch.setattr(batch, "CLAIM_TTL_SECONDS", -1)
+    assert batch.reclamar("LIC-1", "h1", "w2")
+
+
+def test_heartbeat_solo_del_dueno(db):
+    assert batch.reclamar("LIC-1", "h1", "w1")
+    assert db.heartbeat_licitation("LIC-1", "w1")
+    assert not db.heartbeat_licitation("LIC-1", "w2")
+
+
+def test_done_se_reclama_solo_si_cambia_el_contenido(db):
+    assert batch.reclamar("LIC-1", "h1", "w1")
+    db.release_licitation("LIC-1", "w1", "done")
+
+    assert not batch.reclamar("LIC-1", "h1", "w2")
+    assert batch.reclamar("LIC-1", "h2", "w2")
+
+
+def test_deferred_se_reclama_despues_del_poll(db, monkeypatch):
+    assert batch.reclamar("LIC-1", "h1", "w1")
+    db.release_licitation("LIC-1", "w1", "deferred", "presupuesto")
+
+    assert not batch.reclamar("LIC-1", "h1", "w2")
+    monkeypatch.setattr(batch, "BATCH_POLL_SECONDS", -1)
+    assert batch.reclamar("LIC-1", "h1", "w2")
+
+
+def test_liberar_de_otro_worker_no_cambia_el_claim(db):
+    assert batch.reclamar("LIC-1", "h1", "w1")
+    db.release_licitation("LIC-1", "w2", "done")
+    assert db.get_claims()["LIC-1"][0] == "claimed"
+
+
+@pytest.mark.parametrize("estado, status", [
+    ({"status": "processed"}, "done"),
+    ({"status": "error", "error": "boom"}, "failed"),
+    ({"status": "paused", "pause_reason": "presupuesto"}, "paused"),
+])
+def test_procesar_reclamada_libera_segun_status(db, monkeypatch, estado, status):
+    monkeypatch.setattr(batch, "procesar_licitacion", lambda licitation_id: dict(estado))
+    assert batch.reclamar("LIC-1", "h1", "w1")
+
+    assert batch.procesar_reclamada("LIC-1", "w1") == status
+    assert db.get_claims()["LIC-1"][0] == status
+
+
+def test_partial_se_difiere_y_se_reintenta(db, monkeypatch):
+    estado = {"status": "partial", "error": "1 archivos quedaron incompletos y siguen pendientes"}
+    monkeypatch.setattr(batch, "procesar_licitacion", lambda licitation_id: dict(estado))
+    assert batch.reclamar("LIC-1", "h1", "w1")
+
+    # Con el mismo contenido un done no se volvería a tomar nunca
+    assert batch.procesar_reclamada("LIC-1", "w1") == "deferred"
+    assert db.get_claims()["LIC-1"][0] == "deferred"
+    assert not batch.reclamar("LIC-1", "h1", "w2")
+
+    monkeypatch.setattr(batch, "BATCH_POLL_SECONDS", -1)
+    assert batch.reclamar("LIC-1", "h1", "w2")
+
+
+@pytest.mark.parametrize("pendientes, status", [(0, "processed"), (2, "partial")])
+def test_process_documents_reporta_archivos_pendientes(monkeypatch, pendientes, status):
+    from src.graph.etl.nodes.process_documents import ProcessDocumentsNode
+
+    monkeypatch.setattr(ProcessDocumentsNode, "_run", staticmethod(lambda state: pendientes))
+    state = ProcessDocumentsNode.execute({"licitation_id": "LIC-1"})
+    assert state["status"] == status
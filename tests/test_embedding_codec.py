@@ -0,0 +1,101 @@
+# tests/test_embedding_codec.py
+
+import json
+
+import numpy as np
+import pytest
+
+from src.graph.document.nodes.extractor_impl import redis_utils
+from src.graph.document.nodes.extractor_impl.redis_utils import (
+    EMBEDDING_FORMAT,
+    codificar_embedding,
+    datos_embedding,
+    decodificar_embedding,
+)
+
+
+def test_binario_ida_y_vuelta():
+    vector = [0.25, -1.5, 3.0, 1e-7]
+    valor = codificar_embedding(vector)
+
+    assert len(valor) == 4 * len(vector)
+    assert valor == np.asarray(vector, dtype="<f4").tobytes()
+    np.testing.assert_array_equal(decodificar_embedding(valor, EMBEDDING_FORMAT), np.float32(vector))
+
+
+def test_binario_acepta_ndarray_y_formato_en_bytes():
+    vector = np.arange(8, dtype=np.float64) / 3
+    resultado = decodificar_embedding(codificar_embedding(vector), EMBEDDING_FORMAT.encode("ascii"))
+
+    assert resultado.dtype == np.float32
+    np.testing.assert_array_equal(resultado, vector.astype(np.float32))
+
+
+def test_binario_sin_copia():
+    resultado = decodificar_embedding(codificar_embedding([1.0, 2.0]), EMBEDDING_FORMAT)
+    assert not resultado.flags.writeable
+
+
+@pytest.mark.parametrize("valor", [json.dumps([0.5, 1.0]), json.dumps([0.5, 1.0]).encode("utf-8")])
+def test_json_legado(valor):
+    resultado = decodificar_embedding(valor)
+
+    assert resultado.dtype == np.float32
+    np.testing.assert_array_equal(resultado, np.float32([0.5, 1.0]))
+
+
+def test_datos_embedding():
+    datos = datos_embedding([1.0, 2.0])
+
+    assert datos["embedding_format"] == EMBEDDING_FORMAT
+    np.testing.assert_array_equal(decodificar_embedding(datos["embedding"], datos["embedding_format"]), [1.0, 2.0])
+
+
+@pytest.fixture
+def redis_fake(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # scripts Lua en fakeredis
+    conexion = fakeredis.FakeRedis()
+    monkeypatch.setattr(redis_utils, "get_redis_connection", lambda decode_responses=True: conexion)
+    return conexion
+
+
+def test_migrar_embeddings_binarios(redis_fake):
+    for n in range(3):
+        redis_fake.hset(f"doc_raw_page:d:p{n}", mapping={"embedding": json.dumps([n, 0.5]), "texto": "t"})
+    redis_fake.hset("doc_raw_page:d:p9", mapping=datos_embedding([9.0, 9.0]))
+    redis_fake.hset("doc_raw_page:d:mal", mapping={"embedding": "no es json"})
+
+    assert redis_utils.migrar_embeddings_binarios(lote=2, dry_run=True)["migradas"] == 3
+    assert redis_fake.hget("doc_raw_page:d:p0", "embedding_format") is None
+
+    resumen = redis_utils.migrar_embeddings_binarios(lote=2)
+    assert resumen == {"revisadas": 5, "migradas": 3, "omitidas": 1, "errores": 1}
+    for n in range(3):
+        clave = f"doc_raw_page:d:p{n}"
+        np.testing.assert_array_equal(redis_utils.leer_embedding(clave, redis_fake), [n, 0.5])
+        assert redis_fake.hget(clave, "texto") == b"t"
+
+    # Idempotente
+    assert redis_utils.migrar_embeddings_binarios()["migradas"] == 0
+
+
+def test_migrar_no_pisa_escrituras_concurrentes(redis_fake, monkeypatch):
+    redis_fake.hset("doc_raw_page:d:p1", mapping={"embedding": json.dumps([1.0, 1.0])})
+    redis_fake.hset("doc_raw_page:d:p2", mapping={"embedding": json.dumps([2.0, 2.0])})
+
+    decodificar = redis_utils.decodificar_embedding
+
+    def con_carrera(valor, formato=None):
+        # Entre la lectura y el script: p1 se reescribe en binario y p2 con otro JSON
+        redis_fake.hset("doc_raw_page:d:p1", mapping=datos_embedding([7.0, 7.0]))
+        redis_fake.hset("doc_raw_page:d:p2", "embedding", json.dumps([8.0, 8.0]))
+        return decodificar(valor, formato)
+
+    monkeypatch.setattr(redis_utils, "decodificar_embedding", con_carrera)
+    resumen = redis_utils.migrar_embeddings_binarios()
+
+    assert resumen["migradas"] == 0 and resumen["omitidas"] == 2
+    monkeypatch.setattr(redis_utils, "decodificar_embedding", decodificar)
+    np.testing.assert_array_equal(redis_utils.leer_embedding("doc_raw_page:d:p1", redis_fake), [7.0, 7.0])
+    np.testing.assert_array_equal(redis_utils.leer_embedding("doc_raw_page:d:p2", redis_fake), [8.0, 8.0])
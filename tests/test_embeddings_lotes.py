@@ -0,0 +1,106 @@
+# tests/test_embeddings_lotes.py
+
+import httpx
+import openai
+import pytest
+
+from src.graph.document.nodes.extractor_impl import embeddings
+from src.graph.document.nodes.extractor_impl.embeddings import _procesar_lotes
+
+
+@pytest.fixture(autouse=True)
+def tokens_por_palabra(monkeypatch):
+    # Sin descargar el encoding de tiktoken
+    monkeypatch.setattr(embeddings, "contar_tokens_embedding", lambda texto: len(texto.split()))
+
+
+def _error_400():
+    respuesta = httpx.Response(400, request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+    return openai.BadRequestError("input inválido", response=respuesta, body=None)
+
+
+def _conducir(proceso, llamar):
+    """Driver como generar_embeddings_lote: retorna (resultado, textos de cada request)."""
+    requests = []
+    try:
+        lote = next(proceso)
+        while True:
+            textos, _ = lote
+            requests.append(list(textos))
+            try:
+                resultado = llamar(textos)
+            except Exception as e:
+                resultado = e
+            lote = proceso.send(resultado)
+    except StopIteration as fin:
+        return fin.value, requests
+
+
+def _api(malos=(), sin_vector=()):
+    """{indice: vector}; 400 si el request incluye un texto de `malos`."""
+    def llamar(textos):
+        if any(t in malos for t in textos):
+            raise _error_400()
+        return {i: [float(len(t)), 1.0] for i, t in enumerate(textos) if t not in sin_vector}
+    return llamar
+
+
+def test_un_solo_request_por_lote():
+    textos = {n: f"texto {n}" for n in range(6)}
+    (vectores, fallidos), requests = _conducir(_procesar_lotes(textos, max_items=100), _api())
+
+    assert len(requests) == 1
+    assert set(vectores) == set(textos) and not fallidos
+
+
+def test_400_se_biseca_hasta_aislar_el_item():
+    textos = {n: f"texto {n}" for n in range(8)}
+    textos[5] = "malo"
+    (vectores, fallidos), requests = _conducir(_procesar_lotes(textos, max_items=100), _api(malos={"malo"}))
+
+    assert set(fallidos) == {5} and "input inválido" in fallidos[5]
+    assert set(vectores) == set(textos) - {5}
+    assert vectores[0] == [float(len("texto 0")), 1.0]
+    # 8 → [0-3] ok, [4-7] 400 → [4-5] 400 → [4] ok, [5] 400 → [6-7] ok
+    assert [len(r) for r in requests] == [8, 4, 4, 2, 1, 1, 2]
+
+
+def test_400_con_varios_items_malos():
+    textos = {n: ("malo" if n in (0, 7) else f"texto {n}") for n in range(8)}
+    (vectores, fallidos), _ = _conducir(_procesar_lotes(textos, max_items=100), _api(malos={"malo"}))
+
+    assert set(fallidos) == {0, 7}
+    assert set(vectores) == set(range(1, 7))
+
+
+def test_otros_errores_no_se_bisecan():
+    textos = {n: f"texto {n}" for n in range(4)}
+
+    def caida(textos):
+        raise RuntimeError("timeout")
+
+    (vectores, fallidos), requests = _conducir(_procesar_lotes(textos, max_items=100), caida)
+
+    assert len(requests) == 1
+    assert not vectores and set(fallidos) == set(textos)
+
+
+def test_vector_faltante_se_reencola_hasta_max_retries():
+    textos = {"a": "texto a", "b": "texto b"}
+    (vectores, fallidos), requests = _conducir(
+        _procesar_lotes(textos, max_items=100, max_retries=3), _api(sin_vector={"texto b"})
+    )
+
+    assert set(vectores) == {"a"}
+    assert fallidos == {"b": "respuesta sin vector"}
+    assert requests == [["texto a", "texto b"], ["texto b"], ["texto b"]]
+
+
+def test_vacios_y_precalculados_no_se_envian():
+    textos = {"a": "texto a", "vacio": "   "}
+    (vectores, fallidos), requests = _conducir(
+        _procesar_lotes(textos, max_items=100, previos={"p": [1.0]}), _api()
+    )
+
+    assert requests == [["texto a"]]
+    assert set(vectores) == {"a", "p"} and not fallidos
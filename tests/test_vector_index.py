@@ -0,0 +1,81 @@
+# tests/test_vector_index.py
+
+import os
+
+import numpy as np
+import pytest
+
+from src.graph.document.nodes.extractor_impl.vector_index import IndiceLicitacion, ShardWriter
+
+DIM = 16
+
+
+def _documento(storage, document_id, vectores):
+    """Carpeta de resultados (la licitación la reconoce como documento) + su shard."""
+    carpeta = storage / document_id
+    carpeta.mkdir(exist_ok=True)
+    (carpeta / f"{document_id}_resultado_paginas.json").write_text("[]", encoding="utf-8")
+    claves = [f"doc_raw_page:{document_id}:p1_e{n + 1}" for n in range(len(vectores))]
+    with ShardWriter(str(storage), document_id) as writer:
+        writer.agregar(claves, vectores)
+    return claves
+
+
+def _fuerza_bruta(consultas, claves, matriz, k):
+    m = matriz / np.linalg.norm(matriz, axis=1, keepdims=True)
+    q = consultas / np.linalg.norm(consultas, axis=1, keepdims=True)
+    scores = q @ m.T
+    orden = np.argsort(-scores, axis=1)[:, :k]
+    return [[(claves[j], scores[i, j]) for j in fila] for i, fila in enumerate(orden)]
+
+
+@pytest.mark.parametrize("k", [1, 5, 50])
+def test_top_k_igual_a_fuerza_bruta(tmp_path, k):
+    rng = np.random.default_rng(0)
+    claves, filas = [], []
+    # Un shard más chico que k para cubrir el recorte por shard
+    for document_id, n in (("doc_a", 40), ("doc_b", 3), ("doc_c", 25)):
+        vectores = rng.standard_normal((n, DIM))
+        claves += _documento(tmp_path, document_id, vectores)
+        filas.append(vectores)
+    consultas = rng.standard_normal((4, DIM))
+
+    indice = IndiceLicitacion.cargar(str(tmp_path), reconstruir_faltantes=False)
+    assert len(indice) == len(claves)
+
+    esperado = _fuerza_bruta(consultas, claves, np.vstack(filas), k)
+    for resultado, base in zip(indice.buscar(consultas, k=k), esperado):
+        assert len(resultado) == min(k, len(claves))
+        assert [c for c, _ in resultado] == [c for c, _ in base]
+        np.testing.assert_allclose([s for _, s in resultado], [s for _, s in base], rtol=1e-5, atol=1e-6)
+
+
+def test_consulta_unica_y_vector_identico(tmp_path):
+    rng = np.random.default_rng(1)
+    vectores = rng.standard_normal((10, DIM))
+    claves = _documento(tmp_path, "doc_a", vectores)
+
+    indice = IndiceLicitacion.cargar(str(tmp_path), reconstruir_faltantes=False)
+    (resultado,) = indice.buscar(vectores[3] * 7, k=1)
+
+    assert resultado[0][0] == claves[3]
+    assert resultado[0][1] == pytest.approx(1.0, abs=1e-6)
+
+
+def test_shard_reescrito_combina_o_reemplaza(tmp_path):
+    rng = np.random.default_rng(2)
+    claves = _documento(tmp_path, "doc_a", rng.standard_normal((4, DIM)))
+
+    # Reescritura parcial: se conservan las filas que no se reescribieron
+    with ShardWriter(str(tmp_path), "doc_a") as writer:
+        writer.agregar(claves[:1], rng.standard_normal((1, DIM)))
+    indice = IndiceLicitacion.cargar(str(tmp_path), reconstruir_faltantes=False)
+    assert sorted(indice.shards[0].claves) == sorted(claves)
+
+    # Reescritura completa: solo quedan las claves nuevas
+    with ShardWriter(str(tmp_path), "doc_a") as writer:
+        writer.reemplazar = True
+        writer.agregar(claves[:2], rng.standard_normal((2, DIM)))
+    indice = IndiceLicitacion.cargar(str(tmp_path), reconstruir_faltantes=False)
+    assert sorted(indice.shards[0].claves) == sorted(claves[:2])
+    assert not [f for f in os.listdir(tmp_path / ".vector_index") if f.endswith(".tmp")]